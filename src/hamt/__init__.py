@@ -2,6 +2,10 @@
 
 """ NodeID library for python XLattice packages. """
 
+import bisect
+import itertools
+import logging
+import random
 import sys
 # from binascii import b2a_hex
 
@@ -13,9 +17,9 @@ __version_date__ = '2018-03-23'
 __all__ = ['__version__', '__version_date__',
            'MAX_W',
            'countem',       # EXPERIMENT
-           'uhash',
-           'HamtError', 'HamtNotFound',
-           'Leaf', 'Table', 'Root']
+           'uhash', 'stored_key', 'ordered_hasher', 'log_misses',
+           'HamtError', 'HamtNotFound', 'HamtIntegrityError',
+           'Leaf', 'Table', 'DenseTable', 'Root']
 
 # CONSTANTS
 
@@ -25,8 +29,92 @@ MAX_W = 6
 
 
 def uhash(val):
-    """ Return the hash of a string of bytes as an unsigned int64. """
-    return hash(val) % ((sys.maxsize + 1) * 2)
+    """
+    Return the hash of a string of bytes as an unsigned int64.
+
+    val may also be a buffer such as a bytearray or memoryview, which
+    hashes as the bytes it holds.  A read-only memoryview, such as a
+    slice of a bytes object, is hashed in place; Python will only hash
+    a writable buffer's contents once they are copied into bytes.
+    """
+    try:
+        return hash(val) % ((sys.maxsize + 1) * 2)
+    except (TypeError, ValueError):
+        if not isinstance(val, (bytearray, memoryview)):
+            raise
+        return hash(bytes(val)) % ((sys.maxsize + 1) * 2)
+
+
+def stored_key(key):
+    """
+    Return key as it is to be stored in a Leaf: a bytearray or
+    memoryview, whose contents may change, is copied into bytes, and
+    anything else is returned as it is.  Lookups take such buffers
+    without copying them.
+    """
+    if isinstance(key, (bytearray, memoryview)):
+        return bytes(key)
+    return key
+
+
+def ordered_hasher(texp, wexp):
+    """
+    Return an order-preserving hash function for a Root with the
+    given texp and wexp.
+
+    The function maps a key to a hashcode whose successive slot indices
+    (texp bits for the Root, then wexp bits per Table) are the leading
+    bits of the key, most significant first.  Slots are therefore in
+    key order at every level and the trie sorts its keys.  Only the
+    first texp + max_table_depth * wexp bits of the key, which is
+    padded with zero bytes if shorter than 8 bytes, are used: keys
+    which agree in those bits cannot both be stored, and inserting the
+    second raises HamtError naming both (see Root.check_split()).
+    """
+    max_depth = (64 - texp) // wexp
+    code_bits = texp + max_depth * wexp
+    drop = 64 - code_bits
+    wmask = (1 << wexp) - 1
+    top_shift = code_bits - texp
+    # (shift to bring a digit down, shift to move it into place)
+    moves = [(top_shift - (i + 1) * wexp, texp + i * wexp)
+             for i in range(max_depth)]
+
+    def ordered_hash(key):
+        """ Return the order-preserving hashcode for key. """
+        head = key[:8]
+        code = int.from_bytes(head, 'big') << 8 * (8 - len(head)) >> drop
+        hcode = code >> top_shift
+        for down, into in moves:
+            hcode |= ((code >> down) & wmask) << into
+        return hcode
+
+    return ordered_hash
+
+
+def log_misses(logger=None, level=logging.DEBUG):
+    """
+    Return a Root.miss_hook which logs each key not found to logger,
+    by default the 'hamt' logger, at the given level.
+    """
+    if logger is None:
+        logger = logging.getLogger('hamt')
+
+    def log_miss(key):
+        """ Log a key which was not found. """
+        logger.log(level, "find_leaf: no entry for key %r", key)
+
+    return log_miss
+
+
+def _count_under(node):
+    """ Return the number of Leafs in or under node, which may be None. """
+    if node is None:
+        return 0
+    if isinstance(node, Table):
+        # pylint: disable=protected-access
+        return node._count
+    return 1
 
 # EXPERIMENT --------------------------------------------------------
 
@@ -59,8 +147,30 @@ class HamtNotFound(HamtError):
     """ Raised where there is no match for a key. """
 
 
+class HamtIntegrityError(HamtError):
+    """
+    Raised where the trie is found to be inconsistent.  problem says
+    what is wrong and path is the sequence of slot indices, from the
+    Root down, leading to the node at fault.
+    """
+
+    def __init__(self, problem, path=()):
+        super(HamtIntegrityError, self).__init__(
+            "%s at %s" % (problem, '/'.join(str(ndx) for ndx in path)))
+        self.problem = problem
+        self.path = tuple(path)
+
+
 class Leaf(object):
-    """The Leaf in a HAMT data structure. """
+    """
+    The Leaf in a HAMT data structure.
+
+    There is one Leaf per entry, so Leafs (and Tables) have no instance
+    dictionary; that alone is most of a Leaf's memory.  A bytearray or
+    memoryview key is stored as a copy in bytes; see stored_key().
+    """
+
+    __slots__ = ('_key', '_value')
 
     def __init__(self, key, value):
 
@@ -68,7 +178,7 @@ class Leaf(object):
             raise HamtError('key cannot be None')
         if value is None:
             raise HamtError("leaf value cannot be none")
-        self._key = key
+        self._key = stored_key(key)
         self._value = value
 
     @property
@@ -81,6 +191,18 @@ class Leaf(object):
         """ Return the value pointed at by a HAMT Leaf. """
         return self._value
 
+    @value.setter
+    def value(self, value):
+        """ Replace the value in place. """
+        if value is None:
+            raise HamtError("leaf value cannot be none")
+        self._value = value
+
+    def accept(self, visitor, depth=0):
+        """ Present this Leaf to a hamt.visitor.Visitor. """
+        visitor.visit_leaf(self, depth)
+        return visitor
+
 
 class Table(object):
     """
@@ -92,8 +214,20 @@ class Table(object):
     Unlike the Go version, a hamt_py Table can only be created if its
     first leaf is specified.  That is, __init__() below is equivalent to
     Go hamt_go's NewTableWithLeaf.
+
+    insert_leaf() and delete_leaf() return the node which should occupy
+    the parent's slot from then on.  This is normally the Table itself,
+    but a Table may be replaced by a DenseTable as it fills and vice
+    versa; see Root.dense_threshold.
+
+    Each Table keeps a count of the Leafs under it, so that leaf_count
+    costs nothing and Root.sample() can descend at random in
+    proportion to the entries under each slot.
     """
 
+    __slots__ = ('_nbr', '_depth', '_wexp', '_texp', '_root', '_mask',
+                 '_slots', '_bitmap', '_count')
+
     last_nbr = -1
 
     @staticmethod
@@ -109,6 +243,31 @@ class Table(object):
             raise HamtError("Max table depth exceeded.")
         return wexp, texp           # Seen as unsigned ints
 
+    @staticmethod
+    def from_slots(depth, root, bitmap, slots):
+        """
+        Return a Table at depth under root with the bitmap given and
+        slots, a compact list with one node per bit set in the bitmap.
+        This is a DenseTable if the Root's full_width_depth or
+        dense_threshold calls for one.
+        """
+        # pylint: disable=protected-access
+        table = Table.__new__(Table)
+        Table.last_nbr += 1
+        table._nbr = Table.last_nbr
+        table._depth = depth
+        table._wexp, table._texp = Table.check_table_param(depth, root)
+        table._root = root
+        table._mask = (1 << table._wexp) - 1
+        table._bitmap = bitmap
+        table._slots = slots
+        table._count = sum(_count_under(node) for node in slots)
+        threshold = root.dense_threshold
+        if depth <= root.full_width_depth or \
+                (threshold and len(slots) >= threshold):
+            return table.to_dense()
+        return table
+
     def __init__(self, depth, root, first_leaf):
 
         Table.last_nbr += 1
@@ -125,11 +284,12 @@ class Table(object):
 
         # insert the first leaf
         shift_count = texp + (depth - 1) * wexp
-        hcode = uhash(first_leaf.key) >> shift_count
+        hcode = root.hasher(first_leaf.key) >> shift_count
         ndx = hcode & self._mask    # index into bit map
         flag = 1 << ndx             # seen as uint64
         self._slots = [first_leaf]
         self._bitmap = flag         # set bit for this entry
+        self._count = 1
 
         # DEBUG
 #       print("new Table[%d]:  depth  = %d" % (self._nbr, depth))
@@ -149,6 +309,11 @@ class Table(object):
         """ Return the Root of the table. """
         return self._root
 
+    @property
+    def depth(self):
+        """ Return the depth of the Table; a Table in a Root slot is at 1. """
+        return self._depth
+
     @property
     def wexp(self):
         """
@@ -188,20 +353,8 @@ class Table(object):
 
     @property
     def leaf_count(self):
-        """ Return a count of the leaf nodes in this Table, recursing. """
-        count = 0
-        # for node in self._slots:
-        for node in self._slots:
-            if node:
-                if isinstance(node, Leaf):
-                    count += 1
-                elif isinstance(node, Table):
-                    count += node.leaf_count
-        # DEBUG
-#       print("Table[%d].leaf_count, depth %d, returning %d" % (
-#           self._nbr, self._depth, count))
-        # END
-        return count
+        """ Return a count of the leaf nodes in and under this Table. """
+        return self._count
 
     @property
     def table_count(self):
@@ -214,6 +367,76 @@ class Table(object):
                 count += node.table_count
         return count
 
+    def _copy_as(self, cls, slots):
+        """
+        Return a Table of class cls with the same position and bitmap
+        as this one but the slots given.
+        """
+        # pylint: disable=protected-access
+        table = cls.__new__(cls)
+        table._nbr = self._nbr
+        table._depth = self._depth
+        table._wexp = self._wexp
+        table._texp = self._texp
+        table._root = self._root
+        table._mask = self._mask
+        table._bitmap = self._bitmap
+        table._slots = slots
+        table._count = self._count
+        return table
+
+    def to_dense(self):
+        """ Return a DenseTable holding the same entries as this Table. """
+        slots = [None] * (1 << self._wexp)
+        bitmap = self._bitmap
+        for node in self._slots:
+            low_bit = bitmap & -bitmap
+            slots[low_bit.bit_length() - 1] = node
+            bitmap ^= low_bit
+        return self._copy_as(DenseTable, slots)
+
+    def accept(self, visitor):
+        """
+        Walk a hamt.visitor.Visitor over this Table and everything under
+        it; return the visitor.
+        """
+        from hamt.visitor import walk
+        return walk(self, visitor, self._depth)
+
+    def indexed_slots(self):
+        """ Yield (ndx, node) for each slot in use, in order of ndx. """
+        bitmap = self._bitmap
+        for node in self._slots:
+            low_bit = bitmap & -bitmap
+            yield low_bit.bit_length() - 1, node
+            bitmap ^= low_bit
+
+    def child_at(self, ndx):
+        """ Return the node in slot ndx, or None if it is empty. """
+        flag = 1 << ndx
+        if not self._bitmap & flag:
+            return None
+        return self._slots[popcount64(self._bitmap & (flag - 1))]
+
+    def replace_child(self, ndx, node):
+        """
+        Put node, which may be None, in slot ndx, which must be in use;
+        return the node which should now occupy the parent's slot, as
+        for delete_leaf().
+        """
+        flag = 1 << ndx
+        if not self._bitmap & flag:
+            raise HamtNotFound
+        offset = popcount64(self._bitmap & (flag - 1))
+        self._count -= _count_under(self._slots[offset])
+        if node is None:
+            self.remove_from_slots(offset)
+            self._bitmap &= ~flag
+        else:
+            self._slots[offset] = node
+            self._count += _count_under(node)
+        return self._collapse()
+
     def remove_from_slots(self, offset):
         """ Remove an entry from this Table. """
 
@@ -224,15 +447,7 @@ class Table(object):
             msg = 'Internal error: delete offset %d but table size %d' % (
                 offset, cursize)
             raise HamtError(msg)
-        elif cursize == 1:
-            # LEAVES EMPTY TABLE, WHICH WILL HARM PERFORMANCE
-            self._slots = []
-        elif offset == 0:
-            self._slots = self._slots[1:]
-        elif offset == cursize - 1:
-            self._slots = self._slots[:-1]
-        else:
-            self._slots = self._slots[:offset] + self._slots[offset + 1:]
+        del self._slots[offset]
 
     def delete_leaf(self, hcode, key):
         """
@@ -243,6 +458,9 @@ class Table(object):
         hashcod can be used as the index of the leaf in the table.
 
         The caller guarantees that depth <= root.max_table_depth.
+        Return the node which should now occupy the parent's slot: None
+        if the Table is left empty and its last Leaf if that is all it
+        holds, so that no empty or single-Leaf Tables are left behind.
         """
 
         if not self._slots:
@@ -270,7 +488,27 @@ class Table(object):
             # node is a table, so recurse
             if self._depth + 1 > self.root.max_table_depth:
                 raise HamtNotFound
-            node.delete_leaf(hcode >> self._wexp, key)
+            node = node.delete_leaf(hcode >> self._wexp, key)
+            if node is None:
+                self.remove_from_slots(slot_nbr)
+                self._bitmap &= ~flag
+            else:
+                self._slots[slot_nbr] = node
+        self._count -= 1
+        return self._collapse()
+
+    def _collapse(self):
+        """
+        Return what should replace this Table after a deletion: None if
+        it is empty, its Leaf if that is all it holds, or itself.
+        """
+        if not self._bitmap:
+            return None
+        if self._bitmap & (self._bitmap - 1) == 0:
+            node = self._slots[0]
+            if isinstance(node, Leaf):
+                return node
+        return self
 
     def find_leaf(self, hcode, depth, key):
         """
@@ -284,55 +522,18 @@ class Table(object):
         The caller guarantees that depth <= Root.max_table.depth.
         """
 
-        value = None
-        slot_nbr = 0
-        ndx = hcode & self._mask    # uint
-        flag = 1 << ndx             # uint64
-
-        # DEBUG
-#       print("Table[%d].find_leaf:" % self._nbr)
-#       print("    depth    %d" % depth)
-#       print("    hcode    0x%x" % hcode)
-#       print("    mask     0x%x" % self._mask)
-#       print("    ndx      %d (0x%s)" % (ndx, ndx))
-#       print("    flag     0x%x " % flag)
-#       print("    bitmap   0x%x " % self._bitmap)
-        # END
-
-        if self._bitmap & flag:
-            # the node is present
-            mask = flag - 1         # also uint64
-            if mask:
-                slot_nbr = popcount64(self._bitmap & mask)
-            # DEBUG
-#           print("    slot_nbr 0x%x " % slot_nbr)
-            # END
-            node = self._slots[slot_nbr]
-            if isinstance(node, Leaf):
-                if key == node.key:
-                    value = node.value
-                # DEBUG
-                else:
-                    print("Table[%d].find_leaf: key mismatch, returning None" %
-                          self._nbr)
-                # END
-            else:
-                # node is a Table, so recurse
-                if depth <= self.root.max_table_depth:
-                    hcode >>= self._wexp
-                    value = node.find_leaf(hcode, depth + 1, key)
-                    # DEBUG
-#                   if value is None:
-#                       print("Table[%d].find_leaf: recursing returned None" %
-#                             self._nbr)
-                    # END
-                # otherwise we will return None
-        # DEBUG
-#       else:
-#           print("Table[%d].find_leaf:  depth %d: bitmap is empty" % (
-#               self._nbr, depth))
-        # END
-        return value    # we already have the key
+        flag = 1 << (hcode & self._mask)
+        if not self._bitmap & flag:
+            return None
+        node = self._slots[popcount64(self._bitmap & (flag - 1))]
+        if isinstance(node, Leaf):
+            if key == node.key:
+                return node.value
+            return None
+        # node is a Table, so recurse
+        if depth <= self.root.max_table_depth:
+            return node.find_leaf(hcode >> self._wexp, depth + 1, key)
+        return None
 
     def insert_leaf(self, hcode, leaf):
         """
@@ -340,6 +541,7 @@ class Table(object):
         determine ndx, the index of the bit to be set`.
 
         The caller guarantees that depth <= self.root.max_table_depth.
+        Return the node which should now occupy the parent's slot.
         """
 
         slot_nbr = 0
@@ -362,48 +564,206 @@ class Table(object):
 #       print("                   slice_size = %d" % slice_size)
 #       # END
 
-        if slice_size == 0:
-            self._slots = [leaf]
-            self._bitmap |= flag
-        else:
-            # is there already something in this slot?
-            if self._bitmap & flag:
-                entry = self._slots[slot_nbr]
-                if entry is None:
-                    print("INTERNAL ERROR: flag=%d, slot=%d is empty" % (
-                        flag, slot_nbr))
-
-                if isinstance(entry, Leaf):
-                    if entry.key == leaf.key:
-                        # keys match so replace value
-                        entry.value = leaf.value        # MUST BE DEEPCOPY ?
-                    else:
-                        deeper = Table(self._depth + 1, self._root, entry)
-                        deeper.insert_leaf(hcode >> self.wexp, leaf)
+        # is there already something in this slot?
+        if slice_size and self._bitmap & flag:
+            entry = self._slots[slot_nbr]
+            if entry is None:
+                raise HamtIntegrityError(
+                    "bitmap 0x%x has bit %d set but its slot is empty" % (
+                        self._bitmap, ndx), (slot_nbr,))
+
+            if isinstance(entry, Leaf):
+                if entry.key == leaf.key:
+                    # keys match so replace value
+                    entry.value = leaf.value        # MUST BE DEEPCOPY ?
+                else:
+                    self._root.check_split(entry.key, leaf.key)
+                    deeper = self._root.make_table(self._depth + 1, entry)
+                    deeper = deeper.insert_leaf(hcode >> self.wexp, leaf)
 
-                        # the new table replaces the existing leaf
-                        self._slots[slot_nbr] = deeper
+                    # the new table replaces the existing leaf
+                    self._slots[slot_nbr] = deeper
+                    self._count += 1
 
-                else:
-                    # it's a Table, so let's recurse
-                    entry.insert_leaf(hcode >> self._wexp, leaf)
-
-            # nothing in the slot
-            elif slot_nbr == 0:
-                self._slots = [leaf] + self._slots
-                self._bitmap |= flag
-            elif slot_nbr == slice_size:
-                self._slots += [leaf]
-                self._bitmap |= flag
             else:
-                self._slots = self._slots[:slot_nbr] + \
-                    [leaf] + self._slots[slot_nbr:]
-                self._bitmap |= flag
+                # it's a Table, so let's recurse
+                before = entry._count
+                entry = entry.insert_leaf(hcode >> self._wexp, leaf)
+                self._slots[slot_nbr] = entry
+                self._count += entry._count - before
+
+        else:
+            # nothing in the slot: grow the list in place
+            self._slots.insert(slot_nbr, leaf)
+            self._bitmap |= flag
+            self._count += 1
+            threshold = self._root.dense_threshold
+            if threshold and slice_size + 1 >= threshold:
+                return self.to_dense()
 
         # DEBUG
 #       print("Table[%d].insert_leaf: POST INSERTION depth %d, bitmap 0x%x" % (
 #           self._nbr, self._depth, self._bitmap))
         # END
+        return self
+
+
+class DenseTable(Table):
+    """
+    Table preallocated to its full width of (1 << wexp) slots.
+
+    Slots are indexed directly by the wexp bits of the hashcode, so
+    finding an entry costs no popcount and inserting or deleting one
+    moves nothing; empty slots hold None.  The bitmap is kept up to
+    date so that it still describes which slots are in use.  This
+    costs memory for every empty slot, so it is meant for the busy
+    tables near the Root and for Tables which are nearly full; see
+    Root.full_width_depth and Root.dense_threshold.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, depth, root, first_leaf):
+        super(DenseTable, self).__init__(depth, root, first_leaf)
+        slots = [None] * (1 << self._wexp)
+        slots[self._bitmap.bit_length() - 1] = first_leaf
+        self._slots = slots
+
+    @property
+    def slots(self):
+        """ Return the list of all slots, with None where one is empty. """
+        return self._slots
+
+    def to_compact(self):
+        """ Return a compact Table holding the same entries as this one. """
+        return self._copy_as(
+            Table, [node for node in self._slots if node is not None])
+
+    def indexed_slots(self):
+        """ Yield (ndx, node) for each slot in use, in order of ndx. """
+        for ndx, node in enumerate(self._slots):
+            if node is not None:
+                yield ndx, node
+
+    def child_at(self, ndx):
+        """ Return the node in slot ndx, or None if it is empty. """
+        return self._slots[ndx]
+
+    def replace_child(self, ndx, node):
+        """ As for Table.replace_child(). """
+        if self._slots[ndx] is None:
+            raise HamtNotFound
+        self._count += _count_under(node) - _count_under(self._slots[ndx])
+        self._slots[ndx] = node
+        if node is None:
+            self._bitmap &= ~(1 << ndx)
+        return self._collapse()
+
+    def remove_from_slots(self, offset):
+        """ Empty the slot at offset, which is an index and not a rank. """
+
+        if self._slots[offset] is None:
+            raise HamtError("attempt to delete from empty slot %d" % offset)
+        self._slots[offset] = None
+
+    def delete_leaf(self, hcode, key):
+        """
+        Remove a Leaf from the Table.
+
+        As for Table.delete_leaf(), but the w bits of hcode index the
+        slot directly.  If the Table has emptied to below half of
+        Root.dense_threshold, a compact Table replaces it.
+        """
+
+        ndx = hcode & self._mask
+        node = self._slots[ndx]
+        if node is None:
+            raise HamtNotFound
+        if isinstance(node, Leaf):
+            if node.key != key:
+                raise HamtNotFound
+            node = None
+        else:
+            # node is a table, so recurse
+            if self._depth + 1 > self.root.max_table_depth:
+                raise HamtNotFound
+            node = node.delete_leaf(hcode >> self._wexp, key)
+        self._slots[ndx] = node
+        self._count -= 1
+        if node is None:
+            self._bitmap &= ~(1 << ndx)
+            root = self._root
+            if root.dense_threshold and \
+                    self._depth > root.full_width_depth and \
+                    popcount64(self._bitmap) < root.dense_threshold // 2:
+                return self.to_compact()._collapse()
+        return self._collapse()
+
+    def _collapse(self):
+        """ As for Table._collapse(). """
+        if not self._bitmap:
+            return None
+        if self._bitmap & (self._bitmap - 1) == 0:
+            node = self._slots[self._bitmap.bit_length() - 1]
+            if isinstance(node, Leaf):
+                return node
+        return self
+
+    def find_leaf(self, hcode, depth, key):
+        """
+        Find a Leaf in the Table using the hashcode hcode and matching
+        depth and key; return the value of the Leaf or None.
+
+        As for Table.find_leaf(), but the w bits of hcode index the
+        slot directly.
+        """
+
+        node = self._slots[hcode & self._mask]
+        if node is None:
+            return None
+        if isinstance(node, Leaf):
+            if key == node.key:
+                return node.value
+            return None
+        # node is a Table, so recurse
+        if depth <= self.root.max_table_depth:
+            return node.find_leaf(hcode >> self._wexp, depth + 1, key)
+        return None
+
+    def insert_leaf(self, hcode, leaf):
+        """
+        Insert a Leaf into or below this Table.
+
+        As for Table.insert_leaf(), but the w bits of hcode index the
+        slot directly.  A DenseTable is never replaced on insertion, so
+        this always returns self.
+        """
+
+        ndx = hcode & self._mask
+        entry = self._slots[ndx]
+        if entry is None:
+            self._slots[ndx] = leaf
+            self._bitmap |= 1 << ndx
+            self._count += 1
+        elif isinstance(entry, Leaf):
+            if entry.key == leaf.key:
+                # keys match so replace value
+                entry.value = leaf.value
+            else:
+                self._root.check_split(entry.key, leaf.key)
+                deeper = self._root.make_table(self._depth + 1, entry)
+                deeper = deeper.insert_leaf(hcode >> self._wexp, leaf)
+
+                # the new table replaces the existing leaf
+                self._slots[ndx] = deeper
+                self._count += 1
+        else:
+            # it's a Table, so let's recurse
+            before = entry._count
+            entry = entry.insert_leaf(hcode >> self._wexp, leaf)
+            self._slots[ndx] = entry
+            self._count += entry._count - before
+        return self
 
 
 class Root(object):
@@ -413,9 +773,26 @@ class Root(object):
     The Root has a fixed number of slots, each of which may be empty
     or may point to a Table or a Leaf.  There are (1 << texp) slots
     in the Root table.
+
+    Tables at depths up to full_width_depth are DenseTables, which
+    trade memory for cheaper access; by default there are none.  If
+    dense_threshold is non-zero, any other Table becomes a DenseTable
+    once that many of its slots are in use, and reverts to a compact
+    Table when fewer than half that many are; the gap between the two
+    keeps a Table near the threshold from flipping back and forth.
+
+    If ordered is set, keys are not hashed but encoded so that the trie
+    keeps them in order (see ordered_hasher()), which allows items() to
+    iterate over a key prefix or range in order, skipping subtrees
+    which cannot match.
+
+    miss_hook, if not None, is called with the key whenever find_leaf()
+    finds nothing, for logging or counting misses; see log_misses().
+    It may be set or cleared at any time.
     """
 
-    def __init__(self, wexp, texp):
+    def __init__(self, wexp, texp, full_width_depth=0, dense_threshold=0,
+                 ordered=False, miss_hook=None):
         if wexp < 2:
             raise HamtError("w cannot be less than 2, is %d" % wexp)
         if texp < 2:
@@ -424,6 +801,14 @@ class Root(object):
             raise HamtError("max table size (%d) exceeded" % MAX_W)
         if texp > 64:
             raise HamtError("max root table size (64) exceeded")
+        if full_width_depth < 0:
+            raise HamtError(
+                "full_width_depth cannot be negative, is %d" %
+                full_width_depth)
+        if dense_threshold and not 2 <= dense_threshold <= 1 << wexp:
+            raise HamtError(
+                "dense_threshold must be 0 or in 2..%d, is %d" % (
+                    1 << wexp, dense_threshold))
         flag = 1 << texp    # number of slots available
 
         self._wexp = wexp
@@ -432,6 +817,16 @@ class Root(object):
         self._slot_count = flag
         self._mask = flag - 1
         self._slots = [None] * flag
+        self._full_width_depth = full_width_depth
+        self._dense_threshold = dense_threshold
+        self._ordered = ordered
+        # number of leading key bits which determine a key's position
+        self._code_bits = texp + self._max_table_depth * wexp
+        if ordered:
+            self._hasher = ordered_hasher(texp, wexp)
+        else:
+            self._hasher = uhash
+        self.miss_hook = miss_hook
         # DEBUG
         # print("Root: wexp            %d" % wexp)
         # print("      texp            %d" % texp)
@@ -461,6 +856,29 @@ class Root(object):
         """
         return self._max_table_depth
 
+    @property
+    def full_width_depth(self):
+        """ Return the depth down to which Tables are DenseTables. """
+        return self._full_width_depth
+
+    @property
+    def dense_threshold(self):
+        """
+        Return the number of slots in use at which a Table becomes a
+        DenseTable, or 0 if Tables never change representation.
+        """
+        return self._dense_threshold
+
+    @property
+    def ordered(self):
+        """ Return whether keys are kept in order rather than hashed. """
+        return self._ordered
+
+    @property
+    def hasher(self):
+        """ Return the function mapping a key to its hashcode. """
+        return self._hasher
+
     @property
     def slot_count(self):
         """ Return the number of slots in the root table.  """
@@ -508,10 +926,33 @@ class Root(object):
                 count += node.table_count
         return count
 
+    def make_table(self, depth, first_leaf):
+        """
+        Return a new Table for this Root at the given depth, holding
+        first_leaf.  It is a DenseTable if depth <= full_width_depth.
+        """
+        if depth <= self._full_width_depth:
+            return DenseTable(depth, self, first_leaf)
+        return Table(depth, self, first_leaf)
+
+    def check_split(self, key, other):
+        """
+        Raise HamtError if the distinct keys key and other cannot both
+        be stored because their hashcodes are equal.  This is checked
+        only in an ordered Root, where it happens to any two keys
+        agreeing in every bit of the key which the hashcode keeps.
+        """
+        if self._ordered and self._hasher(key) == self._hasher(other):
+            raise HamtError(
+                "keys %r and %r agree in the first %d bits, all that an "
+                "ordered Root uses, so cannot both be stored" % (
+                    key, other,
+                    self._texp + self._max_table_depth * self._wexp))
+
     def delete_leaf(self, key):
         """ Delete a Leaf node in or below this Root, given its key. """
 
-        hcode = uhash(key)
+        hcode = self._hasher(key)
         ndx = hcode & self._mask
         node = self._slots[ndx]
 #       # DEBUG
@@ -542,7 +983,7 @@ class Root(object):
             # END
             if self._max_table_depth < 1:
                 raise HamtNotFound
-            node.delete_leaf(hcode >> self._texp, key)
+            self._slots[ndx] = node.delete_leaf(hcode >> self._texp, key)
 
     def find_leaf(self, key):
         """
@@ -550,34 +991,30 @@ class Root(object):
 
         Given a properly shifted hashcode and the key for an entry,
         return the value associated with the entry or None if there
-        is no such entry.
+        is no such entry.  A miss does no I/O; it is reported to the
+        miss_hook, if there is one.  key may be a buffer, such as a
+        memoryview slice of a larger message, and is not copied unless
+        it is writable; see uhash().
         """
 
         value = None
-        hcode = uhash(key)
-        ndx = hcode & self._mask
-        node = self._slots[ndx]
-
-        # DEBUG
-#       print("Root.find_leaf:")
-#       print("    hcode    0x%x" % hcode)
-#       print("    ndx      0x%x (%d)" % (ndx, ndx))
-
-        # END
+        hcode = self._hasher(key)
+        node = self._slots[hcode & self._mask]
         if node:
             if isinstance(node, Leaf):
                 if node.key == key:
                     value = node.value
-            else:
-                if self._max_table_depth > 0:
-                    # it's a Table, so recurse
-                    value = node.find_leaf(hcode >> self.texp, 1, key)
+            elif self._max_table_depth > 0:
+                # it's a Table, so recurse
+                value = node.find_leaf(hcode >> self._texp, 1, key)
+        if value is None and self.miss_hook is not None:
+            self.miss_hook(key)
         return value
 
     def insert_leaf(self, leaf):
         """ Insert a Leaf into or below the Root. """
 
-        hcode = uhash(leaf.key)
+        hcode = self._hasher(leaf.key)
         ndx = hcode & self._mask        # slot number
         # DEBUG
         # print("insert_leaf: hcode 0x%x" % hcode)
@@ -607,6 +1044,7 @@ class Root(object):
                         raise HamtError(
                             "max table depth (%d) exceeded" %
                             self._max_table_depth)
+                    self.check_split(cur_key, new_key)
                     new_hcode = hcode >> self._texp    # hcode for new entry
 
                     # DEBUG
@@ -614,9 +1052,8 @@ class Root(object):
 #                       "Root.insert_leaf: keys differ, replacing with Table")
                     # END
 
-                    new_table = Table(1, self, node)
-                    self._slots[ndx] = new_table
-                    new_table.insert_leaf(uhash(leaf.key) >> self._texp, leaf)
+                    new_table = self.make_table(1, node)
+                    self._slots[ndx] = new_table.insert_leaf(new_hcode, leaf)
 
             else:
                 # DEBUG
@@ -628,9 +1065,534 @@ class Root(object):
                         "max table depth (%d) exceeded" %
                         self._max_table_depth)
                 new_hcode = hcode >> self._texp    # hcode for new entry
-                node.insert_leaf(new_hcode, leaf)
+                self._slots[ndx] = node.insert_leaf(new_hcode, leaf)
+
+    def _get_leaf(self, key):
+        """
+        Return the Leaf holding key, or None, descending without
+        recursion; the hashcode is computed once.
+        """
+        hcode = self._hasher(key)
+        node = self._slots[hcode & self._mask]
+        hcode >>= self._texp
+        while isinstance(node, Table):
+            ndx = hcode & node.mask
+            hcode >>= node.wexp
+            if isinstance(node, DenseTable):
+                node = node.slots[ndx]
+            else:
+                flag = 1 << ndx
+                bitmap = node.bitmap
+                if not bitmap & flag:
+                    return None
+                node = node.slots[popcount64(bitmap & (flag - 1))]
+        if node is not None and node.key == key:
+            return node
+        return None
+
+    def update(self, key, func, default=None):
+        """
+        Replace the value v of key with func(v) and return it.
+
+        The Leaf is found in a single descent and its value changed in
+        place, with nothing allocated.  If key is absent, func(default)
+        is inserted instead, unless default is None, in which case
+        HamtNotFound is raised.
+        """
+        leaf = self._get_leaf(key)
+        if leaf is None:
+            if default is None:
+                raise HamtNotFound
+            value = func(default)
+            self.insert_leaf(Leaf(key, value))
+        else:
+            value = func(leaf.value)
+            leaf.value = value
+        return value
+
+    def increment(self, key, delta=1):
+        """
+        Add delta to key's value, counting from zero if key is absent,
+        and return the new value.
+        """
+        return self.update(key, lambda value: value + delta, 0)
+
+    def _params(self):
+        """ Return the keyword arguments this Root was built with. """
+        return {'full_width_depth': self._full_width_depth,
+                'dense_threshold': self._dense_threshold,
+                'ordered': self._ordered, 'miss_hook': self.miss_hook}
+
+    def _like(self):
+        """
+        Return a new, empty Root with this Root's parameters, for
+        extract() and split().
+        """
+        return Root(self._wexp, self._texp, **self._params())
+
+    def _has_prefix(self, key, path):
+        """ Return whether key's hashcode begins with the slot path. """
+        hcode = self._hasher(key)
+        if hcode & self._mask != path[0]:
+            return False
+        hcode >>= self._texp
+        wmask = (1 << self._wexp) - 1
+        for ndx in path[1:]:
+            if hcode & wmask != ndx:
+                return False
+            hcode >>= self._wexp
+        return True
+
+    def detach(self, path):
+        """
+        Remove everything under a hash prefix and return it.
+
+        path is a sequence of slot indices, the Root slot first and
+        then one per Table below it, as in HamtIntegrityError.path.
+        The node found there, a Table or a Leaf, is unhooked from its
+        parent and returned with everything under it, so this costs a
+        descent and no more however many entries go.  Tables left
+        empty or holding a single Leaf are collapsed as by
+        delete_leaf().  Raise HamtNotFound if no entry has the prefix.
+
+        Detached Tables still refer to this Root for its parameters.
+        """
+        path = tuple(path)
+        if not path or not 0 <= path[0] < self._slot_count or \
+                len(path) > self._max_table_depth + 1 or \
+                any(not 0 <= ndx < 1 << self._wexp for ndx in path[1:]):
+            raise HamtError("%r is not a slot path" % (path,))
+        trail = []      # (Table, index of the slot followed)
+        node = self._slots[path[0]]
+        for ndx in path[1:]:
+            if not isinstance(node, Table):
+                break
+            trail.append((node, ndx))
+            node = node.child_at(ndx)
+        if node is None:
+            raise HamtNotFound
+        if isinstance(node, Leaf) and not self._has_prefix(node.key, path):
+            raise HamtNotFound
+
+        # replace_child() sees a child Table only after it has shrunk,
+        # so the Tables above the lowest one are told what left here
+        # pylint: disable=protected-access
+        removed = _count_under(node)
+        for table, _ in trail[:-1]:
+            table._count -= removed
+        replacement = None
+        for table, ndx in reversed(trail):
+            replacement = table.replace_child(ndx, replacement)
+        self._slots[path[0]] = replacement
+        return node
+
+    def drop(self, path):
+        """ Delete everything under a hash prefix; see detach(). """
+        self.detach(path)
+
+    def extract(self, path):
+        """
+        Move everything under a hash prefix into a new Root with the
+        same parameters and return that; see detach().  Only the Tables
+        above the prefix are new.
+        """
+        node = self.detach(path)
+        root = self._like()
+        for depth in range(len(path) - 1, 0, -1):
+            if isinstance(node, Table):
+                node = Table.from_slots(depth, root, 1 << path[depth], [node])
+        root.slots[path[0]] = node
+        return root
+
+    def split(self, nparts):
+        """
+        Move the entries into nparts new Roots with the same
+        parameters, each taking a contiguous range of Root slots, so
+        that part i holds the keys whose Root slot index, the texp
+        lowest bits of the hashcode, has i as its top bits; see
+        split_index().  nparts must be a power of two no greater than
+        slot_count.  Nothing is rehashed or reinserted.  This Root is
+        left empty.
+        """
+        if nparts < 1 or nparts & (nparts - 1) or nparts > self._slot_count:
+            raise HamtError(
+                "cannot split %d slots %d ways" % (self._slot_count, nparts))
+        per_part = self._slot_count // nparts
+        parts = []
+        for first in range(0, self._slot_count, per_part):
+            part = self._like()
+            part.slots[first:first + per_part] = \
+                self._slots[first:first + per_part]
+            parts.append(part)
+        self._slots[:] = [None] * self._slot_count
+        return parts
+
+    def split_index(self, key, nparts):
+        """ Return which of split(nparts)'s Roots holds key. """
+        return (self._hasher(key) & self._mask) // (self._slot_count // nparts)
+
+    def _key_code(self, key, pad=b'\0'):
+        """
+        Return the leading code_bits bits of key, padded with the pad
+        byte if the key is shorter than 8 bytes.
+        """
+        return int.from_bytes(key[:8].ljust(8, pad), 'big') >> (
+            64 - self._code_bits)
+
+    def _ordered_leaves(self, lo_code, hi_code):
+        """
+        Yield in key order each Leaf which might have a key code in
+        lo_code..hi_code, skipping any subtree which cannot.
+        """
+        code_bits = self._code_bits
+        lo_ndx = lo_code >> (code_bits - self._texp)
+        hi_ndx = hi_code >> (code_bits - self._texp)
+        # a stack of (node, code of the path to it, bits in that code),
+        # pushed in reverse so that nodes pop in key order
+        stack = [(self._slots[ndx], ndx, self._texp)
+                 for ndx in range(hi_ndx, lo_ndx - 1, -1)
+                 if self._slots[ndx] is not None]
+        while stack:
+            node, path, nbits = stack.pop()
+            if isinstance(node, Leaf):
+                yield node
+                continue
+            wexp = node.wexp
+            span = code_bits - nbits - wexp
+            children = []
+            for ndx, child in node.indexed_slots():
+                child_path = (path << wexp) | ndx
+                first = child_path << span
+                if first > hi_code:
+                    break
+                if first | ((1 << span) - 1) >= lo_code:
+                    children.append((child, child_path, nbits + wexp))
+            children.reverse()
+            stack.extend(children)
+
+    @staticmethod
+    def leaves_under(node):
+        """
+        Yield each Leaf in or under node, a Leaf, a Table or None, in
+        no particular order.
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Leaf):
+                yield node
+            elif node is not None:
+                stack.extend(node.slots)
+
+    def items(self, prefix=None, start=None, stop=None):
+        """
+        Yield a (key, value) pair for each Leaf under the Root.
+
+        Pairs are in no particular order unless the Root is ordered, in
+        which case they are in key order and may be restricted to keys
+        beginning with prefix and/or to keys k with start <= k < stop.
+        Only subtrees which may hold such keys are visited.
+        """
+        if prefix is None and start is None and stop is None and \
+                not self._ordered:
+            stack = [self._slots]
+            while stack:
+                for node in stack.pop():
+                    if node is None:
+                        continue
+                    if isinstance(node, Leaf):
+                        yield node.key, node.value
+                    else:
+                        stack.append(node.slots)
+            return
+        if not self._ordered:
+            raise HamtError(
+                "prefix and range iteration need an ordered Root")
+
+        lo_code, hi_code = 0, (1 << self._code_bits) - 1
+        if prefix is not None:
+            lo_code = max(lo_code, self._key_code(prefix))
+            hi_code = min(hi_code, self._key_code(prefix[:8], b'\xff'))
+        if start is not None:
+            lo_code = max(lo_code, self._key_code(start))
+        if stop is not None:
+            hi_code = min(hi_code, self._key_code(stop))
+        if lo_code > hi_code:
+            return
+
+        for leaf in self._ordered_leaves(lo_code, hi_code):
+            key = leaf.key
+            if prefix is not None and not key.startswith(prefix):
+                continue
+            if start is not None and key < start:
+                continue
+            if stop is not None and key >= stop:
+                return      # keys arrive in order, so no more will match
+            yield key, leaf.value
+
+    def sample(self, k, rng=None):
+        """
+        Return a list of k distinct keys chosen at random, every key
+        being equally likely, using rng (by default the random module).
+
+        Each key is found by a single descent from the Root, which
+        picks each child with probability proportional to the Leafs
+        under it, so the cost is proportional to k times the depth of
+        the trie and not to the number of entries, so long as k is at
+        most half of them.  Raise HamtError if k exceeds leaf_count.
+        """
+        if rng is None:
+            rng = random
+        counts = [_count_under(node) for node in self._slots]
+        total = sum(counts)
+        if not 0 <= k <= total:
+            raise HamtError("cannot sample %d keys from %d" % (k, total))
+        if 2 * k > total:
+            return rng.sample([key for key, _ in self.items()], k)
+        bounds = list(itertools.accumulate(counts))
+        chosen = {}
+        while len(chosen) < k:
+            pick = rng.randrange(total)
+            ndx = bisect.bisect_right(bounds, pick)
+            pick -= bounds[ndx] - counts[ndx]
+            chosen[self._nth_leaf(pick, self._slots[ndx]).key] = None
+        return list(chosen)
+
+    def _nth_leaf(self, pick, node=None):
+        """
+        Return the Leaf pick places, counting from 0 in slot order, into
+        node or, by default, into the whole Root, descending by the
+        counts of the Leafs under each Table; pick must be less than
+        the number of Leafs there.
+        """
+        if node is None:
+            for node in self._slots:
+                count = _count_under(node)
+                if pick < count:
+                    break
+                pick -= count
+        while isinstance(node, Table):
+            for child in node.slots:
+                count = _count_under(child)
+                if pick < count:
+                    node = child
+                    break
+                pick -= count
+        return node
+
+    def estimate_len(self, samples=64, rng=None):
+        """
+        Return an estimate of leaf_count from the counts under samples
+        Root slots chosen at random using rng, by default the random
+        module; the cost depends on samples alone.  The estimate is
+        exact if samples is at least slot_count.
+        """
+        if rng is None:
+            rng = random
+        if samples >= self._slot_count:
+            return sum(_count_under(node) for node in self._slots)
+        if samples < 1:
+            raise HamtError("samples must be positive, is %d" % samples)
+        found = sum(_count_under(self._slots[ndx])
+                    for ndx in rng.sample(range(self._slot_count), samples))
+        return int(round(found * self._slot_count / samples))
+
+    def _build_node(self, entries, depth):
+        """
+        Build in one pass the node holding entries, a list of
+        (hcode, Leaf) where hcode has been shifted for a node at depth,
+        and return it.
+        """
+        if len(entries) == 1:
+            return entries[0][1]
+        if depth > self._max_table_depth:
+            self.check_split(entries[0][1].key, entries[1][1].key)
+            raise HamtError(
+                "max table depth (%d) exceeded" % self._max_table_depth)
+        wexp = self._wexp
+        mask = (1 << wexp) - 1
+        groups = {}
+        for hcode, leaf in entries:
+            ndx = hcode & mask
+            group = groups.get(ndx)
+            if group is None:
+                group = groups[ndx] = []
+            group.append((hcode >> wexp, leaf))
+        bitmap = 0
+        slots = []
+        for ndx in sorted(groups):
+            bitmap |= 1 << ndx
+            slots.append(self._build_node(groups[ndx], depth + 1))
+        return Table.from_slots(depth, self, bitmap, slots)
+
+    def _make_leaf(self, key, value):
+        """ Return a new Leaf for apply_batch() to insert. """
+        # pylint: disable=no-self-use
+        return Leaf(key, value)
+
+    def apply_batch(self, changes):
+        """
+        Apply many changes at once.
+
+        changes is an iterable of (key, value) pairs, applied in order:
+        a pair inserts or replaces key's value, unless value is None, in
+        which case key is deleted if present.  Changes are grouped by
+        Root slot, and the subtree under each slot affected is rebuilt
+        in a single pass from its surviving Leafs and the new ones,
+        rather than by inserting and deleting one Leaf at a time.  This
+        is much the faster way to load a large number of entries.
+        """
+        hasher = self._hasher
+        mask = self._mask
+        by_slot = {}
+        for key, value in changes:
+            key = stored_key(key)
+            ndx = hasher(key) & mask
+            changed = by_slot.get(ndx)
+            if changed is None:
+                changed = by_slot[ndx] = {}
+            changed[key] = value
+
+        texp = self._texp
+        for ndx, changed in by_slot.items():
+            by_key = {}
+            stack = [self._slots[ndx]]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, Leaf):
+                    by_key[node.key] = node
+                elif node is not None:
+                    stack.extend(node.slots)
+            for key, value in changed.items():
+                if value is None:
+                    by_key.pop(key, None)
+                else:
+                    by_key[key] = self._make_leaf(key, value)
+            if by_key:
+                self._slots[ndx] = self._build_node(
+                    [(hasher(key) >> texp, leaf)
+                     for key, leaf in by_key.items()], 1)
+            else:
+                self._slots[ndx] = None
+
+    def freeze(self):
+        """
+        Return a read-only hamt.frozen.FrozenRoot holding this Root's
+        entries packed into a single buffer, for sharing with forked
+        worker processes.
+        """
+        from hamt.frozen import freeze
+        return freeze(self)
 
-    # THIS CODE IS NEVER USED
-#   def accept(self, func):
-#       """ EXPERIMENT """
-#       func(self)
+    def verify(self, fraction=1.0, rng=None):
+        """
+        Check the trie's invariants in one pass without recursing, and
+        return the number of nodes checked; raise HamtIntegrityError
+        on the first violation found.
+
+        Every Table's bitmap must match its slots, its depth must be
+        its real depth and within max_table_depth, it must not be empty
+        or hold a single Leaf, it must be a DenseTable if its depth
+        calls for one, and its count of the Leafs under it must be
+        right.  Every Leaf must sit where its hashcode puts it.
+
+        If fraction is less than 1, only the subtrees under that
+        fraction of the Root's slots, chosen at random using rng (by
+        default the random module), are checked; this bounds the cost
+        of checking a live trie.
+        """
+        if rng is None:
+            rng = random
+        hasher = self._hasher
+        texp, wexp = self._texp, self._wexp
+        wmask = (1 << wexp) - 1
+        checked = 0
+        tables = []     # (Table, path) in the order checked
+        # a stack of (node, slot indices leading to it, its depth)
+        stack = [(node, (ndx,), 1) for ndx, node in enumerate(self._slots)
+                 if node is not None and
+                 (fraction >= 1.0 or rng.random() < fraction)]
+        while stack:
+            node, path, depth = stack.pop()
+            checked += 1
+            if isinstance(node, Leaf):
+                hcode = hasher(node.key)
+                digits = [hcode & self._mask]
+                hcode >>= texp
+                for _ in path[1:]:
+                    digits.append(hcode & wmask)
+                    hcode >>= wexp
+                if tuple(digits) != path:
+                    raise HamtIntegrityError(
+                        "Leaf is not where its hashcode puts it", path)
+                continue
+            if not isinstance(node, Table):
+                raise HamtIntegrityError(
+                    "slot holds a %s" % type(node).__name__, path)
+            if depth > self._max_table_depth:
+                raise HamtIntegrityError(
+                    "Table is deeper than max table depth %d" %
+                    self._max_table_depth, path)
+            if node.depth != depth:
+                raise HamtIntegrityError(
+                    "Table at depth %d thinks it is at %d" % (
+                        depth, node.depth), path)
+            slots = node.slots
+            if isinstance(node, DenseTable):
+                if len(slots) != 1 << wexp:
+                    raise HamtIntegrityError(
+                        "DenseTable has %d slots" % len(slots), path)
+                in_use = 0
+                for ndx, child in enumerate(slots):
+                    if child is not None:
+                        in_use |= 1 << ndx
+                if in_use != node.bitmap:
+                    raise HamtIntegrityError(
+                        "bitmap 0x%x but slots 0x%x in use" % (
+                            node.bitmap, in_use), path)
+            else:
+                if depth <= self._full_width_depth:
+                    raise HamtIntegrityError(
+                        "compact Table within full_width_depth", path)
+                if popcount64(node.bitmap) != len(slots):
+                    raise HamtIntegrityError(
+                        "bitmap 0x%x but %d slots" % (
+                            node.bitmap, len(slots)), path)
+                if None in slots:
+                    raise HamtIntegrityError("empty slot in use", path)
+            children = list(node.indexed_slots())
+            if not children:
+                raise HamtIntegrityError("Table is empty", path)
+            if len(children) == 1 and isinstance(children[0][1], Leaf):
+                raise HamtIntegrityError("Table holds a single Leaf", path)
+            for ndx, child in children:
+                stack.append((child, path + (ndx,), depth + 1))
+            tables.append((node, path))
+
+        # check each Table's count of its Leafs, children before parents
+        # pylint: disable=protected-access
+        counts = {}
+        for table, path in reversed(tables):
+            count = 0
+            for child in table.slots:
+                if isinstance(child, Table):
+                    count += counts[id(child)]
+                elif child is not None:
+                    count += 1
+            if count != table._count:
+                raise HamtIntegrityError(
+                    "Table counts %d Leafs but holds %d" % (
+                        table._count, count), path)
+            counts[id(table)] = count
+        return checked
+
+    def accept(self, visitor, processes=0):
+        """
+        Walk a hamt.visitor.Visitor over the Root and everything under
+        it; return the visitor.  If processes is non-zero, subtrees are
+        walked in that many worker processes (None for one per CPU).
+        """
+        from hamt.visitor import walk, walk_parallel
+        if processes == 0:
+            return walk(self, visitor)
+        return walk_parallel(self, visitor, processes)
@@ -0,0 +1,859 @@
+# hamt/bench.py
+
+"""
+Benchmark suite for hamt_py.
+
+Run as
+
+    python -m hamt.bench [--suite NAME] [--output FILE] [--compare FILE]
+
+Each suite returns a list of result records.  A record identifies what
+was measured (suite, implementation, operation and parameters) and
+carries a single number, where smaller is always better.  Results can
+be written as JSON and a later run compared against them, so that a
+performance change between releases shows up as a regression report.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from hamt import __version__, Leaf, Root, Table
+from hamt.bloom import FilteredRoot
+from hamt.frozen import freeze
+from hamt.lookup_cache import CachedRoot
+from hamt.parallel import build_parallel
+
+__all__ = ['SUITES', 'DEFAULT_GRID', 'FULL_GRID',
+           'make_keys', 'walk_leaves',
+           'suite_grid', 'suite_write', 'suite_zipf', 'suite_miss',
+           'suite_filter', 'suite_parallel', 'suite_prefork', 'run_suites',
+           'record_id', 'compare_results',
+           'main']
+
+# CONSTANTS
+
+DEFAULT_GRID = {
+    'wexp': [2, 4, 6],
+    'texp': [4, 8],
+    'key_size': [8, 32],
+    'size': [1000, 10000],
+}
+
+FULL_GRID = {
+    'wexp': [2, 3, 4, 5, 6],
+    'texp': [4, 8, 12, 16],
+    'key_size': [8, 20, 32],
+    'size': [1000, 10000, 100000],
+}
+
+# mapping baselines, keyed by the name used in result records
+BASELINES = OrderedDict([
+    ('dict', dict),
+    ('OrderedDict', OrderedDict),
+])
+
+VALUE_SIZE = 16
+
+# FUNCTIONS
+
+
+def make_keys(count, key_size, seed=0, exclude=None):
+    """
+    Return a list of count distinct random keys, each key_size bytes long.
+
+    If exclude is not None, no key in it will be returned.  The same
+    seed always yields the same keys.
+    """
+    rng = random.Random(seed)
+    seen = set(exclude) if exclude else set()
+    keys = []
+    nbits = 8 * key_size
+    while len(keys) < count:
+        key = rng.getrandbits(nbits).to_bytes(key_size, 'little')
+        if key not in seen:
+            seen.add(key)
+            keys.append(key)
+    return keys
+
+
+def walk_leaves(root):
+    """ Yield every Leaf under a Root without recursing. """
+    stack = [root.slots]
+    while stack:
+        for node in stack.pop():
+            if node is None:
+                continue
+            if isinstance(node, Leaf):
+                yield node
+            elif isinstance(node, Table):
+                stack.append(node.slots)
+
+
+def _time_it(func, repeat):
+    """ Return the best of repeat timings of func(), in seconds. """
+    best = None
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def _bytes_allocated(func):
+    """
+    Return (result, nbytes) where nbytes is the memory still held by
+    whatever func() allocated.
+    """
+    gc.collect()
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    return result, after - before
+
+
+def _record(suite, impl, oper, params, value, unit):
+    """ Build a result record. """
+    return {'suite': suite, 'impl': impl, 'op': oper,
+            'params': dict(params), 'value': value, 'unit': unit}
+
+
+def _build_root(wexp, texp, keys, values, **kwargs):
+    """ Return a new Root holding the keys and values. """
+    root = Root(wexp, texp, **kwargs)
+    for key, value in zip(keys, values):
+        root.insert_leaf(Leaf(key, value))
+    return root
+
+
+def _bulk_load(root, pairs):
+    """ Load (key, value) pairs into a Root in one batch. """
+    root.apply_batch(pairs)
+    return root
+
+
+def _time_deletes(make_victim, keys, repeat):
+    """
+    Return the best of repeat timings of deleting every key from a
+    container made afresh by make_victim(), which is not timed.
+    """
+    best = None
+    for _ in range(repeat):
+        victim = make_victim()
+
+        def drain(victim=victim):
+            """ Delete every key. """
+            for key in keys:
+                del victim[key]
+        elapsed = _time_it(drain, 1)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+class _RootDeleter(object):
+    """ Adapt a Root so that del victim[key] deletes a Leaf. """
+
+    def __init__(self, root):
+        self.root = root
+
+    def __delitem__(self, key):
+        self.root.delete_leaf(key)
+
+
+def _bench_hamt(wexp, texp, keys, values, misses, repeat):
+    """ Return {op: seconds} and bytes held for one Root configuration. """
+    timings = OrderedDict()
+    timings['insert'] = _time_it(
+        lambda: _build_root(wexp, texp, keys, values), repeat)
+
+    root, nbytes = _bytes_allocated(
+        lambda: _build_root(wexp, texp, keys, values))
+    find = root.find_leaf
+
+    def lookup(candidates):
+        """ Look up every key in candidates. """
+        for key in candidates:
+            find(key)
+
+    timings['lookup_hit'] = _time_it(lambda: lookup(keys), repeat)
+    timings['lookup_miss'] = _time_it(lambda: lookup(misses), repeat)
+    timings['iterate'] = _time_it(
+        lambda: sum(1 for _ in root.items()), repeat)
+
+    pairs = list(zip(keys, values))
+    timings['bulk_load'] = _time_it(
+        lambda: _bulk_load(Root(wexp, texp), pairs), repeat)
+
+    timings['delete'] = _time_deletes(
+        lambda: _RootDeleter(_build_root(wexp, texp, keys, values)),
+        keys, repeat)
+    return timings, nbytes
+
+
+def _bench_mapping(factory, keys, values, misses, repeat):
+    """ Return {op: seconds} and bytes held for a mapping baseline. """
+    timings = OrderedDict()
+    pairs = list(zip(keys, values))
+
+    def build():
+        """ Insert the pairs one at a time. """
+        mapping = factory()
+        for key, value in pairs:
+            mapping[key] = value
+        return mapping
+
+    timings['insert'] = _time_it(build, repeat)
+    mapping, nbytes = _bytes_allocated(build)
+    find = mapping.get
+
+    def lookup(candidates):
+        """ Look up every key in candidates. """
+        for key in candidates:
+            find(key)
+
+    timings['lookup_hit'] = _time_it(lambda: lookup(keys), repeat)
+    timings['lookup_miss'] = _time_it(lambda: lookup(misses), repeat)
+    timings['iterate'] = _time_it(
+        lambda: sum(1 for _ in mapping.items()), repeat)
+    timings['bulk_load'] = _time_it(lambda: factory(pairs), repeat)
+
+    timings['delete'] = _time_deletes(lambda: factory(pairs), keys, repeat)
+    return timings, nbytes
+
+
+def _timing_records(suite, impl, params, timings, nbytes, count):
+    """ Convert raw timings into per-operation result records. """
+    records = []
+    for oper, seconds in timings.items():
+        records.append(_record(suite, impl, oper, params,
+                               seconds * 1e9 / count, 'ns/op'))
+    records.append(_record(suite, impl, 'memory', params,
+                           nbytes / count, 'bytes/entry'))
+    return records
+
+
+def suite_grid(grid=None, repeat=3, seed=0, progress=None):
+    """
+    Time the basic operations across a grid of configurations.
+
+    grid maps each of 'wexp', 'texp', 'key_size' and 'size' to a list
+    of values; DEFAULT_GRID is used if it is None.  The mapping
+    baselines are measured once per (key_size, size).
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    records = []
+    for key_size in grid['key_size']:
+        for size in grid['size']:
+            keys = make_keys(size, key_size, seed)
+            misses = make_keys(size, key_size, seed + 1, exclude=keys)
+            values = make_keys(size, VALUE_SIZE, seed + 2)
+            params = {'key_size': key_size, 'size': size}
+
+            for name, factory in BASELINES.items():
+                if progress:
+                    progress('grid %s %r' % (name, params))
+                timings, nbytes = _bench_mapping(
+                    factory, keys, values, misses, repeat)
+                records.extend(_timing_records(
+                    'grid', name, params, timings, nbytes, size))
+
+            for wexp in grid['wexp']:
+                for texp in grid['texp']:
+                    params = {'wexp': wexp, 'texp': texp,
+                              'key_size': key_size, 'size': size}
+                    if progress:
+                        progress('grid hamt %r' % params)
+                    timings, nbytes = _bench_hamt(
+                        wexp, texp, keys, values, misses, repeat)
+                    records.extend(_timing_records(
+                        'grid', 'hamt', params, timings, nbytes, size))
+    return records
+
+
+# Table layouts compared by suite_write: each maps wexp to the keyword
+# arguments for Root
+WRITE_MODES = OrderedDict([
+    ('compact', lambda wexp: {}),
+    ('full_width_1', lambda wexp: {'full_width_depth': 1}),
+    ('full_width_2', lambda wexp: {'full_width_depth': 2}),
+    ('hybrid_3_4', lambda wexp: {'dense_threshold': 3 << (wexp - 2)}),
+])
+
+
+def suite_write(grid=None, repeat=3, seed=0, progress=None):
+    """
+    Compare the Table layouts in WRITE_MODES: compact Tables
+    everywhere, full-width DenseTables down to some depth, or Tables
+    made dense once three quarters full.  For each the cost of writes
+    is measured, together with the lookup cost and memory it buys.
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    records = []
+    for key_size in grid['key_size']:
+        for size in grid['size']:
+            keys = make_keys(size, key_size, seed)
+            values = make_keys(size, VALUE_SIZE, seed + 2)
+            for wexp in grid['wexp']:
+                for texp in grid['texp']:
+                    params = {'wexp': wexp, 'texp': texp,
+                              'key_size': key_size, 'size': size}
+                    for mode, make_kwargs in WRITE_MODES.items():
+                        if progress:
+                            progress('write %s %r' % (mode, params))
+                        kwargs = make_kwargs(wexp)
+
+                        def build(kwargs=kwargs):
+                            """ Build a Root in this layout. """
+                            return _build_root(
+                                wexp, texp, keys, values, **kwargs)
+
+                        timings = OrderedDict()
+                        timings['insert'] = _time_it(build, repeat)
+                        timings['delete'] = _time_deletes(
+                            lambda: _RootDeleter(build()), keys, repeat)
+                        root, nbytes = _bytes_allocated(build)
+                        find = root.find_leaf
+                        timings['lookup_hit'] = _time_it(
+                            lambda: [find(key) for key in keys], repeat)
+                        records.extend(_timing_records(
+                            'write', mode, params, timings, nbytes, size))
+    return records
+
+
+# Zipf exponents and front cache sizes compared by suite_zipf
+ZIPF_EXPONENTS = [0.8, 1.0, 1.2]
+ZIPF_CACHE_BITS = [8, 12]
+ZIPF_LOOKUPS = 100000
+
+
+def zipf_sample(keys, count, exponent, seed=0):
+    """
+    Return count keys drawn from keys with Zipf-distributed popularity:
+    the key of rank r is drawn with probability proportional to
+    1 / r ** exponent.
+    """
+    rng = random.Random(seed)
+    ranked = list(keys)
+    rng.shuffle(ranked)
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, len(ranked) + 1):
+        total += 1.0 / rank ** exponent
+        cum_weights.append(total)
+    return rng.choices(ranked, cum_weights=cum_weights, k=count)
+
+
+def suite_zipf(grid=None, repeat=3, seed=0, progress=None):
+    """
+    Time lookups drawn from a Zipf distribution, with and without a
+    front cache (CachedRoot), reporting the cost per lookup and the
+    cache's miss rate.
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    records = []
+    for key_size in grid['key_size']:
+        for size in grid['size']:
+            keys = make_keys(size, key_size, seed)
+            values = make_keys(size, VALUE_SIZE, seed + 2)
+            for wexp in grid['wexp']:
+                for texp in grid['texp']:
+                    roots = [('hamt', _build_root(wexp, texp, keys, values))]
+                    for bits in ZIPF_CACHE_BITS:
+                        cached = CachedRoot(wexp, texp, cache_bits=bits)
+                        cached.apply_batch(zip(keys, values))
+                        roots.append(('cached_%d' % bits, cached))
+                    for exponent in ZIPF_EXPONENTS:
+                        sample = zipf_sample(
+                            keys, ZIPF_LOOKUPS, exponent, seed + 3)
+                        params = {'wexp': wexp, 'texp': texp,
+                                  'key_size': key_size, 'size': size,
+                                  'zipf': exponent}
+                        for impl, root in roots:
+                            if progress:
+                                progress('zipf %s %r' % (impl, params))
+                            find = root.find_leaf
+                            seconds = _time_it(
+                                lambda: [find(key) for key in sample],
+                                repeat)
+                            records.append(_record(
+                                'zipf', impl, 'lookup_hit', params,
+                                seconds * 1e9 / len(sample), 'ns/op'))
+                            if isinstance(root, CachedRoot):
+                                root.reset_stats()
+                                for key in sample:
+                                    find(key)
+                                records.append(_record(
+                                    'zipf', impl, 'miss_rate', params,
+                                    100.0 * (1.0 - root.hit_rate), '%'))
+    return records
+
+
+MISS_RATIOS = [0.5, 0.9, 1.0]
+MISS_LOOKUPS = 100000
+
+
+def miss_sample(keys, misses, count, ratio, seed=0):
+    """
+    Return count keys drawn at random, a fraction ratio of them from
+    misses and the rest from keys.
+    """
+    rng = random.Random(seed)
+    return [rng.choice(misses) if rng.random() < ratio else rng.choice(keys)
+            for _ in range(count)]
+
+
+class _MissCounter(object):
+    """ Miss hook counting the misses reported. """
+
+    def __init__(self):
+        self.misses = 0
+
+    def __call__(self, key):
+        self.misses += 1
+
+
+def suite_miss(grid=None, repeat=3, seed=0, progress=None):
+    """
+    Time miss-heavy lookups on a Root with no miss hook, with a hook
+    counting misses, and with a hook printing each miss to os.devnull,
+    which is what Table.find_leaf() used to do to stdout.
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    records = []
+    with open(os.devnull, 'w') as devnull:
+
+        def print_miss(key):
+            """ Print a miss as the old debug branch did. """
+            print("Table[%d].find_leaf: key mismatch, returning None" %
+                  len(key), file=devnull)
+
+        for key_size in grid['key_size']:
+            for size in grid['size']:
+                keys = make_keys(size, key_size, seed)
+                misses = make_keys(size, key_size, seed + 1, exclude=keys)
+                values = make_keys(size, VALUE_SIZE, seed + 2)
+                for wexp in grid['wexp']:
+                    for texp in grid['texp']:
+                        root = _bulk_load(Root(wexp, texp),
+                                          zip(keys, values))
+                        find = root.find_leaf
+                        for ratio in MISS_RATIOS:
+                            sample = miss_sample(keys, misses, MISS_LOOKUPS,
+                                                 ratio, seed + 3)
+                            params = {'wexp': wexp, 'texp': texp,
+                                      'key_size': key_size, 'size': size,
+                                      'miss_ratio': ratio}
+                            for impl, hook in (('hamt', None),
+                                               ('count_hook', _MissCounter()),
+                                               ('print_hook', print_miss)):
+                                if progress:
+                                    progress('miss %s %r' % (impl, params))
+                                root.miss_hook = hook
+                                seconds = _time_it(
+                                    lambda: [find(key) for key in sample],
+                                    repeat)
+                                records.append(_record(
+                                    'miss', impl, 'lookup', params,
+                                    seconds * 1e9 / len(sample), 'ns/op'))
+                        root.miss_hook = None
+    return records
+
+
+def suite_filter(grid=None, repeat=3, seed=0, progress=None):
+    """
+    Time lookups at several miss ratios on a Root and on a FilteredRoot,
+    and report the filter's false positive rate, as a percentage of
+    misses it lets through, and its size.
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    records = []
+    for key_size in grid['key_size']:
+        for size in grid['size']:
+            keys = make_keys(size, key_size, seed)
+            misses = make_keys(size, key_size, seed + 1, exclude=keys)
+            values = make_keys(size, VALUE_SIZE, seed + 2)
+            for wexp in grid['wexp']:
+                for texp in grid['texp']:
+                    params = {'wexp': wexp, 'texp': texp,
+                              'key_size': key_size, 'size': size}
+                    roots = (
+                        ('hamt', _bulk_load(Root(wexp, texp),
+                                            zip(keys, values))),
+                        ('filtered', _bulk_load(FilteredRoot(wexp, texp),
+                                                zip(keys, values))))
+                    filtered = roots[1][1]
+                    passed = sum(1 for key in misses
+                                 if filtered.may_contain(key))
+                    records.append(_record(
+                        'filter', 'filtered', 'false_positive', params,
+                        100.0 * passed / len(misses), '%'))
+                    records.append(_record(
+                        'filter', 'filtered', 'memory', params,
+                        filtered.filter_size / size, 'bytes/entry'))
+                    for ratio in MISS_RATIOS:
+                        sample = miss_sample(keys, misses, MISS_LOOKUPS,
+                                             ratio, seed + 3)
+                        params = dict(params, miss_ratio=ratio)
+                        for impl, root in roots:
+                            if progress:
+                                progress('filter %s %r' % (impl, params))
+                            find = root.find_leaf
+                            seconds = _time_it(
+                                lambda: [find(key) for key in sample],
+                                repeat)
+                            records.append(_record(
+                                'filter', impl, 'lookup', params,
+                                seconds * 1e9 / len(sample), 'ns/op'))
+    return records
+
+
+PARALLEL_PROCESSES = [1, 2, 4, 8]
+
+
+def suite_parallel(grid=None, repeat=3, seed=0, progress=None):
+    """
+    Time building a Root with build_parallel() in 1, 2, 4 and 8
+    processes, and with Root.apply_batch() in this one, so that build
+    time can be plotted against cores.
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    records = []
+    for key_size in grid['key_size']:
+        for size in grid['size']:
+            keys = make_keys(size, key_size, seed)
+            values = make_keys(size, VALUE_SIZE, seed + 2)
+            pairs = list(zip(keys, values))
+            for wexp in grid['wexp']:
+                for texp in grid['texp']:
+                    params = {'wexp': wexp, 'texp': texp,
+                              'key_size': key_size, 'size': size}
+                    if progress:
+                        progress('parallel serial %r' % params)
+                    seconds = _time_it(
+                        lambda: _bulk_load(Root(wexp, texp), pairs), repeat)
+                    records.append(_record(
+                        'parallel', 'serial', 'build', params,
+                        seconds * 1e9 / size, 'ns/op'))
+                    for processes in PARALLEL_PROCESSES:
+                        params = dict(params, processes=processes)
+                        if progress:
+                            progress('parallel %r' % params)
+                        seconds = _time_it(
+                            lambda: build_parallel(pairs, wexp, texp,
+                                                   processes),
+                            repeat)
+                        records.append(_record(
+                            'parallel', 'parallel', 'build', params,
+                            seconds * 1e9 / size, 'ns/op'))
+    return records
+
+
+PREFORK_WORKERS = 4
+# fields of /proc/PID/smaps_rollup reported, in kB, and their op names
+SMAPS_FIELDS = OrderedDict([
+    ('Rss', 'rss'),
+    ('Pss', 'pss'),
+    ('Private_Dirty', 'private_dirty'),
+])
+
+
+def memory_usage(pid='self'):
+    """
+    Return {op: kB} for each of SMAPS_FIELDS from a process's
+    /proc/PID/smaps_rollup, or None where that is not available.
+    """
+    usage = {}
+    try:
+        with open('/proc/%s/smaps_rollup' % pid, 'r') as file:
+            for line in file:
+                field, _, rest = line.partition(':')
+                if field in SMAPS_FIELDS:
+                    usage[SMAPS_FIELDS[field]] = int(rest.split()[0])
+    except (IOError, OSError):
+        return None
+    return usage
+
+
+def _fork_readers(find, keys, workers):
+    """
+    Fork workers processes which each look up every key with find()
+    and wait; return the mean of their memory_usage() once all have
+    finished, then let them exit.
+    """
+    children = []
+    try:
+        for _ in range(workers):
+            ready_r, ready_w = os.pipe()
+            go_r, go_w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                # pylint: disable=protected-access
+                try:
+                    for key in keys:
+                        find(key)
+                    os.write(ready_w, b'r')
+                    os.read(go_r, 1)
+                finally:
+                    os._exit(0)
+            os.close(ready_w)
+            os.close(go_r)
+            children.append((pid, ready_r, go_w))
+        for _, ready_r, _ in children:
+            os.read(ready_r, 1)
+        usages = [memory_usage(pid) for pid, _, _ in children]
+    finally:
+        for pid, ready_r, go_w in children:
+            os.write(go_w, b'g')
+            os.close(go_w)
+            os.close(ready_r)
+            os.waitpid(pid, 0)
+    if None in usages:
+        return None
+    return dict((oper, sum(usage[oper] for usage in usages) / len(usages))
+                for oper in SMAPS_FIELDS.values())
+
+
+def suite_prefork(grid=None, repeat=3, seed=0, progress=None):
+    """
+    Fork PREFORK_WORKERS readers sharing a trie and report each
+    worker's mean RSS, PSS and privately dirtied memory after it has
+    looked up every key, for a Root as built, for a Root after
+    gc.freeze(), and for the Root frozen with Root.freeze().  Lookup
+    cost is timed in this process.  Needs fork and Linux's
+    /proc/PID/smaps_rollup; otherwise no records are returned.
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    records = []
+    if not hasattr(os, 'fork') or memory_usage() is None:
+        if progress:
+            progress('prefork: needs fork and /proc/PID/smaps_rollup')
+        return records
+    for key_size in grid['key_size']:
+        for size in grid['size']:
+            keys = make_keys(size, key_size, seed)
+            values = make_keys(size, VALUE_SIZE, seed + 2)
+            for wexp in grid['wexp']:
+                for texp in grid['texp']:
+                    params = {'wexp': wexp, 'texp': texp,
+                              'key_size': key_size, 'size': size,
+                              'workers': PREFORK_WORKERS}
+                    root = _bulk_load(Root(wexp, texp), zip(keys, values))
+                    frozen = freeze(root)
+                    for impl, target, gc_freeze in (
+                            ('hamt', root, False),
+                            ('hamt_gc_freeze', root, True),
+                            ('frozen', frozen, False)):
+                        if progress:
+                            progress('prefork %s %r' % (impl, params))
+                        find = target.find_leaf
+                        seconds = _time_it(
+                            lambda: [find(key) for key in keys], repeat)
+                        records.append(_record(
+                            'prefork', impl, 'lookup_hit', params,
+                            seconds * 1e9 / len(keys), 'ns/op'))
+                        gc.collect()
+                        if gc_freeze:
+                            gc.freeze()
+                        try:
+                            usage = _fork_readers(
+                                find, keys, PREFORK_WORKERS)
+                        finally:
+                            if gc_freeze:
+                                gc.unfreeze()
+                        if usage is None:
+                            continue
+                        for oper in SMAPS_FIELDS.values():
+                            records.append(_record(
+                                'prefork', impl, oper, params,
+                                usage[oper], 'kB'))
+    return records
+
+
+# suite name -> function(grid, repeat, seed, progress) returning records
+SUITES = OrderedDict([
+    ('grid', suite_grid),
+    ('write', suite_write),
+    ('zipf', suite_zipf),
+    ('miss', suite_miss),
+    ('filter', suite_filter),
+    ('parallel', suite_parallel),
+    ('prefork', suite_prefork),
+])
+
+
+def run_suites(names, grid=None, repeat=3, seed=0, progress=None):
+    """ Run the named suites and return a results document. """
+    records = []
+    for name in names:
+        if name not in SUITES:
+            raise ValueError("unknown benchmark suite '%s'" % name)
+        records.extend(SUITES[name](grid, repeat, seed, progress))
+    return {
+        'hamt_version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': records,
+    }
+
+
+def record_id(record):
+    """ Return a hashable identifier for what a record measured. """
+    return (record['suite'], record['impl'], record['op'],
+            tuple(sorted(record['params'].items())))
+
+
+def compare_results(old_doc, new_doc, threshold=0.10):
+    """
+    Compare two results documents.
+
+    Return a list of (record_id, old_value, new_value, ratio) for every
+    measurement present in both, and a list of those whose ratio
+    new/old exceeds 1 + threshold, which are the regressions.
+    """
+    old_by_id = {record_id(rec): rec for rec in old_doc['results']}
+    rows, regressions = [], []
+    for rec in new_doc['results']:
+        rid = record_id(rec)
+        old = old_by_id.get(rid)
+        if old is None or not old['value']:
+            continue
+        ratio = rec['value'] / old['value']
+        row = (rid, old['value'], rec['value'], ratio)
+        rows.append(row)
+        if ratio > 1.0 + threshold:
+            regressions.append(row)
+    return rows, regressions
+
+
+def _format_params(params):
+    """ Render a params dict compactly. """
+    return ' '.join('%s=%s' % (key, params[key]) for key in sorted(params))
+
+
+def _print_results(doc, out):
+    """ Print a results document as a text table. """
+    for rec in doc['results']:
+        out.write('%-6s %-12s %-12s %12.1f %-12s %s\n' % (
+            rec['suite'], rec['impl'], rec['op'], rec['value'], rec['unit'],
+            _format_params(rec['params'])))
+
+
+def _print_comparison(rows, regressions, threshold, out):
+    """ Print the output of compare_results(). """
+    for (suite, impl, oper, params), old, new, ratio in rows:
+        flag = '  REGRESSION' if ratio > 1.0 + threshold else ''
+        out.write('%-6s %-12s %-12s %12.1f -> %12.1f  x%.2f  %s%s\n' % (
+            suite, impl, oper, old, new, ratio,
+            _format_params(dict(params)), flag))
+    out.write('%d measurements compared, %d regressions (threshold %.0f%%)\n'
+              % (len(rows), len(regressions), threshold * 100))
+
+
+def _int_list(text):
+    """ Parse a comma-separated list of ints. """
+    return [int(part) for part in text.split(',') if part]
+
+
+def main(argv=None):
+    """ Command line entry point; returns the process exit status. """
+    parser = argparse.ArgumentParser(
+        prog='python -m hamt.bench',
+        description='benchmark hamt_py Root and Table operations')
+    parser.add_argument('-s', '--suite', action='append',
+                        choices=list(SUITES) + ['all'],
+                        help='suite to run (repeatable; default: grid)')
+    parser.add_argument('--full', action='store_true',
+                        help='use the full configuration grid')
+    parser.add_argument('--wexp', type=_int_list,
+                        help='comma-separated wexp values')
+    parser.add_argument('--texp', type=_int_list,
+                        help='comma-separated texp values')
+    parser.add_argument('--key-size', type=_int_list,
+                        help='comma-separated key sizes in bytes')
+    parser.add_argument('--size', type=_int_list,
+                        help='comma-separated map sizes')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='timings are the best of this many runs')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for key generation')
+    parser.add_argument('-o', '--output',
+                        help='write JSON results to this file')
+    parser.add_argument('-i', '--input',
+                        help='load results from this file instead of '
+                        'running benchmarks')
+    parser.add_argument('-c', '--compare',
+                        help='compare against results in this JSON file')
+    parser.add_argument('-t', '--threshold', type=float, default=0.10,
+                        help='slowdown ratio above which a change is '
+                        'reported as a regression (default 0.10)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="don't report progress on stderr")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input, 'r') as file:
+            doc = json.load(file)
+    else:
+        grid = dict(FULL_GRID if args.full else DEFAULT_GRID)
+        for axis in ('wexp', 'texp', 'key_size', 'size'):
+            if getattr(args, axis):
+                grid[axis] = getattr(args, axis)
+        names = args.suite or ['grid']
+        if 'all' in names:
+            names = list(SUITES)
+
+        def progress(msg):
+            """ Report progress on stderr. """
+            sys.stderr.write(msg + '\n')
+        doc = run_suites(names, grid, args.repeat, args.seed,
+                         None if args.quiet else progress)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(doc, file, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            old_doc = json.load(file)
+        rows, regressions = compare_results(old_doc, doc, args.threshold)
+        _print_comparison(rows, regressions, args.threshold, sys.stdout)
+        return 1 if regressions else 0
+
+    _print_results(doc, sys.stdout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
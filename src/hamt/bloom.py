@@ -0,0 +1,262 @@
+# hamt/bloom.py
+
+"""
+Negative-lookup filter for miss-heavy workloads.
+
+A FilteredRoot keeps a counting Bloom filter beside the trie.  Each key
+sets probes counters, chosen from its hashcode by double hashing, in a
+power-of-two array of byte counters.  A lookup first checks its
+key's counters and, if any is zero, returns None without descending
+through the Tables or comparing keys; since a miss usually meets a zero
+on the first or second probe, most misses cost little more than hashing
+the key.  Hits, and the few misses the filter lets through, pay for the
+probes on top of the usual search.
+
+Counters are decremented when keys are deleted, so that deleted keys
+stop getting past the filter; a counter which reaches 255 sticks
+there.  When the number of keys grows past the capacity the filter was
+sized for, it is rebuilt at twice that size, so that the false positive
+rate stays near what bits_per_key gives.  apply_batch() and detach()
+count and uncount just the keys they add and remove; extract() and
+split() build the new Roots' filters from the keys moved to them.  The
+caller may rebuild the filter from the keys in the trie by calling
+rebuild_filter(), after many deletes.
+
+Probes are taken from the key's hashcode, or from uhash() of the key
+if the Root is ordered, since ordered hashcodes share their leading
+bits.
+"""
+
+from hamt import HamtError, Leaf, Root, stored_key, uhash
+
+__all__ = ['FilteredRoot']
+
+# CONSTANTS
+
+# odd 64-bit constant used to spread the hashcode's bits over all 64
+_MIX = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+# CLASSES
+
+
+class FilteredRoot(Root):
+    """
+    Root with a counting Bloom filter in front of it, sized for
+    capacity keys at bits_per_key one-byte counters each.  The filter
+    grows as keys are added.
+    """
+
+    def __init__(self, wexp, texp, capacity=1024, bits_per_key=10,
+                 **kwargs):
+        super(FilteredRoot, self).__init__(wexp, texp, **kwargs)
+        if capacity < 1:
+            raise HamtError("capacity must be positive, is %d" % capacity)
+        if not 2 <= bits_per_key <= 32:
+            raise HamtError("bits_per_key must be in 2..32, is %d" %
+                            bits_per_key)
+        self._bits_per_key = bits_per_key
+        # about ln(2) probes per counter per key minimizes false positives
+        self._probes = max(1, bits_per_key * 69 // 100)
+        self._key_count = 0
+        self._make_filter(capacity)
+
+    def _make_filter(self, capacity):
+        """ Allocate an empty filter for capacity keys. """
+        self._capacity = capacity
+        size = 1 << max(6, (capacity * self._bits_per_key - 1).bit_length())
+        self._filter_mask = size - 1
+        self._counters = bytearray(size)
+
+    @property
+    def capacity(self):
+        """ Return the number of keys the filter is sized for. """
+        return self._capacity
+
+    @property
+    def bits_per_key(self):
+        """ Return the number of counters per key the filter is sized for. """
+        return self._bits_per_key
+
+    @property
+    def probes(self):
+        """ Return the number of counters each key sets. """
+        return self._probes
+
+    @property
+    def filter_size(self):
+        """ Return the number of counters, one byte each, in the filter. """
+        return self._filter_mask + 1
+
+    def _probe_start(self, key, hcode):
+        """ Return the first probe and the step between probes for key. """
+        if self._ordered:
+            hcode = uhash(key)
+        mixed = (hcode * _MIX) & _MASK64
+        return mixed >> 32, (mixed & 0xffffffff) | 1
+
+    def _add_key(self, key, hcode):
+        """ Count key in the filter, growing it if it is full. """
+        self._key_count += 1
+        if self._key_count > self._capacity:
+            self.rebuild_filter(2 * self._capacity)
+            return
+        counters, mask = self._counters, self._filter_mask
+        probe, step = self._probe_start(key, hcode)
+        for _ in range(self._probes):
+            if counters[probe & mask] < 255:
+                counters[probe & mask] += 1
+            probe += step
+
+    def _remove_key(self, key, hcode):
+        """ Uncount key, which was in the filter. """
+        self._key_count -= 1
+        counters, mask = self._counters, self._filter_mask
+        probe, step = self._probe_start(key, hcode)
+        for _ in range(self._probes):
+            if counters[probe & mask] < 255:
+                counters[probe & mask] -= 1
+            probe += step
+
+    def may_contain(self, key):
+        """
+        Return False if key is certainly absent, or True if it may be
+        present, judging by the filter alone.
+        """
+        counters, mask = self._counters, self._filter_mask
+        probe, step = self._probe_start(key, self._hasher(key))
+        for _ in range(self._probes):
+            if not counters[probe & mask]:
+                return False
+            probe += step
+        return True
+
+    def rebuild_filter(self, capacity=None):
+        """
+        Rebuild the filter from the keys in the trie, for capacity keys
+        or, by default, for its present capacity or as many keys as there
+        are now, whichever is more.
+        """
+        keys = [key for key, _ in self.items()]
+        if capacity is None:
+            capacity = max(self._capacity, len(keys))
+        self._make_filter(max(capacity, len(keys), 1))
+        self._key_count = len(keys)
+        counters, mask = self._counters, self._filter_mask
+        probes, hasher = self._probes, self._hasher
+        for key in keys:
+            probe, step = self._probe_start(key, hasher(key))
+            for _ in range(probes):
+                if counters[probe & mask] < 255:
+                    counters[probe & mask] += 1
+                probe += step
+
+    def find_leaf(self, key):
+        """
+        Find a Leaf entry given its key, consulting the filter first,
+        and return its value or None if there is no such entry.
+        """
+        hcode = self._hasher(key)
+        counters, mask = self._counters, self._filter_mask
+        mixed = ((uhash(key) if self._ordered else hcode) * _MIX) & _MASK64
+        probe, step = mixed >> 32, (mixed & 0xffffffff) | 1
+        value = None
+        for _ in range(self._probes):
+            if not counters[probe & mask]:
+                break
+            probe += step
+        else:
+            # the same search as Root.find_leaf(), reusing the hashcode
+            node = self._slots[hcode & self._mask]
+            if node:
+                if isinstance(node, Leaf):
+                    if node.key == key:
+                        value = node.value
+                elif self._max_table_depth > 0:
+                    value = node.find_leaf(hcode >> self._texp, 1, key)
+        if value is None and self.miss_hook is not None:
+            self.miss_hook(key)
+        return value
+
+    def insert_leaf(self, leaf):
+        """ Insert a Leaf, counting its key in the filter if it is new. """
+        key = leaf.key
+        hcode = self._hasher(key)
+        is_new = not self.may_contain(key) or self._get_leaf(key) is None
+        super(FilteredRoot, self).insert_leaf(leaf)
+        if is_new:
+            self._add_key(key, hcode)
+
+    def delete_leaf(self, key):
+        """ Delete a Leaf given its key, uncounting it in the filter. """
+        super(FilteredRoot, self).delete_leaf(key)
+        self._remove_key(key, self._hasher(key))
+
+    def _like(self):
+        """ Return an empty FilteredRoot with the same parameters. """
+        return FilteredRoot(self._wexp, self._texp, self._capacity,
+                            self._bits_per_key, **self._params())
+
+    def detach(self, path):
+        """
+        As for Root.detach(), uncounting the keys detached, which costs
+        time in proportion to their number.
+        """
+        node = super(FilteredRoot, self).detach(path)
+        for leaf in self.leaves_under(node):
+            self._remove_key(leaf.key, self._hasher(leaf.key))
+        return node
+
+    def extract(self, path):
+        """
+        As for Root.extract(), building the new Root's filter from the
+        keys moved to it.
+        """
+        root = super(FilteredRoot, self).extract(path)
+        root.rebuild_filter()
+        return root
+
+    def split(self, nparts):
+        """
+        As for Root.split(), building the filter of each part from its
+        own keys and emptying this Root's filter.
+        """
+        parts = super(FilteredRoot, self).split(nparts)
+        self._key_count = 0
+        self._make_filter(self._capacity)
+        for part in parts:
+            part.rebuild_filter()
+        return parts
+
+    def apply_batch(self, changes):
+        """
+        As for Root.apply_batch(), counting the keys the batch adds and
+        uncounting those it deletes.  The filter is rebuilt only if the
+        keys outgrow its capacity.
+        """
+        final = {}
+        for key, value in changes:
+            final[stored_key(key)] = value
+        hasher = self._hasher
+        added, removed = [], []
+        for key, value in final.items():
+            present = self.may_contain(key) and \
+                self._get_leaf(key) is not None
+            if value is None:
+                if present:
+                    removed.append(key)
+            elif not present:
+                added.append(key)
+        # count new keys first, so that the filter never misses a key
+        # in the trie even if the batch fails part way
+        needed = self._key_count + len(added)
+        if needed > self._capacity:
+            capacity = self._capacity
+            while capacity < needed:
+                capacity *= 2
+            self.rebuild_filter(capacity)
+        for key in added:
+            self._add_key(key, hasher(key))
+        super(FilteredRoot, self).apply_batch(final.items())
+        for key in removed:
+            self._remove_key(key, hasher(key))
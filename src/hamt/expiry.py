@@ -0,0 +1,498 @@
+# hamt/expiry.py
+
+"""
+Expiring entries and a size budget, for using a Root as a cache.
+
+An ExpiringRoot holds its entries in TimedLeafs, which record when the
+entry expires, if ever, when it was last used and how large it is.
+
+Expiry is driven by a hierarchical timing wheel: WHEEL_LEVELS rings of
+WHEEL_SLOTS buckets each.  A bucket in the lowest ring covers one tick
+of tick seconds, and one in each ring above covers a whole turn of the
+ring below it.  An entry is put in the bucket covering the tick in
+which it expires, in the lowest ring which reaches that far; when the
+wheel turns to a bucket in an upper ring, its entries drop into the
+rings below.  Each operation first turns the wheel up to the present,
+deleting the entries in the buckets it passes, so an entry is dropped
+within a tick of expiring, and each entry is handled at most once per
+ring.  The wheel jumps straight to the next tick at which a bucket is
+not empty, so time spent idle costs nothing.  find_leaf() also checks
+an entry's expiry time itself, so it never returns an expired value.
+
+With max_entries or max_bytes set, an insert which takes the Root over
+budget evicts entries until it is back within it.  Each victim is the
+least recently used of samples entries, each chosen at random, every
+entry being equally likely, by a descent guided by the counts of the
+Leafs under each Table.  Eviction thus costs a few descents rather
+than a walk of the trie, at the price of being approximately rather
+than strictly least recently used.  An entry's size is
+sys.getsizeof() of its key plus that of its value.
+
+Times come from clock, time.monotonic() by default.
+"""
+
+import random
+import sys
+import time
+
+from hamt import HamtError, HamtNotFound, Leaf, Root, stored_key
+
+__all__ = ['WHEEL_LEVELS', 'WHEEL_SLOTS', 'TimedLeaf', 'ExpiringRoot']
+
+# CONSTANTS
+
+WHEEL_BITS = 6
+WHEEL_SLOTS = 1 << WHEEL_BITS
+WHEEL_LEVELS = 4
+
+# CLASSES
+
+
+class TimedLeaf(Leaf):
+    """
+    Leaf which also records when it expires (None for never), when it
+    was last used, its size, and the timing wheel bucket holding it.
+    """
+
+    __slots__ = ('_expires', '_used', '_size', '_bucket')
+
+    def __init__(self, key, value, expires=None, used=0.0):
+        super(TimedLeaf, self).__init__(key, value)
+        self._expires = expires
+        self._used = used
+        self._size = sys.getsizeof(self._key) + sys.getsizeof(value)
+        self._bucket = None
+
+    @property
+    def expires(self):
+        """ Return the time at which the entry expires, or None. """
+        return self._expires
+
+    @property
+    def used(self):
+        """ Return the time at which the entry was last used. """
+        return self._used
+
+    @property
+    def size(self):
+        """ Return the size of the entry counted against max_bytes. """
+        return self._size
+
+
+class ExpiringRoot(Root):
+    """
+    Root whose entries may expire default_ttl seconds, or a ttl given
+    when they are inserted, after they are written, and which evicts
+    entries once it holds more than max_entries of them or more than
+    max_bytes in them.  None means no limit.  Other keyword arguments
+    are passed to Root.
+    """
+
+    def __init__(self, wexp, texp, default_ttl=None, max_entries=None,
+                 max_bytes=None, samples=5, tick=1.0, clock=time.monotonic,
+                 **kwargs):
+        super(ExpiringRoot, self).__init__(wexp, texp, **kwargs)
+        if samples < 1:
+            raise HamtError("samples must be positive, is %d" % samples)
+        if tick <= 0:
+            raise HamtError("tick must be positive, is %r" % tick)
+        self._default_ttl = default_ttl
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._samples = samples
+        self._tick = tick
+        self._clock = clock
+        self._now = clock()
+        self._now_tick = int(self._now // tick)
+        self._wheel = [[set() for _ in range(WHEEL_SLOTS)]
+                       for _ in range(WHEEL_LEVELS)]
+        self._scheduled = 0
+        self._entry_count = 0
+        self._byte_count = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @property
+    def default_ttl(self):
+        """ Return the lifetime of entries inserted without a ttl. """
+        return self._default_ttl
+
+    @property
+    def max_entries(self):
+        """ Return the most entries held before evicting, or None. """
+        return self._max_entries
+
+    @property
+    def max_bytes(self):
+        """ Return the most bytes held before evicting, or None. """
+        return self._max_bytes
+
+    @property
+    def entry_count(self):
+        """
+        Return the number of entries, counting any which have expired
+        but not yet been dropped, without walking the trie.
+        """
+        return self._entry_count
+
+    @property
+    def byte_count(self):
+        """ Return the total size of the entries. """
+        return self._byte_count
+
+    # timing wheel ---------------------------------------------------
+
+    def _schedule(self, leaf, earliest=1):
+        """
+        Put leaf in the wheel bucket for the tick it expires in, or
+        for earliest ticks from now if that is later; earliest is 0
+        only while the current tick's buckets are still to be emptied.
+        """
+        when = -int(-leaf._expires // self._tick)      # round up
+        delta = when - self._now_tick
+        if delta < earliest:
+            when = self._now_tick + earliest
+            delta = earliest
+        level = 0
+        while delta >= 1 << (WHEEL_BITS * (level + 1)):
+            level += 1
+            if level == WHEEL_LEVELS:
+                # beyond the wheel: park it in the farthest bucket
+                level -= 1
+                when = self._now_tick + (1 << (WHEEL_BITS * WHEEL_LEVELS)) - 1
+                break
+        bucket = self._wheel[level][
+            (when >> (WHEEL_BITS * level)) & (WHEEL_SLOTS - 1)]
+        bucket.add(leaf)
+        leaf._bucket = bucket
+        self._scheduled += 1
+
+    def _unschedule(self, leaf):
+        """ Take leaf out of the wheel, if it is there. """
+        if leaf._bucket is not None:
+            leaf._bucket.discard(leaf)
+            leaf._bucket = None
+            self._scheduled -= 1
+
+    def _next_busy_tick(self, target):
+        """
+        Return the first tick after the current one at which the wheel
+        comes round to a bucket which is not empty, in any ring, or
+        target if no such tick comes before it.  Each ring's buckets
+        are looked at once at most, so this costs the same however
+        many ticks are skipped.
+        """
+        busy = target
+        for level in range(WHEEL_LEVELS):
+            shift = WHEEL_BITS * level
+            ring = self._wheel[level]
+            # the ticks at which this ring's buckets come round
+            tick = ((self._now_tick >> shift) + 1) << shift
+            for _ in range(WHEEL_SLOTS):
+                if tick >= busy:
+                    break
+                if ring[(tick >> shift) & (WHEEL_SLOTS - 1)]:
+                    busy = tick
+                    break
+                tick += 1 << shift
+        return busy
+
+    def _advance(self, now):
+        """
+        Turn the wheel to now, dropping the entries which have expired,
+        and return the number dropped.
+        """
+        self._now = now
+        target = int(now // self._tick)
+        if not self._scheduled:
+            self._now_tick = max(self._now_tick, target)
+            return 0
+        dropped = 0
+        while self._now_tick < target and self._scheduled:
+            # skip the ticks at which no bucket has anything to do
+            tick_no = self._next_busy_tick(target)
+            self._now_tick = tick_no
+            # cascade each upper ring whose bucket has come round, the
+            # highest first, as its entries may drop into the next one's
+            top = 0
+            while top + 1 < WHEEL_LEVELS and \
+                    not tick_no & ((1 << (WHEEL_BITS * (top + 1))) - 1):
+                top += 1
+            for level in range(top, 0, -1):
+                shift = WHEEL_BITS * level
+                bucket = self._wheel[level][
+                    (tick_no >> shift) & (WHEEL_SLOTS - 1)]
+                for leaf in list(bucket):
+                    self._unschedule(leaf)
+                    self._schedule(leaf, 0)
+            bucket = self._wheel[0][tick_no & (WHEEL_SLOTS - 1)]
+            for leaf in list(bucket):
+                self._unschedule(leaf)
+                if leaf._expires <= now:
+                    self._remove(leaf)
+                    dropped += 1
+                else:
+                    self._schedule(leaf)
+        self._now_tick = max(self._now_tick, target)
+        self.expired += dropped
+        return dropped
+
+    def expire(self):
+        """
+        Drop the entries which have expired, up to the current tick,
+        and return how many were dropped.  Every other operation does
+        this first, so there is no need to call it except to free the
+        memory promptly while the Root is idle.
+        """
+        return self._advance(self._clock())
+
+    # bookkeeping -----------------------------------------------------
+
+    def _remember(self, leaf):
+        """ Count a new TimedLeaf and schedule its expiry. """
+        self._entry_count += 1
+        self._byte_count += leaf._size
+        if leaf._expires is not None:
+            self._schedule(leaf)
+
+    def _forget(self, leaf):
+        """ Uncount a TimedLeaf leaving the trie. """
+        self._unschedule(leaf)
+        self._entry_count -= 1
+        self._byte_count -= leaf._size
+
+    def _remove(self, leaf):
+        """ Delete an entry which is in the trie. """
+        self._forget(leaf)
+        super(ExpiringRoot, self).delete_leaf(leaf.key)
+
+    def _expiry(self, ttl):
+        """ Return the expiry time for an entry written now. """
+        if ttl is None:
+            ttl = self._default_ttl
+        if ttl is None:
+            return None
+        return self._now + ttl
+
+    def _over_budget(self):
+        """ Return whether the Root holds too many entries or bytes. """
+        return (self._max_entries is not None and
+                self._entry_count > self._max_entries) or \
+            (self._max_bytes is not None and
+             self._byte_count > self._max_bytes)
+
+    def _random_leaf(self):
+        """
+        Return a Leaf chosen at random, every Leaf being equally likely,
+        by a single descent guided by the counts of the Leafs under
+        each Table, or None if the Root is empty.
+        """
+        if not self._entry_count:
+            return None
+        return self._nth_leaf(random.randrange(self._entry_count))
+
+    def _evict(self):
+        """ Evict sampled least recently used entries until in budget. """
+        while self._entry_count and self._over_budget():
+            victim = None
+            for _ in range(self._samples):
+                leaf = self._random_leaf()
+                if leaf is None:
+                    break
+                if victim is None or leaf._used < victim._used:
+                    victim = leaf
+            if victim is None:
+                return
+            self._remove(victim)
+            self.evicted += 1
+
+    def _live_leaf(self, key):
+        """
+        Return the TimedLeaf holding key, or None if there is none or
+        it has expired, in which case it is dropped.
+        """
+        leaf = self._get_leaf(key)
+        if leaf is not None and leaf._expires is not None and \
+                leaf._expires <= self._now:
+            self._remove(leaf)
+            self.expired += 1
+            return None
+        return leaf
+
+    def _set_value(self, leaf, value):
+        """ Replace a TimedLeaf's value, keeping its size current. """
+        leaf.value = value
+        size = sys.getsizeof(leaf.key) + sys.getsizeof(value)
+        self._byte_count += size - leaf._size
+        leaf._size = size
+
+    # operations ------------------------------------------------------
+
+    def find_leaf(self, key):
+        """
+        Find a Leaf entry given its key and return its value, or None
+        if there is no such entry or it has expired.  A hit counts as
+        a use of the entry.
+        """
+        self._advance(self._clock())
+        leaf = self._live_leaf(key)
+        if leaf is None:
+            if self.miss_hook is not None:
+                self.miss_hook(key)
+            return None
+        leaf._used = self._now
+        return leaf.value
+
+    def insert_leaf(self, leaf, ttl=None):
+        """
+        Insert a Leaf's key and value, to expire after ttl seconds or,
+        if ttl is None, after default_ttl, then evict entries if the
+        Root is over budget.  Replacing a value resets its expiry.
+        """
+        self._advance(self._clock())
+        key, value = leaf.key, leaf.value
+        expires = self._expiry(ttl)
+        existing = self._live_leaf(key)
+        if existing is None:
+            leaf = TimedLeaf(key, value, expires, self._now)
+            super(ExpiringRoot, self).insert_leaf(leaf)
+            self._remember(leaf)
+        else:
+            self._unschedule(existing)
+            self._set_value(existing, value)
+            existing._expires = expires
+            existing._used = self._now
+            if expires is not None:
+                self._schedule(existing)
+        self._evict()
+
+    def delete_leaf(self, key):
+        """ Delete a Leaf given its key. """
+        self._advance(self._clock())
+        leaf = self._get_leaf(key)
+        if leaf is None:
+            raise HamtNotFound
+        self._remove(leaf)
+
+    def update(self, key, func, default=None):
+        """
+        As for Root.update(); the entry keeps its expiry time, and an
+        entry inserted gets default_ttl.
+        """
+        self._advance(self._clock())
+        leaf = self._live_leaf(key)
+        if leaf is None:
+            if default is None:
+                raise HamtNotFound
+            value = func(default)
+            self.insert_leaf(Leaf(key, value))
+        else:
+            value = func(leaf.value)
+            self._set_value(leaf, value)
+            leaf._used = self._now
+            self._evict()
+        return value
+
+    def set_ttl(self, key, ttl):
+        """
+        Make key's entry expire ttl seconds from now, or never if ttl
+        is None.  Raise HamtNotFound if there is no such entry.
+        """
+        self._advance(self._clock())
+        leaf = self._live_leaf(key)
+        if leaf is None:
+            raise HamtNotFound
+        self._unschedule(leaf)
+        leaf._expires = None if ttl is None else self._now + ttl
+        if ttl is not None:
+            self._schedule(leaf)
+
+    def ttl(self, key):
+        """
+        Return the seconds left before key's entry expires, or None if
+        it never does.  Raise HamtNotFound if there is no such entry.
+        """
+        self._advance(self._clock())
+        leaf = self._live_leaf(key)
+        if leaf is None:
+            raise HamtNotFound
+        if leaf._expires is None:
+            return None
+        return leaf._expires - self._now
+
+    def items(self, prefix=None, start=None, stop=None):
+        """
+        As for Root.items(), after dropping the entries which have
+        expired.  Entries expiring while the iteration is under way, or
+        within the current tick, may still be included.
+        """
+        self._advance(self._clock())
+        return super(ExpiringRoot, self).items(prefix, start, stop)
+
+    def _make_leaf(self, key, value):
+        """ Return a TimedLeaf for apply_batch(). """
+        return TimedLeaf(key, value, self._expiry(None), self._now)
+
+    def apply_batch(self, changes):
+        """
+        As for Root.apply_batch(); entries inserted get default_ttl,
+        and entries are evicted once the batch is in if the Root is
+        over budget.  The counts and the timing wheel are brought up
+        to date only once the batch has gone in, so a batch which fails
+        leaves them, like the trie, as they were.
+        """
+        self._advance(self._clock())
+        changes = dict((stored_key(key), value) for key, value in changes)
+        replaced = [leaf for leaf in map(self._get_leaf, changes)
+                    if leaf is not None]
+        super(ExpiringRoot, self).apply_batch(changes.items())
+        for leaf in replaced:
+            self._forget(leaf)
+        for key, value in changes.items():
+            if value is not None:
+                self._remember(self._get_leaf(key))
+        self._evict()
+
+    # restructuring ---------------------------------------------------
+
+    def _adopt(self, node):
+        """ Count and schedule every TimedLeaf in or under node. """
+        for leaf in self.leaves_under(node):
+            self._remember(leaf)
+
+    def _like(self):
+        """ Return an empty ExpiringRoot with the same parameters. """
+        return ExpiringRoot(self._wexp, self._texp, self._default_ttl,
+                            self._max_entries, self._max_bytes,
+                            self._samples, self._tick, self._clock,
+                            **self._params())
+
+    def detach(self, path):
+        """
+        As for Root.detach(); the entries detached are no longer
+        counted or expired by this Root.
+        """
+        node = super(ExpiringRoot, self).detach(path)
+        for leaf in self.leaves_under(node):
+            self._forget(leaf)
+        return node
+
+    def extract(self, path):
+        """ As for Root.extract(); the new Root expires its entries. """
+        root = super(ExpiringRoot, self).extract(path)
+        root._adopt(root.slots[path[0]])
+        return root
+
+    def split(self, nparts):
+        """ As for Root.split(); each new Root expires its entries. """
+        parts = super(ExpiringRoot, self).split(nparts)
+        self._wheel = [[set() for _ in range(WHEEL_SLOTS)]
+                       for _ in range(WHEEL_LEVELS)]
+        self._scheduled = 0
+        self._entry_count = 0
+        self._byte_count = 0
+        for part in parts:
+            for node in part.slots:
+                if node is not None:
+                    part._adopt(node)
+        return parts
@@ -0,0 +1,199 @@
+# hamt/frozen.py
+
+"""
+Read-only packed tries for prefork servers.
+
+A Root is a graph of Python objects, and in a process forked from the
+one which built it, merely looking a key up changes the reference
+counts of the Tables and Leafs on the way, so each page they sit on is
+copied into the child.  After a while every worker holds a private copy
+of the whole trie.
+
+freeze() packs a Root into a single bytes buffer and returns a
+FrozenRoot which searches that buffer in place.  The buffer holds the
+Root's slots, then each Table as its bitmap followed by one reference
+per slot in use, and each Leaf as its key and value lengths followed by
+the key and value.  References are byte offsets, shifted left one bit,
+with the low bit set for a Leaf; zero marks an empty Root slot.  Tables
+are always compact.  Reading the buffer touches no reference counts, so
+its pages stay shared between all of the workers.  Calling
+gc.freeze() before forking keeps the collector from touching whatever
+objects remain.
+
+Keys and values must be bytes.  Unless the Root was ordered, keys are
+placed by Python's hash(), which differs from one interpreter to the
+next unless PYTHONHASHSEED is set, so a buffer can only be searched by
+the process which froze it and its children.
+"""
+
+import struct
+
+from xlutil import popcount64
+
+from hamt import HamtError, Leaf, Root, ordered_hasher, uhash
+
+__all__ = ['FrozenRoot', 'freeze']
+
+# CONSTANTS
+
+# magic, wexp, texp, ordered flag, leaf count
+_HEADER = struct.Struct('<8sBBBQ')
+_MAGIC = b'HAMTFRZ1'
+_REF = struct.Struct('<Q')
+_LEAF = struct.Struct('<II')
+
+# FUNCTIONS
+
+
+def _pack_node(node, buf):
+    """
+    Append node and everything below it to buf, children first, and
+    return the reference to it.
+    """
+    if isinstance(node, Leaf):
+        key, value = node.key, node.value
+        if not isinstance(key, bytes) or not isinstance(value, bytes):
+            raise HamtError("only bytes keys and values can be frozen")
+        offset = len(buf)
+        buf += _LEAF.pack(len(key), len(value))
+        buf += key
+        buf += value
+        return (offset << 1) | 1
+    refs = [_pack_node(child, buf) for _, child in node.indexed_slots()]
+    offset = len(buf)
+    buf += _REF.pack(node.bitmap)
+    for ref in refs:
+        buf += _REF.pack(ref)
+    return offset << 1
+
+
+def freeze(root):
+    """ Return a FrozenRoot holding the entries in root. """
+    if not isinstance(root, Root):
+        raise TypeError("freeze() needs a Root")
+    buf = bytearray(_HEADER.pack(_MAGIC, root.wexp, root.texp,
+                                 1 if root.ordered else 0, root.leaf_count))
+    slots_at = len(buf)
+    buf += bytes(_REF.size * root.slot_count)
+    for ndx, node in enumerate(root.slots):
+        if node is not None:
+            _REF.pack_into(buf, slots_at + ndx * _REF.size,
+                           _pack_node(node, buf))
+    return FrozenRoot(bytes(buf))
+
+# CLASSES
+
+
+class FrozenRoot(object):
+    """
+    Read-only trie packed into a buffer by freeze().
+
+    buffer may be any object supporting the buffer protocol, such as
+    bytes or an mmap.
+    """
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            raise HamtError("buffer is too short to be a frozen trie")
+        magic, wexp, texp, ordered, count = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC:
+            raise HamtError("buffer does not hold a frozen trie")
+        self._buf = view
+        self._wexp = wexp
+        self._texp = texp
+        self._ordered = bool(ordered)
+        self._leaf_count = count
+        self._wmask = (1 << wexp) - 1
+        self._mask = (1 << texp) - 1
+        self._slots_at = _HEADER.size
+        if ordered:
+            self._hasher = ordered_hasher(texp, wexp)
+        else:
+            self._hasher = uhash
+
+    @property
+    def wexp(self):
+        """ Return the w factor of the Root which was frozen. """
+        return self._wexp
+
+    @property
+    def texp(self):
+        """ Return the t factor of the Root which was frozen. """
+        return self._texp
+
+    @property
+    def ordered(self):
+        """ Return whether keys are kept in order rather than hashed. """
+        return self._ordered
+
+    @property
+    def leaf_count(self):
+        """ Return the number of entries. """
+        return self._leaf_count
+
+    @property
+    def buffer(self):
+        """ Return a memoryview of the packed trie. """
+        return self._buf
+
+    @property
+    def nbytes(self):
+        """ Return the size of the packed trie in bytes. """
+        return self._buf.nbytes
+
+    def find_leaf(self, key):
+        """ Return the value stored for key, or None if there is none. """
+        buf = self._buf
+        wexp = self._wexp
+        wmask = self._wmask
+        hcode = self._hasher(key)
+        ref = _REF.unpack_from(
+            buf, self._slots_at + (hcode & self._mask) * _REF.size)[0]
+        hcode >>= self._texp
+        while ref and not ref & 1:
+            offset = ref >> 1
+            bitmap = _REF.unpack_from(buf, offset)[0]
+            flag = 1 << (hcode & wmask)
+            if not bitmap & flag:
+                return None
+            ref = _REF.unpack_from(
+                buf, offset + _REF.size *
+                (1 + popcount64(bitmap & (flag - 1))))[0]
+            hcode >>= wexp
+        if not ref:
+            return None
+        offset = (ref >> 1) + _LEAF.size
+        klen, vlen = _LEAF.unpack_from(buf, offset - _LEAF.size)
+        if buf[offset:offset + klen] != key:
+            return None
+        offset += klen
+        return buf[offset:offset + vlen].tobytes()
+
+    def _leaf_at(self, ref):
+        """ Return the (key, value) of the Leaf referred to. """
+        offset = (ref >> 1) + _LEAF.size
+        klen, vlen = _LEAF.unpack_from(self._buf, offset - _LEAF.size)
+        key = self._buf[offset:offset + klen].tobytes()
+        offset += klen
+        return key, self._buf[offset:offset + vlen].tobytes()
+
+    def items(self):
+        """
+        Yield a (key, value) pair for each entry, in slot order, which
+        is key order if the Root was ordered.
+        """
+        buf = self._buf
+        refs = [_REF.unpack_from(buf, self._slots_at + ndx * _REF.size)[0]
+                for ndx in range(self._mask + 1)]
+        stack = [ref for ref in reversed(refs) if ref]
+        while stack:
+            ref = stack.pop()
+            if ref & 1:
+                yield self._leaf_at(ref)
+                continue
+            offset = ref >> 1
+            count = popcount64(_REF.unpack_from(buf, offset)[0])
+            stack.extend(
+                _REF.unpack_from(buf, offset + _REF.size * (ndx + 1))[0]
+                for ndx in range(count - 1, -1, -1))
@@ -0,0 +1,358 @@
+# hamt/hamt_set.py
+
+"""
+A set of keys built on the hamt_py trie.
+
+A HamtSet keeps its keys in KeyLeafs, which carry no value, under an
+ordinary Root.  union(), intersection() and difference() work on the
+tries rather than on the keys: at each level the two bitmaps are OR'ed
+or AND'ed, only the slots both sides use are merged further down, and
+a subtree found on one side only is taken over whole, without being
+copied or even visited.  Combining two large sets which differ in a
+few places therefore costs little more than walking those places.
+
+Subtrees may thus be shared between sets.  A shared Table is marked by
+pointing its root at a Root which no set owns, and a HamtSet copies any
+Table it does not own on the path to a key before changing it (path
+copying), so that changing one set never changes another.  A HamtSet's
+Root must not be changed other than through the HamtSet.
+"""
+
+from xlutil import popcount64
+
+from hamt import (DenseTable, HamtError, HamtNotFound, Leaf, Root, Table,
+                  stored_key)
+
+__all__ = ['KeyLeaf', 'HamtSet']
+
+# CLASSES
+
+
+class KeyLeaf(Leaf):
+    """ Leaf holding a key only; its value is always True. """
+
+    __slots__ = ()
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, key):
+        if key is None:
+            raise HamtError('key cannot be None')
+        self._key = stored_key(key)
+
+    @property
+    def value(self):
+        """ Return True: a KeyLeaf is present. """
+        return True
+
+
+class _SetRoot(Root):
+    """ Root whose apply_batch() inserts KeyLeafs. """
+
+    def _make_leaf(self, key, value):
+        return KeyLeaf(key)
+
+# FUNCTIONS
+
+
+# config -> a Root which owns no set, marking the Tables sets share
+_SHARED_ROOTS = {}
+
+
+def _config(root):
+    """ Return what must match for two Roots to share Tables. """
+    return (type(root), root.wexp, root.texp, root.full_width_depth,
+            root.dense_threshold, root.ordered)
+
+
+def _shared_root(root):
+    """ Return the Root marking shared Tables like those under root. """
+    config = _config(root)
+    marker = _SHARED_ROOTS.get(config)
+    if marker is None:
+        marker = _SHARED_ROOTS[config] = _SetRoot(
+            root.wexp, root.texp, full_width_depth=root.full_width_depth,
+            dense_threshold=root.dense_threshold, ordered=root.ordered)
+    return marker
+
+
+def _share(root, node):
+    """ Mark node as shared if it is a Table which root does not own. """
+    # pylint: disable=protected-access
+    if isinstance(node, Table) and node._root is not root:
+        node._root = _shared_root(root)
+    return node
+
+
+def _view(root, node, depth):
+    """
+    Return (bitmap, {ndx: child}) for node seen as a Table at depth.
+    A Leaf is seen as a Table holding just that Leaf.
+    """
+    if isinstance(node, Leaf):
+        shift = root.texp + (depth - 1) * root.wexp
+        ndx = (root.hasher(node.key) >> shift) & ((1 << root.wexp) - 1)
+        return 1 << ndx, {ndx: node}
+    return node.bitmap, dict(node.indexed_slots())
+
+
+def _bits(bitmap):
+    """ Yield the index of each bit set in bitmap, lowest first. """
+    while bitmap:
+        low_bit = bitmap & -bitmap
+        yield low_bit.bit_length() - 1
+        bitmap ^= low_bit
+
+
+def _make(root, depth, children, *originals):
+    """
+    Return the node at depth holding children, a dict {ndx: node} in
+    which node may be None.  A lone Leaf is returned as it is, and an
+    original Table with exactly these children is reused.
+    """
+    children = dict((ndx, node) for ndx, node in children.items()
+                    if node is not None)
+    if not children:
+        return None
+    if len(children) == 1:
+        node = next(iter(children.values()))
+        if isinstance(node, Leaf):
+            return node
+    for orig in originals:
+        if isinstance(orig, Table) and \
+                popcount64(orig.bitmap) == len(children) and \
+                all(children.get(ndx) is node
+                    for ndx, node in orig.indexed_slots()):
+            return orig
+    bitmap = 0
+    slots = []
+    for ndx in sorted(children):
+        bitmap |= 1 << ndx
+        slots.append(_share(root, children[ndx]))
+    return Table.from_slots(depth, root, bitmap, slots)
+
+
+def _union(root, anode, bnode, depth):
+    """ Return the union of two nodes at depth, built under root. """
+    if anode is None or anode is bnode:
+        return bnode
+    if bnode is None:
+        return anode
+    if isinstance(anode, Leaf) and isinstance(bnode, Leaf) and \
+            anode.key == bnode.key:
+        return anode
+    if depth > root.max_table_depth:
+        if isinstance(anode, Leaf) and isinstance(bnode, Leaf):
+            root.check_split(anode.key, bnode.key)
+        raise HamtError(
+            "max table depth (%d) exceeded" % root.max_table_depth)
+    abits, achildren = _view(root, anode, depth)
+    bbits, bchildren = _view(root, bnode, depth)
+    children = dict(achildren)
+    children.update(bchildren)
+    for ndx in _bits(abits & bbits):
+        children[ndx] = _union(root, achildren[ndx], bchildren[ndx],
+                               depth + 1)
+    return _make(root, depth, children, anode, bnode)
+
+
+def _intersection(root, anode, bnode, depth):
+    """ Return the intersection of two nodes at depth, built under root. """
+    if anode is None or bnode is None:
+        return None
+    if anode is bnode:
+        return anode
+    if isinstance(anode, Leaf) and isinstance(bnode, Leaf):
+        return anode if anode.key == bnode.key else None
+    abits, achildren = _view(root, anode, depth)
+    bbits, bchildren = _view(root, bnode, depth)
+    children = {}
+    for ndx in _bits(abits & bbits):
+        children[ndx] = _intersection(root, achildren[ndx], bchildren[ndx],
+                                      depth + 1)
+    return _make(root, depth, children, anode, bnode)
+
+
+def _difference(root, anode, bnode, depth):
+    """ Return anode less bnode, both at depth, built under root. """
+    if anode is None or anode is bnode:
+        return None
+    if bnode is None:
+        return anode
+    if isinstance(anode, Leaf) and isinstance(bnode, Leaf):
+        return None if anode.key == bnode.key else anode
+    abits, achildren = _view(root, anode, depth)
+    bbits, bchildren = _view(root, bnode, depth)
+    if not abits & bbits:
+        return anode
+    children = dict(achildren)
+    for ndx in _bits(abits & bbits):
+        children[ndx] = _difference(root, achildren[ndx], bchildren[ndx],
+                                    depth + 1)
+    return _make(root, depth, children, anode)
+
+
+class HamtSet(object):
+    """
+    Set of hashable keys held in a HAMT trie of (1 << texp) Root slots
+    and Tables of up to (1 << wexp) slots.  Other keyword arguments are
+    passed to Root.
+
+    Sets combined by union(), intersection() or difference() must have
+    been created with the same parameters; otherwise the result is
+    built key by key.
+    """
+
+    def __init__(self, keys=None, wexp=5, texp=8, **kwargs):
+        self._root = _SetRoot(wexp, texp, **kwargs)
+        self._kwargs = kwargs
+        self._count = 0             # None if not known
+        if keys is not None:
+            self.update(keys)
+
+    @property
+    def root(self):
+        """ Return the Root holding the set. """
+        return self._root
+
+    def _empty(self):
+        """ Return an empty HamtSet with the same parameters as this. """
+        return HamtSet(None, self._root.wexp, self._root.texp,
+                       **self._kwargs)
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self._root.leaf_count
+        return self._count
+
+    def __iter__(self):
+        for key, _ in self._root.items():
+            yield key
+
+    def __contains__(self, key):
+        return self._root.find_leaf(key) is not None
+
+    def _own(self, table):
+        """
+        Return a copy of a Table this set does not own, now owned by
+        this set.  Its Tables are from then on shared with the original.
+        """
+        # pylint: disable=protected-access
+        copy = table._copy_as(type(table), list(table.slots))
+        copy._root = self._root
+        marker = _shared_root(self._root)
+        for node in copy.slots:
+            if isinstance(node, Table):
+                node._root = marker
+        return copy
+
+    def _own_path(self, key):
+        """ Make sure this set owns every Table on the path to key. """
+        # pylint: disable=protected-access
+        root = self._root
+        hcode = root.hasher(key)
+        parent, pos = root.slots, hcode & root.mask
+        hcode >>= root.texp
+        while True:
+            node = parent[pos]
+            if not isinstance(node, Table):
+                return
+            if node._root is not root:
+                node = parent[pos] = self._own(node)
+            ndx = hcode & node.mask
+            if isinstance(node, DenseTable):
+                pos = ndx
+            else:
+                flag = 1 << ndx
+                if not node.bitmap & flag:
+                    return
+                pos = popcount64(node.bitmap & (flag - 1))
+            parent = node.slots
+            hcode >>= node.wexp
+
+    def add(self, key):
+        """ Add key to the set. """
+        if key in self:
+            return
+        self._own_path(key)
+        self._root.insert_leaf(KeyLeaf(key))
+        if self._count is not None:
+            self._count += 1
+
+    def remove(self, key):
+        """ Remove key from the set; raise HamtNotFound if it is absent. """
+        if key not in self:
+            raise HamtNotFound
+        self._own_path(key)
+        self._root.delete_leaf(key)
+        if self._count is not None:
+            self._count -= 1
+
+    def discard(self, key):
+        """ Remove key from the set if it is present. """
+        if key in self:
+            self.remove(key)
+
+    def update(self, keys):
+        """ Add many keys at once, using Root.apply_batch(). """
+        self._root.apply_batch((key, True) for key in keys)
+        self._count = None
+
+    def copy(self):
+        """ Return a copy of the set, sharing all of its Tables. """
+        result = self._empty()
+        slots = result.root.slots
+        for ndx, node in enumerate(self._root.slots):
+            slots[ndx] = _share(result.root, node)
+        result._count = self._count
+        return result
+
+    def _combine(self, other, merge):
+        """
+        Return a new HamtSet merging this one and other slot by slot,
+        or None if they cannot share Tables.
+        """
+        if not isinstance(other, HamtSet) or \
+                _config(self._root) != _config(other.root):
+            return None
+        result = self._empty()
+        root = result.root
+        slots = root.slots
+        for ndx, (anode, bnode) in enumerate(zip(self._root.slots,
+                                                 other.root.slots)):
+            slots[ndx] = _share(root, merge(root, anode, bnode, 1))
+        result._count = None
+        return result
+
+    def union(self, other):
+        """ Return a new HamtSet of the keys in this set or other. """
+        result = self._combine(other, _union)
+        if result is None:
+            result = self.copy()
+            result.update(other)
+        return result
+
+    def intersection(self, other):
+        """ Return a new HamtSet of the keys in both this set and other. """
+        result = self._combine(other, _intersection)
+        if result is None:
+            result = self._empty()
+            result.update(key for key in other if key in self)
+        return result
+
+    def difference(self, other):
+        """ Return a new HamtSet of the keys in this set but not other. """
+        result = self._combine(other, _difference)
+        if result is None:
+            result = self.copy()
+            for key in other:
+                result.discard(key)
+        return result
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
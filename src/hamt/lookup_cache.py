@@ -0,0 +1,144 @@
+# hamt/lookup_cache.py
+
+"""
+Front cache for hot keys.
+
+A CachedRoot keeps a small direct-mapped cache of recent lookups in
+front of the trie: an array of (1 << cache_bits) key/value pairs
+indexed by bits of the key's hashcode.  A lookup whose key is in its
+cache slot returns at once, without descending through the Tables;
+otherwise it searches the trie as usual and, if the key is found, takes
+over the cache slot.  With a skewed access pattern the few hot keys
+stay cached and most lookups are hits.
+
+insert_leaf(), delete_leaf(), update() and apply_batch() keep the cache
+correct; detach() and split() empty it.
+A Leaf's value changed behind the Root's back is not seen.
+"""
+
+from hamt import HamtError, Leaf, Root, stored_key
+
+__all__ = ['CachedRoot']
+
+# CLASSES
+
+
+class CachedRoot(Root):
+    """
+    Root with a direct-mapped front cache of (1 << cache_bits) entries.
+
+    hits and misses count lookups answered from the cache and from the
+    trie respectively.
+    """
+
+    def __init__(self, wexp, texp, cache_bits=10, **kwargs):
+        super(CachedRoot, self).__init__(wexp, texp, **kwargs)
+        if not 0 < cache_bits <= 24:
+            raise HamtError("cache_bits must be in 1..24, is %d" %
+                            cache_bits)
+        size = 1 << cache_bits
+        self._cache_mask = size - 1
+        self._cache_keys = [None] * size
+        self._cache_values = [None] * size
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache_size(self):
+        """ Return the number of entries in the cache. """
+        return self._cache_mask + 1
+
+    @property
+    def hit_rate(self):
+        """ Return the fraction of lookups answered from the cache. """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset_stats(self):
+        """ Zero the hit and miss counts. """
+        self.hits = 0
+        self.misses = 0
+
+    def clear_cache(self):
+        """ Empty the cache. """
+        size = self._cache_mask + 1
+        self._cache_keys = [None] * size
+        self._cache_values = [None] * size
+
+    def _cache_ndx(self, hcode):
+        """ Return the cache slot for a hashcode. """
+        # fold the high bits in, as the low ones also pick the Root slot
+        return (hcode ^ (hcode >> 32)) & self._cache_mask
+
+    def _invalidate(self, key):
+        """ Drop key from the cache if it is there. """
+        cndx = self._cache_ndx(self._hasher(key))
+        if self._cache_keys[cndx] == key:
+            self._cache_keys[cndx] = None
+            self._cache_values[cndx] = None
+
+    def find_leaf(self, key):
+        """
+        Find a Leaf entry given its key, trying the cache first, and
+        return its value or None if there is no such entry.
+        """
+        hcode = self._hasher(key)
+        cndx = (hcode ^ (hcode >> 32)) & self._cache_mask
+        if self._cache_keys[cndx] == key:
+            self.hits += 1
+            return self._cache_values[cndx]
+        self.misses += 1
+
+        # the same search as Root.find_leaf(), reusing the hashcode
+        value = None
+        node = self._slots[hcode & self._mask]
+        if node:
+            if isinstance(node, Leaf):
+                if node.key == key:
+                    value = node.value
+            elif self._max_table_depth > 0:
+                value = node.find_leaf(hcode >> self._texp, 1, key)
+        if value is not None:
+            self._cache_keys[cndx] = stored_key(key)
+            self._cache_values[cndx] = value
+        elif self.miss_hook is not None:
+            self.miss_hook(key)
+        return value
+
+    def insert_leaf(self, leaf):
+        """ Insert a Leaf, dropping any stale cached value for its key. """
+        self._invalidate(leaf.key)
+        super(CachedRoot, self).insert_leaf(leaf)
+
+    def delete_leaf(self, key):
+        """ Delete a Leaf given its key, dropping it from the cache. """
+        self._invalidate(key)
+        super(CachedRoot, self).delete_leaf(key)
+
+    def update(self, key, func, default=None):
+        """ As for Root.update(), dropping any stale cached value. """
+        self._invalidate(key)
+        return super(CachedRoot, self).update(key, func, default)
+
+    def _like(self):
+        """ Return an empty CachedRoot with the same parameters. """
+        return CachedRoot(self._wexp, self._texp,
+                          (self._cache_mask + 1).bit_length() - 1,
+                          **self._params())
+
+    def detach(self, path):
+        """ As for Root.detach(), emptying the cache. """
+        self.clear_cache()
+        return super(CachedRoot, self).detach(path)
+
+    def split(self, nparts):
+        """ As for Root.split(), emptying the cache. """
+        self.clear_cache()
+        return super(CachedRoot, self).split(nparts)
+
+    def apply_batch(self, changes):
+        """ As for Root.apply_batch(), dropping changed keys from cache. """
+        changes = list(changes)
+        for key, _ in changes:
+            self._invalidate(key)
+        super(CachedRoot, self).apply_batch(changes)
@@ -0,0 +1,211 @@
+# hamt/parallel.py
+
+"""
+Parallel bulk build for hamt_py.
+
+build_parallel() builds a Root from many (key, value) pairs using a
+pool of worker processes.  The Root's slots split the key space into
+independent subtrees, so the work divides by ranges of Root slots:
+
+  * each worker hashes a chunk of the keys and returns, for each range
+    of Root slots, the indices of its keys which fall in that range;
+  * each worker then takes one range, hashes its keys again, groups
+    them level by level as Root.apply_batch() does, and returns the
+    shape of every subtree in the range in a compact form: a flat
+    array holding, in preorder, each Table's bitmap and each Leaf's
+    index in the input;
+  * the parent turns those arrays into Tables and Leafs in slot order,
+    which needs no hashing and no grouping.
+
+Only the last step is serial, but it is the one which creates every
+Leaf and Table, and in CPython that is roughly half the cost of
+Root.apply_batch() building the same Root.  The speedup therefore
+levels off at about two, or more where hashing costs more, as it does
+with long keys.
+
+Workers inherit the pairs by forking, so only arrays of integers pass
+between processes.  Where fork is not available the Root is built in
+this process with Root.apply_batch().  Keys must hash the same way in
+every process, which forked workers guarantee.
+"""
+
+import multiprocessing
+from array import array
+
+from xlutil import popcount64
+
+from hamt import HamtError, Leaf, Root, Table, stored_key
+
+__all__ = ['build_parallel']
+
+# CONSTANTS
+
+# codes in a shape array which are not Leaf indices: an empty Root
+# slot, and a Table, whose bitmap is the next code
+_EMPTY = (1 << 64) - 2
+_TABLE = (1 << 64) - 1
+
+# FUNCTIONS
+
+# set in the parent just before each pool forks, inherited by workers
+_SHARED = None
+
+
+def _partition(bounds):
+    """
+    Hash the keys with indices in bounds, a (first, stop) pair, and
+    return an array of those indices for each slot range.
+    """
+    root, keys, _, step = _SHARED
+    hasher, mask = root.hasher, root.mask
+    nranges = -(-root.slot_count // step)
+    by_range = [array('Q') for _ in range(nranges)]
+    for ndx in range(bounds[0], bounds[1]):
+        by_range[(hasher(keys[ndx]) & mask) // step].append(ndx)
+    return by_range
+
+
+def _shape(entries, depth, max_depth, wexp, codes):
+    """
+    Append to codes the shape of the node holding entries, a list of
+    (hcode, index) with hcode shifted for a node at depth.
+    """
+    if len(entries) == 1:
+        codes.append(entries[0][1])
+        return
+    if depth > max_depth:
+        root, keys = _SHARED[:2]
+        root.check_split(keys[entries[0][1]], keys[entries[1][1]])
+        raise HamtError("max table depth (%d) exceeded" % max_depth)
+    mask = (1 << wexp) - 1
+    groups = {}
+    for hcode, ndx in entries:
+        group = groups.get(hcode & mask)
+        if group is None:
+            group = groups[hcode & mask] = []
+        group.append((hcode >> wexp, ndx))
+    bitmap = 0
+    for slot in groups:
+        bitmap |= 1 << slot
+    codes.append(_TABLE)
+    codes.append(bitmap)
+    for slot in sorted(groups):
+        _shape(groups[slot], depth + 1, max_depth, wexp, codes)
+
+
+def _build_range(rng):
+    """
+    Return the shape array for the Root slots in range number rng:
+    one node, or _EMPTY, per slot in order.
+    """
+    root, keys, values, step, indices = _SHARED
+    hasher, mask, texp = root.hasher, root.mask, root.texp
+    first = rng * step
+    stop = min(first + step, root.slot_count)
+    by_slot = {}
+    for ndx in indices[rng]:
+        key = keys[ndx]
+        slot = by_slot.get(hasher(key) & mask)
+        if slot is None:
+            slot = by_slot[hasher(key) & mask] = {}
+        slot[key] = ndx         # a later pair replaces an earlier one
+    codes = array('Q')
+    for slot_ndx in range(first, stop):
+        slot = by_slot.get(slot_ndx)
+        entries = None
+        if slot:
+            entries = [(hasher(key) >> texp, ndx)
+                       for key, ndx in slot.items()
+                       if values[ndx] is not None]
+        if entries:
+            _shape(entries, 1, root.max_table_depth, root.wexp, codes)
+        else:
+            codes.append(_EMPTY)
+    return codes
+
+
+def _decode_table(codes, depth, root, keys, values):
+    """
+    Build the Table at depth whose shape follows in codes, an
+    iterator, just after its _TABLE code.
+    """
+    bitmap = next(codes)
+    slots = []
+    for _ in range(popcount64(bitmap)):
+        code = next(codes)
+        if code == _TABLE:
+            slots.append(_decode_table(codes, depth + 1, root, keys, values))
+        else:
+            slots.append(Leaf(keys[code], values[code]))
+    return Table.from_slots(depth, root, bitmap, slots)
+
+
+def build_parallel(pairs, wexp, texp, processes=None, chunks_per_process=4,
+                   **kwargs):
+    """
+    Return a new Root holding pairs, an iterable of (key, value),
+    built in processes worker processes (by default one per CPU).
+
+    As with Root.apply_batch(), a later pair for a key replaces an
+    earlier one, and a pair whose value is None leaves the key out.
+    Other keyword arguments are passed to Root.
+    """
+    # pylint: disable=global-statement
+    global _SHARED
+
+    root = Root(wexp, texp, **kwargs)
+    keys, values = [], []
+    for key, value in pairs:
+        keys.append(stored_key(key))
+        values.append(value)
+    if not keys:
+        return root
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes < 1:
+        raise HamtError("processes must be positive, is %d" % processes)
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        root.apply_batch(zip(keys, values))
+        return root
+
+    nchunks = max(1, min(root.slot_count, processes * chunks_per_process))
+    step = -(-root.slot_count // nchunks)
+    nranges = -(-root.slot_count // step)
+    key_step = -(-len(keys) // nchunks)
+    key_bounds = [(first, min(first + key_step, len(keys)))
+                  for first in range(0, len(keys), key_step)]
+
+    context = multiprocessing.get_context('fork')
+    try:
+        _SHARED = (root, keys, values, step)
+        indices = [array('Q') for _ in range(nranges)]
+        pool = context.Pool(processes)
+        try:
+            for by_range in pool.imap(_partition, key_bounds):
+                for rng, found in enumerate(by_range):
+                    indices[rng].extend(found)
+        finally:
+            pool.close()
+            pool.join()
+
+        _SHARED = (root, keys, values, step, indices)
+        pool = context.Pool(processes)
+        try:
+            slots = root.slots
+            slot_ndx = 0
+            for codes in pool.imap(_build_range, range(nranges)):
+                codes = iter(codes)
+                for _ in range(min(step, root.slot_count - slot_ndx)):
+                    code = next(codes)
+                    if code == _TABLE:
+                        slots[slot_ndx] = _decode_table(
+                            codes, 1, root, keys, values)
+                    elif code != _EMPTY:
+                        slots[slot_ndx] = Leaf(keys[code], values[code])
+                    slot_ndx += 1
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _SHARED = None
+    return root
@@ -0,0 +1,286 @@
+# hamt/profile.py
+
+"""
+Attribute the cost of HAMT lookups to hashing, to each level of the
+trie and to the final key comparison.
+
+Run as
+
+    python -m hamt.profile [--keys FILE [--hex]] [--count N] [--samples N]
+
+Lookups are replayed step by step, following exactly the path that
+Root.find_leaf() and Table.find_leaf() take, with the clock read
+between steps.  The cost of reading the clock is measured first and
+subtracted, so the per-phase figures add up to roughly the cost of an
+uninstrumented lookup, which is also reported.
+"""
+
+import argparse
+import binascii
+import random
+import sys
+import time
+from collections import OrderedDict
+
+from xlutil import popcount64
+
+from hamt import DenseTable, Leaf, Root, Table
+from hamt.bench import make_keys
+
+__all__ = ['LevelProfile', 'timer_overhead', 'profile_lookups',
+           'read_keys', 'main']
+
+# CLASSES
+
+
+class LevelProfile(object):
+    """
+    Accumulated lookup cost, by phase.
+
+    Phases are 'hash', 'root', 'level 1' ... 'level N' and 'compare'.
+    For each the profile holds the number of lookups which reached it
+    and the total time charged to it, in nanoseconds.
+    """
+
+    def __init__(self):
+        self._phases = OrderedDict()
+        self._lookups = 0
+
+    @property
+    def lookups(self):
+        """ Return the number of lookups profiled. """
+        return self._lookups
+
+    @property
+    def phases(self):
+        """ Return an ordered map from phase name to [count, total_ns]. """
+        return self._phases
+
+    def charge(self, phase, nanos):
+        """ Charge nanos to a phase. """
+        entry = self._phases.get(phase)
+        if entry is None:
+            entry = self._phases[phase] = [0, 0]
+        entry[0] += 1
+        entry[1] += nanos
+
+    def count_lookup(self):
+        """ Note that one more lookup has been profiled. """
+        self._lookups += 1
+
+    def ordered_phases(self):
+        """ Return (name, count, total_ns) tuples in trie order. """
+        def sort_key(name):
+            """ hash, root, levels in depth order, then compare. """
+            if name == 'hash':
+                return (0, 0)
+            if name == 'root':
+                return (1, 0)
+            if name == 'compare':
+                return (3, 0)
+            return (2, int(name.split()[1]))
+        return [(name, self._phases[name][0], self._phases[name][1])
+                for name in sorted(self._phases, key=sort_key)]
+
+    def total_ns(self):
+        """ Return the total time charged to all phases. """
+        return sum(entry[1] for entry in self._phases.values())
+
+    def report(self, out, baseline_ns=None):
+        """ Write a per-phase breakdown to out. """
+        lookups = max(self._lookups, 1)
+        total = max(self.total_ns(), 1)
+        out.write('%-10s %10s %12s %12s %7s\n' % (
+            'phase', 'reached', 'ns/visit', 'ns/lookup', 'share'))
+        for name, count, nanos in self.ordered_phases():
+            out.write('%-10s %10d %12.1f %12.1f %6.1f%%\n' % (
+                name, count, nanos / max(count, 1), nanos / lookups,
+                100.0 * nanos / total))
+        out.write('%-10s %10d %12s %12.1f\n' % (
+            'total', self._lookups, '', total / lookups))
+        if baseline_ns is not None:
+            out.write('uninstrumented find_leaf: %.1f ns/lookup\n' %
+                      baseline_ns)
+
+# FUNCTIONS
+
+
+def timer_overhead(trials=100000):
+    """ Return the cost in ns of one read of the clock, as used here. """
+    clock = time.perf_counter_ns
+    best = None
+    for _ in range(5):
+        start = clock()
+        for _ in range(trials):
+            clock()
+        elapsed = (clock() - start) / trials
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _profile_one(root, key, prof, overhead):
+    """
+    Look key up as Root.find_leaf() does, charging each step to prof.
+    Return the value found or None.
+    """
+    # pylint: disable=protected-access
+    clock = time.perf_counter_ns
+    prof.count_lookup()
+
+    hasher = root.hasher
+    start = clock()
+    hcode = hasher(key)
+    now = clock()
+    prof.charge('hash', max(now - start - overhead, 0))
+
+    start = clock()
+    node = root._slots[hcode & root._mask]
+    hcode >>= root._texp
+    now = clock()
+    prof.charge('root', max(now - start - overhead, 0))
+
+    depth = 0
+    while isinstance(node, Table):
+        depth += 1
+        start = clock()
+        if depth > root._max_table_depth:
+            node = None
+        elif isinstance(node, DenseTable):
+            ndx = hcode & node._mask
+            hcode >>= node._wexp
+            node = node._slots[ndx]
+        else:
+            flag = 1 << (hcode & node._mask)
+            if node._bitmap & flag:
+                mask = flag - 1
+                slot_nbr = popcount64(node._bitmap & mask) if mask else 0
+                hcode >>= node._wexp
+                node = node._slots[slot_nbr]
+            else:
+                node = None
+        now = clock()
+        prof.charge('level %d' % depth, max(now - start - overhead, 0))
+
+    value = None
+    if node is not None:
+        start = clock()
+        if node._key == key:
+            value = node._value
+        now = clock()
+        prof.charge('compare', max(now - start - overhead, 0))
+    return value
+
+
+def profile_lookups(root, keys, overhead=None):
+    """
+    Profile looking up each of keys in root; return a LevelProfile.
+
+    If overhead (the cost of reading the clock, in ns) is None it is
+    measured first.
+    """
+    if overhead is None:
+        overhead = timer_overhead()
+    prof = LevelProfile()
+    for key in keys:
+        _profile_one(root, key, prof, overhead)
+    return prof
+
+
+def _baseline_ns(root, keys, repeat=3):
+    """ Return the best mean cost in ns of root.find_leaf() over keys. """
+    clock = time.perf_counter_ns
+    find = root.find_leaf
+    best = None
+    for _ in range(repeat):
+        start = clock()
+        for key in keys:
+            find(key)
+        elapsed = (clock() - start) / max(len(keys), 1)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def read_keys(path, hex_keys=False):
+    """
+    Read keys from a file, one per line, skipping blank lines.
+
+    If hex_keys is set each line is decoded from hex; otherwise the
+    line's bytes, less the line ending, are the key.
+    """
+    keys = []
+    with open(path, 'rb') as file:
+        for line in file:
+            line = line.rstrip(b'\r\n')
+            if hex_keys:
+                line = binascii.unhexlify(line.strip())
+            if line:
+                keys.append(line)
+    return keys
+
+
+def main(argv=None):
+    """ Command line entry point; returns the process exit status. """
+    parser = argparse.ArgumentParser(
+        prog='python -m hamt.profile',
+        description='attribute hamt_py lookup time to hashing, each '
+        'trie level and the final key compare')
+    parser.add_argument('-k', '--keys',
+                        help='file of keys, one per line (default: '
+                        'synthetic random keys)')
+    parser.add_argument('-x', '--hex', action='store_true',
+                        help='keys in the file are hex encoded')
+    parser.add_argument('-n', '--count', type=int, default=100000,
+                        help='number of synthetic keys (default 100000)')
+    parser.add_argument('-z', '--key-size', type=int, default=20,
+                        help='size of synthetic keys in bytes (default 20)')
+    parser.add_argument('-w', '--wexp', type=int, default=5,
+                        help='log2 of Table width (default 5)')
+    parser.add_argument('-t', '--texp', type=int, default=8,
+                        help='log2 of Root width (default 8)')
+    parser.add_argument('-f', '--full-width-depth', type=int, default=0,
+                        help='Tables down to this depth are DenseTables '
+                        '(default 0)')
+    parser.add_argument('-s', '--samples', type=int, default=10000,
+                        help='number of lookups to sample (default 10000)')
+    parser.add_argument('-m', '--misses', type=float, default=0.0,
+                        help='fraction of sampled lookups which are for '
+                        'absent keys (default 0.0)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for key generation and sampling')
+    args = parser.parse_args(argv)
+
+    if args.keys:
+        keys = list(OrderedDict.fromkeys(read_keys(args.keys, args.hex)))
+    else:
+        keys = make_keys(args.count, args.key_size, args.seed)
+    if not keys:
+        sys.stderr.write('no keys to profile\n')
+        return 1
+
+    root = Root(args.wexp, args.texp, args.full_width_depth)
+    for key in keys:
+        root.insert_leaf(Leaf(key, key))
+
+    rng = random.Random(args.seed)
+    nmiss = int(args.samples * args.misses)
+    sample = [rng.choice(keys) for _ in range(args.samples - nmiss)]
+    if nmiss:
+        key_size = max(len(key) for key in keys)
+        sample += make_keys(nmiss, key_size, args.seed + 1, exclude=keys)
+        rng.shuffle(sample)
+
+    overhead = timer_overhead()
+    prof = profile_lookups(root, sample, overhead)
+    sys.stdout.write(
+        '%d keys, wexp=%d texp=%d, %d tables; %d lookups sampled '
+        '(%d misses); clock overhead %.1f ns\n' % (
+            len(keys), args.wexp, args.texp, root.table_count,
+            len(sample), nmiss, overhead))
+    prof.report(sys.stdout, _baseline_ns(root, sample))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
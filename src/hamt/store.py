@@ -0,0 +1,241 @@
+# hamt/store.py
+
+"""
+Out-of-core values for hamt_py.
+
+A LazyRoot keeps its keys and the trie in memory but writes each value
+to a ValueStore, an append-only file, leaving in the Leaf only the
+value's offset in that file.  Values are read back on demand through an
+LRUCache bounded by the total size of the values it holds.
+"""
+
+import os
+import struct
+from collections import OrderedDict
+
+from hamt import HamtError, HamtNotFound, Leaf, Root
+
+__all__ = ['ValueStore', 'LRUCache', 'LazyRoot']
+
+# each record in a ValueStore is its length followed by the value
+_LENGTH = struct.Struct('>I')
+
+# CLASSES
+
+
+class ValueStore(object):
+    """
+    Append-only file of byte-string values, each addressed by the
+    offset at which it was written.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._file = open(path, 'a+b')
+        self._file.seek(0, os.SEEK_END)
+        self._end = self._file.tell()
+        self._dirty = False         # are there unflushed writes?
+
+    @property
+    def path(self):
+        """ Return the path to the file. """
+        return self._path
+
+    @property
+    def size(self):
+        """ Return the size of the file in bytes. """
+        return self._end
+
+    def put(self, value):
+        """ Append a value to the file; return its handle. """
+        if not isinstance(value, (bytes, bytearray)):
+            raise HamtError("stored values must be bytes, not %s" %
+                            type(value).__name__)
+        handle = self._end
+        self._file.write(_LENGTH.pack(len(value)))
+        self._file.write(value)
+        self._end += _LENGTH.size + len(value)
+        self._dirty = True
+        return handle
+
+    def get(self, handle):
+        """ Return the value whose handle is given. """
+        if not 0 <= handle < self._end:
+            raise HamtError("no value at offset %d" % handle)
+        if self._dirty:
+            self.flush()
+        fdesc = self._file.fileno()
+        header = os.pread(fdesc, _LENGTH.size, handle)
+        length = _LENGTH.unpack(header)[0]
+        return os.pread(fdesc, length, handle + _LENGTH.size)
+
+    def flush(self):
+        """ Flush buffered writes to the operating system. """
+        self._file.flush()
+        self._dirty = False
+
+    def close(self):
+        """ Close the file. """
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LRUCache(object):
+    """
+    Least-recently-used cache bounded by the total size of its values.
+
+    The size of a value is sizeof(value), len() by default.  A value
+    bigger than the whole cache is never kept.
+    """
+
+    def __init__(self, max_bytes, sizeof=len):
+        if max_bytes < 0:
+            raise HamtError("cache size cannot be negative, is %d" %
+                            max_bytes)
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()       # key -> (value, size)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        """ Return the most the cache's values may add up to. """
+        return self._max_bytes
+
+    @property
+    def current_bytes(self):
+        """ Return the total size of the values now cached. """
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """ Return the value cached for key, or None. """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        """ Cache a value, evicting the least recently used as needed. """
+        size = self._sizeof(value)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        if size > self._max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    def discard(self, key):
+        """ Drop key from the cache if it is there. """
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+
+    def clear(self):
+        """ Empty the cache. """
+        self._entries.clear()
+        self._bytes = 0
+
+
+class LazyRoot(Root):
+    """
+    Root whose values live in a ValueStore.
+
+    Each Leaf holds the handle of its value in the store rather than the
+    value itself.  find_leaf() and items() read values back through an
+    LRUCache of at most cache_bytes.  Values must be bytes.  Replacing
+    or deleting a value leaves the old copy in the store's file.
+    """
+
+    def __init__(self, wexp, texp, store, cache_bytes=1 << 24, **kwargs):
+        super(LazyRoot, self).__init__(wexp, texp, **kwargs)
+        self._store = store
+        self._cache = LRUCache(cache_bytes)
+
+    @property
+    def store(self):
+        """ Return the ValueStore holding the values. """
+        return self._store
+
+    @property
+    def cache(self):
+        """ Return the LRUCache of values recently read. """
+        return self._cache
+
+    def _load(self, handle):
+        """ Return the value with the given handle, via the cache. """
+        value = self._cache.get(handle)
+        if value is None:
+            value = self._store.get(handle)
+            self._cache.put(handle, value)
+        return value
+
+    def handle_of(self, key):
+        """ Return the store handle of key's value, or None. """
+        return super(LazyRoot, self).find_leaf(key)
+
+    def find_leaf(self, key):
+        """
+        Find a Leaf entry given its key and return its value, read from
+        the store if it is not cached, or None if there is no such key.
+        """
+        handle = super(LazyRoot, self).find_leaf(key)
+        if handle is None:
+            return None
+        return self._load(handle)
+
+    def insert_leaf(self, leaf):
+        """ Write the Leaf's value to the store and insert its key. """
+        handle = self._store.put(leaf.value)
+        super(LazyRoot, self).insert_leaf(Leaf(leaf.key, handle))
+
+    def _make_leaf(self, key, value):
+        """ Write value to the store; return a Leaf holding its handle. """
+        return Leaf(key, self._store.put(value))
+
+    def update(self, key, func, default=None):
+        """
+        As for Root.update(), but func is applied to the stored value
+        and the new value is appended to the store.
+        """
+        leaf = self._get_leaf(key)
+        if leaf is None:
+            if default is None:
+                raise HamtNotFound
+            value = func(default)
+            self.insert_leaf(Leaf(key, value))
+        else:
+            value = func(self._load(leaf.value))
+            leaf.value = self._store.put(value)
+        return value
+
+    def _like(self):
+        """
+        Return an empty LazyRoot with the same parameters, sharing this
+        one's ValueStore but with a cache of its own.
+        """
+        return LazyRoot(self._wexp, self._texp, self._store,
+                        self._cache.max_bytes, **self._params())
+
+    def items(self, prefix=None, start=None, stop=None):
+        """ As for Root.items(), loading each value. """
+        for key, handle in super(LazyRoot, self).items(prefix, start, stop):
+            yield key, self._load(handle)
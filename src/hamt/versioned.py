@@ -0,0 +1,366 @@
+# hamt/versioned.py
+
+"""
+Multi-version reads for hamt_py.
+
+A VersionedRoot numbers its states: each insert_leaf(), delete_leaf()
+or update() makes a new version, as does each apply_batch() as a whole.
+Tables and Leafs are never changed once a version is made; a change
+copies the Tables on the path from the Root slot to the key (path
+copying) and hooks the copies into the slot, so that every version
+shares all but a path's worth of nodes with the one before it.  For
+each Root slot it keeps the succession of nodes the slot has held,
+with the version from which each was current, and so finds the node
+any retained version had in a slot by a binary search.  A log of the
+changes made, in order, gives changes_since().
+
+Lookups without a version see the newest state and cost what they do
+in a Root.  A Snapshot pins a version for a reader; versions older
+than the last history ones are dropped, along with the nodes only
+they use, once no Snapshot holds them.
+
+Values must not be changed in place, as every version holding a Leaf
+would see the change.  detach(), extract() and split() are not
+supported.
+"""
+
+import bisect
+
+from xlutil import popcount64
+
+from hamt import (DenseTable, HamtError, HamtNotFound, Leaf, Root, Table,
+                  stored_key)
+
+__all__ = ['Snapshot', 'VersionedRoot']
+
+# CLASSES
+
+
+class Snapshot(object):
+    """
+    A reader's view of a VersionedRoot as of one version.  The version
+    is kept until release() is called or the with block using the
+    Snapshot ends.
+    """
+
+    def __init__(self, root, version):
+        self._root = root
+        self._version = version
+        self._released = False
+
+    @property
+    def version(self):
+        """ Return the version seen. """
+        return self._version
+
+    def find_leaf(self, key):
+        """ Return the value of key as of this version, or None. """
+        return self._root.find_leaf(key, self._version)
+
+    def items(self):
+        """ Yield a (key, value) pair for each entry in this version. """
+        return self._root.items_at(self._version)
+
+    def release(self):
+        """ Let the version go; the Snapshot cannot be used after this. """
+        if not self._released:
+            self._released = True
+            # pylint: disable=protected-access
+            self._root._release(self._version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class VersionedRoot(Root):
+    """
+    Root keeping its last history versions, and any older ones held by
+    a Snapshot, readable by version.  Other keyword arguments are
+    passed to Root.
+    """
+
+    def __init__(self, wexp, texp, history=64, **kwargs):
+        super(VersionedRoot, self).__init__(wexp, texp, **kwargs)
+        if history < 1:
+            raise HamtError("history must be positive, is %d" % history)
+        self._history = history
+        self._version = 0
+        self._oldest = 0
+        # slot index -> [(version, node current from that version)]
+        self._slot_history = {}
+        # change log: versions, and (key, value, slot index) for each
+        self._log_versions = []
+        self._log = []
+        self._readers = {}          # version -> number of Snapshots
+
+    @property
+    def version(self):
+        """ Return the newest version; 0 is the empty Root. """
+        return self._version
+
+    @property
+    def oldest_version(self):
+        """ Return the oldest version which can still be read. """
+        return self._oldest
+
+    @property
+    def history(self):
+        """ Return the number of recent versions always kept. """
+        return self._history
+
+    # reading -----------------------------------------------------------
+
+    def _check_version(self, version):
+        """ Raise HamtError unless version can be read. """
+        if not self._oldest <= version <= self._version:
+            raise HamtError(
+                "version %d is not in %d..%d" % (
+                    version, self._oldest, self._version))
+
+    def _slot_at(self, ndx, version):
+        """ Return the node in Root slot ndx as of version. """
+        succession = self._slot_history.get(ndx)
+        if not succession:
+            return None
+        pos = bisect.bisect_left(succession, (version + 1,))
+        if pos == 0:
+            return None
+        return succession[pos - 1][1]
+
+    def find_leaf(self, key, version=None):
+        """
+        Find a Leaf entry given its key and return its value, as of
+        version if that is given, or None if there is no such entry.
+        Raise HamtError if the version is no longer kept.
+        """
+        if version is None or version == self._version:
+            return super(VersionedRoot, self).find_leaf(key)
+        self._check_version(version)
+        hcode = self._hasher(key)
+        node = self._slot_at(hcode & self._mask, version)
+        hcode >>= self._texp
+        while isinstance(node, Table):
+            ndx = hcode & node.mask
+            hcode >>= node.wexp
+            node = node.child_at(ndx)
+        if node is not None and node.key == key:
+            return node.value
+        if self.miss_hook is not None:
+            self.miss_hook(key)
+        return None
+
+    def items_at(self, version):
+        """
+        Yield a (key, value) pair for each entry as of version, in slot
+        order.  The version should be held by a Snapshot if writes may
+        happen while the iteration is under way.
+        """
+        self._check_version(version)
+        for ndx in range(self._slot_count):
+            stack = [self._slot_at(ndx, version)]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, Leaf):
+                    yield node.key, node.value
+                elif node is not None:
+                    stack.extend(child for _, child in
+                                 reversed(list(node.indexed_slots())))
+
+    def changes_since(self, version):
+        """
+        Return a list of (version, key, value) for each change made
+        after version, in order; value is None where key was deleted.
+        Applying these to a copy as of version brings it up to date.
+        Raise HamtError if changes that old are no longer kept.
+        """
+        self._check_version(version)
+        pos = bisect.bisect_right(self._log_versions, version)
+        return [(self._log_versions[ndx], key, value)
+                for ndx, (key, value, _) in enumerate(self._log[pos:], pos)]
+
+    def snapshot(self, version=None):
+        """
+        Return a Snapshot of version, by default the newest, which is
+        kept until the Snapshot is released.
+        """
+        if version is None:
+            version = self._version
+        self._check_version(version)
+        self._readers[version] = self._readers.get(version, 0) + 1
+        return Snapshot(self, version)
+
+    def _release(self, version):
+        """ Drop a Snapshot's hold on version. """
+        count = self._readers[version] - 1
+        if count:
+            self._readers[version] = count
+        else:
+            del self._readers[version]
+            self.collect()
+
+    # writing -----------------------------------------------------------
+
+    def _copy(self, table):
+        """ Return a copy of table which may be changed. """
+        # pylint: disable=protected-access
+        return table._copy_as(type(table), list(table.slots))
+
+    def _put(self, node, hcode, depth, leaf):
+        """
+        Return a new node holding what node does and leaf, replacing
+        any entry for leaf's key; node itself is left unchanged.
+        """
+        if node is None:
+            return leaf
+        if isinstance(node, Leaf):
+            if node.key == leaf.key:
+                return leaf
+            self.check_split(node.key, leaf.key)
+            if depth > self._max_table_depth:
+                raise HamtError(
+                    "max table depth (%d) exceeded" % self._max_table_depth)
+            # a new Table, changed only while it is private to us
+            table = self.make_table(depth, node)
+            return table.insert_leaf(hcode, leaf)
+        ndx = hcode & node.mask
+        child = node.child_at(ndx)
+        copy = self._copy(node)
+        if child is None:
+            return copy.insert_leaf(hcode, leaf)
+        return copy.replace_child(
+            ndx, self._put(child, hcode >> node.wexp, depth + 1, leaf))
+
+    def _cut(self, node, hcode, depth, key):
+        """
+        Return a new node holding what node does less key's entry, or
+        raise HamtNotFound; node itself is left unchanged.
+        """
+        if node is None:
+            raise HamtNotFound
+        if isinstance(node, Leaf):
+            if node.key != key:
+                raise HamtNotFound
+            return None
+        ndx = hcode & node.mask
+        child = node.child_at(ndx)
+        if child is None:
+            raise HamtNotFound
+        result = self._copy(node).replace_child(
+            ndx, self._cut(child, hcode >> node.wexp, depth + 1, key))
+        threshold = self._dense_threshold
+        if isinstance(result, DenseTable) and threshold and \
+                depth > self._full_width_depth and \
+                popcount64(result.bitmap) < threshold // 2:
+            result = result.to_compact()
+        return result
+
+    def _apply(self, changes, skip_absent=False):
+        """
+        Make changes, (key, value) pairs with stored keys where a value
+        of None deletes the key, as a single new version.  Every new
+        node is built before any is installed, so that if a change
+        fails the version, the slots and the log are left as they
+        were.  Deleting an absent key raises HamtNotFound, unless
+        skip_absent is set, in which case it is ignored.  Nothing is
+        done if nothing changes.
+        """
+        hasher, mask, texp = self._hasher, self._mask, self._texp
+        changed = {}            # Root slot index -> its new node
+        log = []
+        for key, value in changes:
+            hcode = hasher(key)
+            ndx = hcode & mask
+            node = changed[ndx] if ndx in changed else self._slots[ndx]
+            try:
+                if value is None:
+                    node = self._cut(node, hcode >> texp, 1, key)
+                else:
+                    node = self._put(node, hcode >> texp, 1,
+                                     self._make_leaf(key, value))
+            except HamtNotFound:
+                if not skip_absent:
+                    raise
+                continue
+            changed[ndx] = node
+            log.append((key, value, ndx))
+        if not log:
+            return
+
+        version = self._version + 1
+        for ndx, node in changed.items():
+            self._slots[ndx] = node
+            self._slot_history.setdefault(ndx, []).append((version, node))
+        self._log_versions.extend([version] * len(log))
+        self._log.extend(log)
+        self._version = version
+        self.collect()
+
+    def insert_leaf(self, leaf):
+        """ Insert a Leaf into or below the Root, as a new version. """
+        self._apply([(leaf.key, leaf.value)])
+
+    def delete_leaf(self, key):
+        """ Delete a Leaf given its key, as a new version. """
+        self._apply([(stored_key(key), None)])
+
+    def update(self, key, func, default=None):
+        """ As for Root.update(), the new value making a new version. """
+        leaf = self._get_leaf(key)
+        if leaf is None:
+            if default is None:
+                raise HamtNotFound
+            value = func(default)
+        else:
+            value = func(leaf.value)
+        self._apply([(stored_key(key), value)])
+        return value
+
+    def apply_batch(self, changes):
+        """
+        As for Root.apply_batch(), but all of the changes make a single
+        new version, unless none of them changes anything.  Deleting a
+        key which is absent is not an error and is not logged.  If any
+        change fails, none is made.
+        """
+        self._apply(((stored_key(key), value) for key, value in changes),
+                    skip_absent=True)
+
+    def detach(self, path):
+        """ Not supported: raise HamtError. """
+        raise HamtError("a VersionedRoot cannot detach subtrees")
+
+    def split(self, nparts):
+        """ Not supported: raise HamtError. """
+        raise HamtError("a VersionedRoot cannot be split")
+
+    # garbage collection ------------------------------------------------
+
+    def collect(self):
+        """
+        Forget the versions older than both the last history versions
+        and the oldest held by a Snapshot, and the nodes only they use.
+        This is done after every change and release; it costs time in
+        proportion to the changes forgotten.
+        """
+        oldest = max(0, self._version - self._history + 1)
+        if self._readers:
+            oldest = min(oldest, min(self._readers))
+        if oldest <= self._oldest:
+            return
+        self._oldest = oldest
+        pos = bisect.bisect_right(self._log_versions, oldest)
+        for _, _, ndx in self._log[:pos]:
+            succession = self._slot_history.get(ndx)
+            if succession is None:
+                continue
+            # keep the node current at oldest and all after it
+            keep = bisect.bisect_left(succession, (oldest + 1,)) - 1
+            if keep > 0:
+                del succession[:keep]
+            if len(succession) == 1 and succession[0][1] is None:
+                del self._slot_history[ndx]
+        del self._log_versions[:pos]
+        del self._log[:pos]
@@ -0,0 +1,186 @@
+# hamt/visitor.py
+
+"""
+Visitor interface for hamt_py.
+
+A Visitor is walked over a Root (or any Table) by walk(), which calls
+pre_visit() on entering each Root or Table, visit_leaf() on each Leaf
+and post_visit() on leaving each Root or Table.  If pre_visit() returns
+False the node's children are skipped, as is its post_visit().
+
+Depth is 0 for the Root and one more for each level below it, so a Leaf
+or Table in a Root slot is at depth 1, matching Table.depth.
+
+walk_parallel() walks the subtrees under the Root's slots in a pool of
+worker processes.  Each worker walks a range of slots with a fresh
+Visitor obtained from spawn(), and the results are folded back into the
+caller's Visitor with merge(), in slot order.
+"""
+
+import multiprocessing
+
+from hamt import Leaf, Root
+
+__all__ = ['Visitor', 'CountingVisitor', 'walk', 'walk_parallel']
+
+# CLASSES
+
+
+class Visitor(object):
+    """
+    Base class for visitors; each hook does nothing by default.
+
+    Subclasses which are to be used with walk_parallel() must be
+    picklable and implement merge().
+    """
+
+    def pre_visit(self, node, depth):
+        """
+        Called on entering a Root or Table.  Return False to skip the
+        node's children.
+        """
+        # pylint: disable=unused-argument,no-self-use
+        return True
+
+    def visit_leaf(self, leaf, depth):
+        """ Called for each Leaf. """
+
+    def post_visit(self, node, depth):
+        """ Called on leaving a Root or Table whose children were walked. """
+
+    def spawn(self):
+        """ Return a fresh Visitor of the same kind, for a worker. """
+        return type(self)()
+
+    def merge(self, other):
+        """ Fold the results of a worker's Visitor into this one. """
+        raise NotImplementedError(
+            "%s does not support parallel walks" % type(self).__name__)
+
+
+class CountingVisitor(Visitor):
+    """ Count Leafs and Tables, in total and by depth. """
+
+    def __init__(self):
+        self.leaves_at = {}
+        self.tables_at = {}
+
+    @property
+    def leaf_count(self):
+        """ Return the number of Leafs visited. """
+        return sum(self.leaves_at.values())
+
+    @property
+    def table_count(self):
+        """ Return the number of Tables visited, not counting the Root. """
+        return sum(self.tables_at.values())
+
+    def pre_visit(self, node, depth):
+        if depth:
+            self.tables_at[depth] = self.tables_at.get(depth, 0) + 1
+        return True
+
+    def visit_leaf(self, leaf, depth):
+        self.leaves_at[depth] = self.leaves_at.get(depth, 0) + 1
+
+    def merge(self, other):
+        for depth, count in other.leaves_at.items():
+            self.leaves_at[depth] = self.leaves_at.get(depth, 0) + count
+        for depth, count in other.tables_at.items():
+            self.tables_at[depth] = self.tables_at.get(depth, 0) + count
+
+# FUNCTIONS
+
+
+def _children(node):
+    """ Return a Root's or Table's slots which are in use, in order. """
+    return [child for child in node.slots if child is not None]
+
+
+def walk(node, visitor, depth=0):
+    """
+    Walk visitor over node and everything below it, depth first and in
+    slot order, without recursing.  node may be a Root, a Table or a
+    Leaf; depth is the depth of node.  Return the visitor.
+    """
+    if isinstance(node, Leaf):
+        visitor.visit_leaf(node, depth)
+        return visitor
+    if not visitor.pre_visit(node, depth):
+        return visitor
+
+    # each stack entry is (children, next child to visit, depth of node)
+    stack = [(_children(node), 0, depth)]
+    parents = [node]
+    while stack:
+        children, ndx, level = stack[-1]
+        if ndx == len(children):
+            stack.pop()
+            visitor.post_visit(parents.pop(), level)
+            continue
+        stack[-1] = (children, ndx + 1, level)
+        child = children[ndx]
+        if isinstance(child, Leaf):
+            visitor.visit_leaf(child, level + 1)
+        elif visitor.pre_visit(child, level + 1):
+            stack.append((_children(child), 0, level + 1))
+            parents.append(child)
+    return visitor
+
+
+# set in the parent just before the pool forks, inherited by the workers
+_SHARED = None
+
+
+def _walk_slot_range(bounds):
+    """ Walk a fresh visitor over a range of the shared Root's slots. """
+    root, prototype = _SHARED
+    visitor = prototype.spawn()
+    for node in root.slots[bounds[0]:bounds[1]]:
+        if node is not None:
+            walk(node, visitor, 1)
+    return visitor
+
+
+def walk_parallel(root, visitor, processes=None, chunks_per_process=4):
+    """
+    Walk visitor over root, sending ranges of root slots to a pool of
+    worker processes, and return the visitor.
+
+    Workers inherit the trie by forking, so nothing is copied to them
+    but the slot ranges; where fork is not available the walk is done
+    in this process.  The visitor's pre_visit() and post_visit() are
+    called for the Root here, and each worker's results are merged
+    into it in slot order.
+    """
+    # pylint: disable=global-statement
+    global _SHARED
+
+    if not isinstance(root, Root):
+        raise TypeError("walk_parallel() needs a Root")
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return walk(root, visitor)
+    if not visitor.pre_visit(root, 0):
+        return visitor
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    nchunks = max(1, min(root.slot_count, processes * chunks_per_process))
+    step = -(-root.slot_count // nchunks)
+    bounds = [(first, min(first + step, root.slot_count))
+              for first in range(0, root.slot_count, step)]
+
+    _SHARED = (root, visitor)
+    try:
+        pool = multiprocessing.get_context('fork').Pool(processes)
+        try:
+            for result in pool.imap(_walk_slot_range, bounds):
+                visitor.merge(result)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _SHARED = None
+
+    visitor.post_visit(root, 0)
+    return visitor
@@ -0,0 +1,409 @@
+# hamt/wal.py
+
+"""
+Durability for a mutable Root: snapshots plus a write-ahead log.
+
+A JournaledRoot records each insert_leaf() and delete_leaf() in a
+WriteAheadLog as it applies it; a change is logged only once the trie
+has taken it, so that a change the trie refuses never reaches the log
+to be refused again by every recovery.  Log records are buffered and
+written and fsync'ed in groups (group commit), so a burst of updates
+costs one fsync rather than one each; a record is durable once commit()
+has returned, whether called explicitly, triggered by the group filling
+up, or run by a timer group_delay seconds after the group's first
+record.  checkpoint() writes a snapshot of the whole map and empties
+the log.
+
+After a crash, recover() loads the last snapshot and replays the log on
+top of it.  Both are applied with Root.apply_batch(), which builds each
+affected subtree in a single pass, so a restart with a large log costs
+little more than loading the snapshot.  A torn record at the end of the
+log, left by a crash in the middle of a write, is discarded.
+
+Keys and values must be bytes.
+"""
+
+import itertools
+import os
+import struct
+import threading
+import time
+import zlib
+
+from hamt import HamtError, HamtNotFound, Leaf, Root
+
+__all__ = ['WriteAheadLog', 'JournaledRoot',
+           'read_log', 'write_snapshot', 'read_snapshot', 'recover']
+
+# CONSTANTS
+
+# a log record is a header (op, key length, value length), the key,
+# the value and a CRC32 of all that
+_HEADER = struct.Struct('>cII')
+_CRC = struct.Struct('>I')
+_INSERT = b'I'
+_DELETE = b'D'
+
+# a snapshot is the magic string and a count, then (key length, value
+# length, key, value) for each entry
+_SNAP_MAGIC = b'HAMTSNP1'
+_SNAP_COUNT = struct.Struct('>Q')
+_SNAP_ENTRY = struct.Struct('>II')
+
+# FUNCTIONS
+
+
+def _encode(oper, key, value):
+    """ Return a log record as bytes. """
+    body = _HEADER.pack(oper, len(key), len(value)) + key + value
+    return body + _CRC.pack(zlib.crc32(body) & 0xffffffff)
+
+
+def _scan_log(data):
+    """
+    Yield (end_offset, key, value) for each sound record in data, a
+    log's contents, stopping at the first damaged or incomplete one.
+    value is None for a deletion.
+    """
+    offset = 0
+    size = len(data)
+    while offset + _HEADER.size <= size:
+        oper, klen, vlen = _HEADER.unpack_from(data, offset)
+        end = offset + _HEADER.size + klen + vlen
+        if oper not in (_INSERT, _DELETE) or end + _CRC.size > size:
+            return
+        crc = _CRC.unpack_from(data, end)[0]
+        if zlib.crc32(data[offset:end]) & 0xffffffff != crc:
+            return
+        key = data[offset + _HEADER.size:offset + _HEADER.size + klen]
+        value = data[end - vlen:end] if oper == _INSERT else None
+        offset = end + _CRC.size
+        yield offset, key, value
+
+
+def read_log(path):
+    """
+    Yield (key, value) for each sound record in the log at path, in
+    order; value is None for a deletion.  Yield nothing if there is no
+    log.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as file:
+        data = file.read()
+    for _, key, value in _scan_log(data):
+        yield key, value
+
+
+def _fsync_dir(path):
+    """ Make a rename or creation in path's directory durable. """
+    if hasattr(os, 'O_DIRECTORY'):
+        fdesc = os.open(os.path.dirname(os.path.abspath(path)),
+                        os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fdesc)
+        finally:
+            os.close(fdesc)
+
+
+def write_snapshot(root, path):
+    """
+    Write every entry in root to a snapshot file at path, atomically:
+    the file is written under a temporary name and renamed into place.
+    """
+    pairs = list(root.items())
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(_SNAP_MAGIC)
+        file.write(_SNAP_COUNT.pack(len(pairs)))
+        for key, value in pairs:
+            file.write(_SNAP_ENTRY.pack(len(key), len(value)))
+            file.write(key)
+            file.write(value)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def read_snapshot(path):
+    """
+    Yield (key, value) for each entry in the snapshot at path, or
+    nothing if there is no snapshot.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:len(_SNAP_MAGIC)] != _SNAP_MAGIC:
+        raise HamtError("%s is not a hamt snapshot" % path)
+    offset = len(_SNAP_MAGIC)
+    count = _SNAP_COUNT.unpack_from(data, offset)[0]
+    offset += _SNAP_COUNT.size
+    for _ in range(count):
+        klen, vlen = _SNAP_ENTRY.unpack_from(data, offset)
+        offset += _SNAP_ENTRY.size
+        key = data[offset:offset + klen]
+        offset += klen
+        value = data[offset:offset + vlen]
+        offset += vlen
+        if len(value) != vlen:
+            raise HamtError("snapshot %s is truncated" % path)
+        yield key, value
+
+
+def recover(snapshot_path, log_path, wexp, texp, group_size=64,
+            group_delay=0.01, **kwargs):
+    """
+    Rebuild a map from its last snapshot and the log of changes since,
+    and return it as a JournaledRoot which appends to the same log.
+
+    Other keyword arguments are passed to Root.
+    """
+    wal = WriteAheadLog(log_path, group_size, group_delay)
+    root = JournaledRoot(wexp, texp, wal, snapshot_path, **kwargs)
+    # apply without logging: these changes are already durable
+    Root.apply_batch(root, itertools.chain(read_snapshot(snapshot_path),
+                                           read_log(log_path)))
+    return root
+
+
+# CLASSES
+
+
+class WriteAheadLog(object):
+    """
+    Append-only log of insertions and deletions with group commit.
+
+    Records are buffered until group_size of them are pending, or the
+    oldest pending one is group_delay seconds old, or commit() is
+    called; they are then written and fsync'ed together.  The age of
+    a group is checked when a record is appended and by a timer
+    thread, so a record is committed within about group_delay seconds
+    even if no other follows it.  An error in a commit run by the
+    timer is raised by the next call to log or commit.  Opening an
+    existing log discards any damaged records at its end.
+    """
+
+    def __init__(self, path, group_size=64, group_delay=0.01):
+        if group_size < 1:
+            raise HamtError("group_size must be positive, is %d" %
+                            group_size)
+        self._path = path
+        self._group_size = group_size
+        self._group_delay = group_delay
+        self._pending = []
+        self._oldest = None         # when the oldest pending record came
+        self._lock = threading.Lock()   # the timer commits from a thread
+        self._timer = None
+        self._error = None          # raised by a commit the timer ran
+        self.commits = 0
+        self.records = 0
+
+        # drop any torn record left at the end by a crash
+        sound = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                data = file.read()
+            for sound, _, _ in _scan_log(data):
+                pass
+            if sound != len(data):
+                with open(path, 'r+b') as file:
+                    file.truncate(sound)
+        self._file = open(path, 'ab')
+        _fsync_dir(path)
+
+    @property
+    def path(self):
+        """ Return the path to the log file. """
+        return self._path
+
+    @property
+    def pending(self):
+        """ Return the number of records not yet committed. """
+        return len(self._pending)
+
+    def _append(self, record):
+        """ Buffer a record, committing the group if it is due. """
+        with self._lock:
+            self._check_error()
+            if not self._pending:
+                self._oldest = time.monotonic()
+                if self._group_delay > 0:
+                    self._timer = threading.Timer(self._group_delay,
+                                                  self._commit_aged)
+                    self._timer.daemon = True
+                    self._timer.start()
+            self._pending.append(record)
+            if len(self._pending) >= self._group_size or \
+                    time.monotonic() - self._oldest >= self._group_delay:
+                self._write()
+
+    def _commit_aged(self):
+        """ Commit the pending group, from the timer thread. """
+        with self._lock:
+            try:
+                self._write()
+            except (OSError, ValueError) as exc:
+                self._error = exc
+
+    def _check_error(self):
+        """ Raise any error met by a commit the timer ran. """
+        if self._error is not None:
+            exc, self._error = self._error, None
+            raise exc
+
+    def _write(self):
+        """ Write and fsync all pending records; the lock is held. """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        self._file.write(b''.join(self._pending))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.records += len(self._pending)
+        self.commits += 1
+        self._pending = []
+        self._oldest = None
+
+    def log_insert(self, key, value):
+        """ Log the insertion of key with value. """
+        self._append(_encode(_INSERT, key, value))
+
+    def log_delete(self, key):
+        """ Log the deletion of key. """
+        self._append(_encode(_DELETE, key, b''))
+
+    def commit(self):
+        """ Write and fsync all pending records. """
+        with self._lock:
+            self._check_error()
+            self._write()
+
+    def truncate(self):
+        """ Discard every record, committed or not. """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending = []
+            self._oldest = None
+            self._error = None
+            self._file.truncate(0)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """ Commit pending records and close the log. """
+        with self._lock:
+            try:
+                self._check_error()
+                self._write()
+            finally:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JournaledRoot(Root):
+    """
+    Root which logs each change to a WriteAheadLog before making it.
+
+    checkpoint() writes the whole map to snapshot_path and then empties
+    the log; recover() rebuilds a JournaledRoot from the two.
+    """
+
+    def __init__(self, wexp, texp, wal, snapshot_path, **kwargs):
+        super(JournaledRoot, self).__init__(wexp, texp, **kwargs)
+        self._wal = wal
+        self._snapshot_path = snapshot_path
+
+    @property
+    def wal(self):
+        """ Return the WriteAheadLog. """
+        return self._wal
+
+    @property
+    def snapshot_path(self):
+        """ Return the path checkpoint() writes snapshots to. """
+        return self._snapshot_path
+
+    def insert_leaf(self, leaf):
+        """ Insert the Leaf, then log the insertion. """
+        super(JournaledRoot, self).insert_leaf(leaf)
+        self._wal.log_insert(leaf.key, leaf.value)
+
+    def delete_leaf(self, key):
+        """ Delete the Leaf, then log the deletion. """
+        super(JournaledRoot, self).delete_leaf(key)
+        self._wal.log_delete(key)
+
+    def update(self, key, func, default=None):
+        """
+        As for Root.update(), logging the new value once it has replaced
+        the old one.  If key is absent, the insertion of func(default)
+        is logged by insert_leaf().
+        """
+        leaf = self._get_leaf(key)
+        if leaf is None:
+            if default is None:
+                raise HamtNotFound
+            value = func(default)
+            self.insert_leaf(Leaf(key, value))
+        else:
+            value = func(leaf.value)
+            leaf.value = value
+            self._wal.log_insert(leaf.key, value)
+        return value
+
+    def apply_batch(self, changes):
+        """
+        Apply a batch of changes, then log it.  If the batch is refused
+        the trie is left unchanged and nothing is logged.
+        """
+        changes = list(changes)
+        super(JournaledRoot, self).apply_batch(changes)
+        for key, value in changes:
+            if value is None:
+                self._wal.log_delete(key)
+            else:
+                self._wal.log_insert(key, value)
+
+    def detach(self, path):
+        """
+        As for Root.detach(), logging the deletion of each entry
+        detached, which costs time in proportion to their number.
+        """
+        node = super(JournaledRoot, self).detach(path)
+        for leaf in self.leaves_under(node):
+            self._wal.log_delete(leaf.key)
+        return node
+
+    def split(self, nparts):
+        """
+        As for Root.split(); the parts are plain Roots, and the
+        deletion of every entry from this one is logged.
+        """
+        for key, _ in self.items():
+            self._wal.log_delete(key)
+        return super(JournaledRoot, self).split(nparts)
+
+    def commit(self):
+        """ Make every change so far durable. """
+        self._wal.commit()
+
+    def checkpoint(self):
+        """ Write a snapshot of the map, then empty the log. """
+        self._wal.commit()
+        write_snapshot(self, self._snapshot_path)
+        self._wal.truncate()
+
+    def close(self):
+        """ Commit pending changes and close the log. """
+        self._wal.close()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# hamt_py/test_bench.py
+
+""" Test the hamt_py benchmark suite's bookkeeping. """
+
+import os
+import unittest
+
+from hamt import Leaf, Root
+from hamt.bench import (compare_results, make_keys, memory_usage,
+                        run_suites, walk_leaves)
+
+
+class TestBench(unittest.TestCase):
+    """ Test the hamt_py benchmark suite's bookkeeping. """
+
+    def test_make_keys(self):
+        """ Keys are distinct, sized, reproducible and honor exclude. """
+        keys = make_keys(100, 8, seed=7)
+        self.assertEqual(len(set(keys)), 100)
+        for key in keys:
+            self.assertEqual(len(key), 8)
+        self.assertEqual(keys, make_keys(100, 8, seed=7))
+        others = make_keys(100, 8, seed=7, exclude=keys)
+        self.assertFalse(set(keys) & set(others))
+
+    def test_walk_leaves(self):
+        """ walk_leaves() finds every Leaf, however deep. """
+        root = Root(2, 2)
+        keys = make_keys(200, 8)
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+        found = sorted(leaf.key for leaf in walk_leaves(root))
+        self.assertEqual(found, sorted(keys))
+
+    def test_tiny_grid(self):
+        """ A tiny grid produces a record per op per implementation. """
+        grid = {'wexp': [3], 'texp': [4], 'key_size': [8], 'size': [64]}
+        doc = run_suites(['grid'], grid, repeat=1)
+        impls = set(rec['impl'] for rec in doc['results'])
+        self.assertEqual(impls, set(['hamt', 'dict', 'OrderedDict']))
+        ops = set(rec['op'] for rec in doc['results'])
+        self.assertEqual(ops, set(['insert', 'lookup_hit', 'lookup_miss',
+                                   'delete', 'iterate', 'bulk_load',
+                                   'memory']))
+        for rec in doc['results']:
+            self.assertTrue(rec['value'] >= 0)
+
+    @unittest.skipUnless(hasattr(os, 'fork') and memory_usage() is not None,
+                         'needs fork and /proc/PID/smaps_rollup')
+    def test_tiny_prefork(self):
+        """ The prefork suite reports memory use for each layout. """
+        grid = {'wexp': [3], 'texp': [4], 'key_size': [8], 'size': [64]}
+        doc = run_suites(['prefork'], grid, repeat=1)
+        impls = set(rec['impl'] for rec in doc['results'])
+        self.assertEqual(impls, set(['hamt', 'hamt_gc_freeze', 'frozen']))
+        ops = set(rec['op'] for rec in doc['results'])
+        self.assertEqual(ops, set(['lookup_hit', 'rss', 'pss',
+                                   'private_dirty']))
+
+    def test_compare(self):
+        """ A slowdown beyond the threshold is reported. """
+        old = {'results': [
+            {'suite': 's', 'impl': 'hamt', 'op': 'insert',
+             'params': {'size': 1}, 'value': 100.0, 'unit': 'ns/op'},
+            {'suite': 's', 'impl': 'hamt', 'op': 'delete',
+             'params': {'size': 1}, 'value': 100.0, 'unit': 'ns/op'}]}
+        new = {'results': [
+            {'suite': 's', 'impl': 'hamt', 'op': 'insert',
+             'params': {'size': 1}, 'value': 105.0, 'unit': 'ns/op'},
+            {'suite': 's', 'impl': 'hamt', 'op': 'delete',
+             'params': {'size': 1}, 'value': 150.0, 'unit': 'ns/op'}]}
+        rows, regressions = compare_results(old, new, threshold=0.10)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0][0][2], 'delete')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# hamt_py/test_bloom.py
+
+""" Test FilteredRoot and its negative-lookup filter. """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, HamtNotFound, Leaf
+from hamt.bloom import FilteredRoot
+
+
+class TestBloom(unittest.TestCase):
+    """ Test FilteredRoot and its negative-lookup filter. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def make_keys(self, count):
+        """ Return a list of count distinct random keys. """
+        keys = set()
+        while len(keys) < count:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        return list(keys)
+
+    def test_params(self):
+        """ Bad filter parameters are rejected. """
+        with self.assertRaises(HamtError):
+            FilteredRoot(4, 4, capacity=0)
+        with self.assertRaises(HamtError):
+            FilteredRoot(4, 4, bits_per_key=1)
+        root = FilteredRoot(4, 4, capacity=100, bits_per_key=10)
+        self.assertEqual(root.capacity, 100)
+        self.assertEqual(root.probes, 6)
+        self.assertEqual(root.filter_size, 1024)
+
+    def do_test_filter(self, **kwargs):
+        """ Check lookups, growth and deletes against a dict. """
+        keys = self.make_keys(2000)
+        present, absent = keys[:1000], keys[1000:]
+        root = FilteredRoot(3, 3, capacity=16, **kwargs)
+        for key in present:
+            root.insert_leaf(Leaf(key, key))
+        root.insert_leaf(Leaf(present[0], b'again'))
+        self.assertGreaterEqual(root.capacity, 1000)
+
+        # no false negatives, and few false positives
+        for key in present[1:]:
+            self.assertTrue(root.may_contain(key))
+            self.assertEqual(root.find_leaf(key), key)
+        self.assertEqual(root.find_leaf(present[0]), b'again')
+        passed = sum(1 for key in absent if root.may_contain(key))
+        self.assertLess(passed, 50)
+        for key in absent:
+            self.assertIsNone(root.find_leaf(key))
+
+        for key in present[:500]:
+            root.delete_leaf(key)
+        with self.assertRaises(HamtNotFound):
+            root.delete_leaf(present[0])
+        passed = sum(1 for key in present[:500] if root.may_contain(key))
+        self.assertLess(passed, 50)
+        for key in present[500:]:
+            self.assertEqual(root.find_leaf(key), key)
+
+        self.assertEqual(root.increment(absent[0]), 1)
+        self.assertTrue(root.may_contain(absent[0]))
+        root.apply_batch([(key, b'batch') for key in absent[1:100]])
+        for key in absent[1:100]:
+            self.assertEqual(root.find_leaf(key), b'batch')
+
+        # each part of a split gets a filter of its own
+        parts = root.split(2)
+        self.assertIsNone(root.find_leaf(present[600]))
+        for key in present[500:] + absent[1:100]:
+            part = parts[root.split_index(key, 2)]
+            self.assertIsInstance(part, FilteredRoot)
+            self.assertIsNotNone(part.find_leaf(key))
+
+    def test_counted_changes(self):
+        """ Batches and detaches count just the keys they change. """
+        # pylint: disable=protected-access
+        root = FilteredRoot(3, 3, capacity=2048)
+        keys = self.make_keys(3000)
+        root.apply_batch((key, key) for key in keys[:2000])
+        counters = root._counters
+
+        def check():
+            """ Each key present adds probes to the counters' total. """
+            self.assertEqual(sum(root._counters),
+                             root.probes * root.leaf_count)
+
+        check()
+        root.apply_batch([(keys[0], b'again'), (keys[1], None),
+                          (keys[1], b'back'), (keys[2], None),
+                          (keys[2000], b'new'), (keys[2001], None)])
+        self.assertIs(root._counters, counters)
+        self.assertEqual(root.leaf_count, 2000)
+        self.assertIsNone(root.find_leaf(keys[2]))
+        self.assertEqual(root.find_leaf(keys[1]), b'back')
+        check()
+
+        path = (root.hasher(keys[5]) & 7,)
+        part = root.extract(path)
+        self.assertIs(root._counters, counters)
+        self.assertEqual(root.leaf_count + part.leaf_count, 2000)
+        self.assertIsNone(root.find_leaf(keys[5]))
+        self.assertEqual(part.find_leaf(keys[5]), keys[5])
+        check()
+        self.assertEqual(sum(part._counters),
+                         part.probes * part.leaf_count)
+
+        # growing past capacity rebuilds the filter at twice the size
+        root.apply_batch((key, key) for key in keys[2000:])
+        self.assertEqual(root.capacity, 4096)
+        check()
+        for key in keys[3:]:
+            if part.find_leaf(key) is None:
+                self.assertEqual(root.find_leaf(key), key)
+
+    def test_filter(self):
+        """ The filter passes every key present, hashed or ordered. """
+        self.do_test_filter()
+        self.do_test_filter(ordered=True)
+        self.do_test_filter(dense_threshold=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# hamt_py/test_expiry.py
+
+""" Test ExpiringRoot's expiry and eviction. """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, HamtNotFound, Leaf
+from hamt.expiry import WHEEL_SLOTS, ExpiringRoot
+
+
+class FakeClock(object):
+    """ Clock which moves only when told to, or by step per reading. """
+
+    def __init__(self, now=1000.0, step=0.0):
+        self.now = now
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class TestExpiry(unittest.TestCase):
+    """ Test ExpiringRoot's expiry and eviction. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def make_keys(self, count):
+        """ Return a list of count distinct random keys. """
+        keys = set()
+        while len(keys) < count:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        return list(keys)
+
+    def test_params(self):
+        """ Bad parameters are rejected. """
+        with self.assertRaises(HamtError):
+            ExpiringRoot(4, 4, samples=0)
+        with self.assertRaises(HamtError):
+            ExpiringRoot(4, 4, tick=0)
+
+    def test_expiry(self):
+        """ Entries expire on time, in every ring of the wheel. """
+        # pylint: disable=protected-access
+        clock = FakeClock()
+        root = ExpiringRoot(3, 3, tick=0.5, clock=clock)
+        keys = self.make_keys(400)
+        ttls = {}
+        for ndx, key in enumerate(keys):
+            # TTLs reaching into each ring of the wheel
+            ttl = (0.3, 7.0, 400.0, 30000.0)[ndx % 4] * (1 + ndx / 400.0)
+            ttls[key] = ttl
+            root.insert_leaf(Leaf(key, key), ttl)
+        forever = b'no ttl'
+        root.insert_leaf(Leaf(forever, forever))
+        self.assertEqual(root.entry_count, 401)
+        self.assertIsNone(root.ttl(forever))
+        start = clock.now
+
+        for elapsed in (0.1, 0.7, 5.0, 10.0, 300.0, 700.0, 20000.0,
+                        WHEEL_SLOTS ** 2 + 1.0, 70000.0):
+            clock.now = start + elapsed
+            root.expire()
+            for key in keys:
+                if ttls[key] <= elapsed - 0.5:
+                    self.assertIsNone(root._get_leaf(key))
+                elif ttls[key] > elapsed:
+                    self.assertEqual(root.find_leaf(key), key)
+                    self.assertAlmostEqual(root.ttl(key),
+                                           ttls[key] - elapsed)
+            self.assertEqual(root.entry_count, root.leaf_count)
+            root.verify()
+        self.assertEqual(root.entry_count, 1)
+        self.assertEqual(root.expired, 400)
+        self.assertEqual(root.find_leaf(forever), forever)
+
+    def test_idle(self):
+        """ Ticks at which nothing is due are skipped, not stepped. """
+        clock = FakeClock()
+        root = ExpiringRoot(3, 3, tick=0.001, clock=clock)
+        root.insert_leaf(Leaf(b'far', b'far'), 1e6)
+        for ndx in range(100):
+            root.insert_leaf(Leaf(b'%d' % ndx, ndx), 1.0 + ndx * 300.0)
+        for _ in range(3):
+            # ten hours idle is 36 million ticks
+            clock.now += 36000.0
+            start = time.perf_counter()
+            self.assertEqual(root.find_leaf(b'far'), b'far')
+            self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(root.expired, 100)
+        self.assertEqual(root.entry_count, 1)
+        self.assertAlmostEqual(root.ttl(b'far'), 1e6 - 108000.0)
+
+    def test_random_leaf(self):
+        """ Eviction samples every entry with the same probability. """
+        # pylint: disable=protected-access
+        root = ExpiringRoot(3, 3)
+        keys = self.make_keys(200)
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+        # a lone entry in a Root slot is no likelier than any other
+        lone = b'lone'
+        slot = root.hasher(lone) & 7
+        for key in keys:
+            if root.hasher(key) & 7 == slot:
+                root.delete_leaf(key)
+        root.insert_leaf(Leaf(lone, lone))
+        counts = {}
+        draws = 100 * root.entry_count
+        for _ in range(draws):
+            key = root._random_leaf().key
+            counts[key] = counts.get(key, 0) + 1
+        self.assertEqual(len(counts), root.entry_count)
+        self.assertLess(max(counts.values()), 200)
+        self.assertGreater(min(counts.values()), 30)
+
+    def test_lookup_never_stale(self):
+        """ An expired value is never returned, even within a tick. """
+        clock = FakeClock()
+        root = ExpiringRoot(3, 3, default_ttl=2.0, tick=10.0, clock=clock)
+        root.insert_leaf(Leaf(b'key', b'value'))
+        root.insert_leaf(Leaf(b'other', b'value'), ttl=5.0)
+        clock.now += 1.9
+        self.assertEqual(root.find_leaf(b'key'), b'value')
+        clock.now += 0.2
+        self.assertIsNone(root.find_leaf(b'key'))
+        self.assertEqual(root.entry_count, 1)
+        with self.assertRaises(HamtNotFound):
+            root.ttl(b'key')
+
+        # set_ttl() extends or clears the expiry
+        root.set_ttl(b'other', 100.0)
+        clock.now += 50.0
+        self.assertEqual(root.find_leaf(b'other'), b'value')
+        root.set_ttl(b'other', None)
+        clock.now += 500.0
+        self.assertEqual(root.find_leaf(b'other'), b'value')
+        with self.assertRaises(HamtNotFound):
+            root.set_ttl(b'key', 1.0)
+
+    def test_update(self):
+        """ update() keeps the expiry; replacing a value resets it. """
+        clock = FakeClock()
+        root = ExpiringRoot(3, 3, default_ttl=10.0, clock=clock)
+        self.assertEqual(root.increment(b'count'), 1)
+        clock.now += 6.0
+        self.assertEqual(root.increment(b'count'), 2)
+        self.assertAlmostEqual(root.ttl(b'count'), 4.0)
+        root.insert_leaf(Leaf(b'count', 7))
+        self.assertAlmostEqual(root.ttl(b'count'), 10.0)
+        clock.now += 11.0
+        self.assertIsNone(root.find_leaf(b'count'))
+        self.assertEqual(root.increment(b'count'), 1)
+
+        root.apply_batch([(b'a', b'1'), (b'b', b'2'), (b'count', None)])
+        self.assertEqual(root.entry_count, 2)
+        root.apply_batch([(b'a', b'3')])
+        self.assertEqual(root.entry_count, 2)
+        clock.now += 11.0
+        self.assertEqual(root.expire(), 2)
+        self.assertEqual(root.entry_count, 0)
+        self.assertEqual(root.byte_count, 0)
+        self.assertEqual(root.leaf_count, 0)
+
+    def test_eviction(self):
+        """ Over budget, the least recently used entries go first. """
+        clock = FakeClock(step=0.001)
+        root = ExpiringRoot(3, 3, max_entries=100, samples=8, clock=clock)
+        keys = self.make_keys(1000)
+        hot = keys[:10]
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+            for hot_key in hot:
+                root.find_leaf(hot_key)
+            self.assertLessEqual(root.entry_count, 100)
+        self.assertEqual(root.entry_count, 100)
+        self.assertEqual(root.leaf_count, 100)
+        self.assertEqual(root.evicted, 900)
+        for key in hot:
+            self.assertEqual(root.find_leaf(key), key)
+        root.verify()
+
+        root = ExpiringRoot(3, 3, max_bytes=10000, clock=clock)
+        for key in keys:
+            root.insert_leaf(Leaf(key, key * 4))
+            self.assertLessEqual(root.byte_count, 10000)
+        self.assertGreater(root.entry_count, 0)
+        self.assertEqual(root.leaf_count, root.entry_count)
+
+    def test_failed_batch(self):
+        """ A batch which fails leaves the counts as they were. """
+        clock = FakeClock(step=0.001)
+        root = ExpiringRoot(3, 3, max_entries=3, ordered=True, clock=clock)
+        root.insert_leaf(Leaf(b'kept', b'kept'))
+        with self.assertRaises(HamtError):
+            # the keys share their first 8 bytes
+            root.apply_batch([(b'kept', None), (b'prefix_a1', b'a'),
+                              (b'prefix_a2', b'a')])
+        self.assertEqual(root.entry_count, 1)
+        self.assertEqual(root.leaf_count, 1)
+        self.assertEqual(root.find_leaf(b'kept'), b'kept')
+        for ndx in range(10):
+            root.insert_leaf(Leaf(b'%d' % ndx, ndx))
+            self.assertEqual(root.entry_count, root.leaf_count)
+        self.assertEqual(root.entry_count, 3)
+        root.verify()
+
+    def test_split(self):
+        """ Roots split off keep counting and expiring their entries. """
+        clock = FakeClock()
+        root = ExpiringRoot(3, 3, default_ttl=10.0, clock=clock)
+        keys = self.make_keys(300)
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+        path = (root.hasher(keys[0]) & 7,)
+        part = root.extract(path)
+        self.assertEqual(part.entry_count + root.entry_count, 300)
+        self.assertEqual(part.entry_count, part.leaf_count)
+        parts = root.split(2)
+        self.assertEqual(root.entry_count, 0)
+        clock.now += 11.0
+        for each in parts + [part]:
+            each.expire()
+            self.assertEqual(each.entry_count, 0)
+            self.assertEqual(each.leaf_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
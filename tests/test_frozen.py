@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# hamt_py/test_frozen.py
+
+""" Test read-only packed tries. """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, Leaf, Root
+from hamt.frozen import FrozenRoot, freeze
+
+
+class TestFrozen(unittest.TestCase):
+    """ Test read-only packed tries. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def do_test_freeze(self, wexp, texp, count, **kwargs):
+        """ A frozen Root finds and lists exactly what the Root held. """
+        root = Root(wexp, texp, **kwargs)
+        by_key = {}
+        while len(by_key) < count:
+            key = bytes(self.rng.some_bytes(1 + self.rng.next_int16() % 16))
+            by_key[key] = bytes(self.rng.some_bytes(self.rng.next_int16() % 8))
+            root.insert_leaf(Leaf(key, by_key[key]))
+
+        frozen = root.freeze()
+        self.assertEqual(frozen.leaf_count, count)
+        self.assertEqual((frozen.wexp, frozen.texp), (wexp, texp))
+        for key, value in by_key.items():
+            self.assertEqual(frozen.find_leaf(key), value)
+        self.assertIsNone(frozen.find_leaf(b'\xff' * 20))
+        pairs = list(frozen.items())
+        self.assertEqual(dict(pairs), by_key)
+        if root.ordered:
+            self.assertEqual(pairs, sorted(pairs))
+
+        # the buffer alone is enough to search it again
+        again = FrozenRoot(bytes(frozen.buffer))
+        self.assertEqual(dict(again.items()), by_key)
+
+    def test_freeze(self):
+        """ Freeze compact, dense and ordered Roots. """
+        self.do_test_freeze(3, 3, 500)
+        self.do_test_freeze(5, 8, 2000, full_width_depth=1)
+        self.do_test_freeze(4, 4, 500, ordered=True)
+        self.do_test_freeze(4, 4, 0)
+
+    def test_errors(self):
+        """ Only bytes can be frozen, and only frozen tries read back. """
+        root = Root(4, 4)
+        root.insert_leaf(Leaf(b'key', 'not bytes'))
+        with self.assertRaises(HamtError):
+            freeze(root)
+        with self.assertRaises(TypeError):
+            freeze({})
+        with self.assertRaises(HamtError):
+            FrozenRoot(b'short')
+        with self.assertRaises(HamtError):
+            FrozenRoot(b'\0' * 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# hamt_py/test_hamt_set.py
+
+""" Test HamtSet and its set algebra. """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, HamtNotFound
+from hamt.hamt_set import HamtSet, KeyLeaf
+
+
+class TestHamtSet(unittest.TestCase):
+    """ Test HamtSet and its set algebra. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def make_keys(self, count):
+        """ Return a list of count distinct random keys. """
+        keys = set()
+        while len(keys) < count:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        return list(keys)
+
+    def test_key_leaf(self):
+        """ A KeyLeaf has a key but no value to speak of. """
+        with self.assertRaises(HamtError):
+            KeyLeaf(None)
+        leaf = KeyLeaf(b'abc')
+        self.assertEqual(leaf.key, b'abc')
+        self.assertTrue(leaf.value)
+
+    def test_add_remove(self):
+        """ Keys can be added and removed one at a time. """
+        keys = self.make_keys(300)
+        hset = HamtSet(wexp=3, texp=3)
+        for key in keys:
+            hset.add(key)
+        hset.add(keys[0])
+        self.assertEqual(len(hset), len(keys))
+        self.assertEqual(set(hset), set(keys))
+        for key in keys[:100]:
+            hset.remove(key)
+        hset.discard(keys[0])
+        with self.assertRaises(HamtNotFound):
+            hset.remove(keys[0])
+        self.assertEqual(len(hset), 200)
+        for key in keys:
+            self.assertEqual(key in hset, key not in keys[:100])
+
+    def do_test_algebra(self, **kwargs):
+        """ Check union, intersection and difference against set(). """
+        keys = self.make_keys(1200)
+        akeys = set(keys[:800])
+        bkeys = set(keys[400:])
+        aset = HamtSet(akeys, wexp=3, texp=3, **kwargs)
+        bset = HamtSet(bkeys, wexp=3, texp=3, **kwargs)
+
+        for result, expected in ((aset | bset, akeys | bkeys),
+                                 (aset & bset, akeys & bkeys),
+                                 (aset - bset, akeys - bkeys),
+                                 (bset - aset, bkeys - akeys),
+                                 (aset | aset, akeys),
+                                 (aset & aset, akeys),
+                                 (aset - aset, set())):
+            self.assertEqual(len(result), len(expected))
+            self.assertEqual(set(result), expected)
+            result.root.verify()
+            for key in keys:
+                self.assertEqual(key in result, key in expected)
+
+        # sets built differently are combined key by key
+        cset = HamtSet(bkeys, wexp=4, texp=3)
+        self.assertEqual(set(aset & cset), akeys & bkeys)
+        self.assertEqual(set(aset | cset), akeys | bkeys)
+        self.assertEqual(set(aset - cset), akeys - bkeys)
+
+    def test_algebra(self):
+        """ Set algebra on compact, dense and ordered sets. """
+        self.do_test_algebra()
+        self.do_test_algebra(full_width_depth=1)
+        self.do_test_algebra(dense_threshold=4)
+        self.do_test_algebra(ordered=True)
+
+    def test_sharing(self):
+        """ Sets sharing subtrees can be changed independently. """
+        keys = self.make_keys(1000)
+        aset = HamtSet(keys[:600], wexp=3, texp=3)
+        bset = HamtSet(keys[500:], wexp=3, texp=3)
+        union = aset | bset
+        copy = aset.copy()
+        self.assertIs(copy.root.slots[0], aset.root.slots[0])
+
+        for key in keys[:300]:
+            union.discard(key)
+            copy.discard(key)
+        for key in keys[300:700]:
+            aset.discard(key)
+            bset.add(key)
+        extra = self.make_keys(200)
+        for key in extra:
+            union.add(key)
+
+        self.assertEqual(set(aset), set(keys[:300]))
+        self.assertEqual(set(bset), set(keys[300:]))
+        self.assertEqual(set(union), set(keys[300:]) | set(extra))
+        self.assertEqual(set(copy), set(keys[300:600]))
+        self.assertEqual(len(copy), 300)
+        for hset in (aset, bset, union, copy):
+            hset.root.verify()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -42,6 +42,15 @@ class TestLeaf(unittest.TestCase):
 
         self.assertTrue(isinstance(leaf, Leaf))
 
+        # values may be replaced in place, but not by None
+        leaf.value = b'another value'
+        self.assertEqual(leaf.value, b'another value')
+        with self.assertRaises(HamtError):
+            leaf.value = None
+
+        # Leafs carry no per-instance dictionary
+        self.assertFalse(hasattr(leaf, '__dict__'))
+
 
 if __name__ == '__main__':
     unittest.main()
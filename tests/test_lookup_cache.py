@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# hamt_py/test_lookup_cache.py
+
+""" Test the front cache for hot keys. """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, Leaf
+from hamt.lookup_cache import CachedRoot
+
+
+class TestLookupCache(unittest.TestCase):
+    """ Test the front cache for hot keys. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def test_cache(self):
+        """ Lookups hit the cache and see every update. """
+        # pylint: disable=protected-access
+        with self.assertRaises(HamtError):
+            CachedRoot(4, 4, cache_bits=0)
+
+        root = CachedRoot(3, 3, cache_bits=6)
+        keys = set()
+        while len(keys) < 500:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        keys = list(keys)
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+
+        # hot keys which do not evict one another from the cache
+        hot, cndxs = [], set()
+        for key in keys:
+            cndx = root._cache_ndx(root.hasher(key))
+            if cndx not in cndxs:
+                cndxs.add(cndx)
+                hot.append(key)
+            if len(hot) == 4:
+                break
+        for _ in range(10):
+            for key in hot:
+                self.assertEqual(root.find_leaf(key), key)
+        self.assertTrue(root.hits >= 20)
+        self.assertTrue(0.0 < root.hit_rate < 1.0)
+        root.reset_stats()
+        self.assertEqual(root.hit_rate, 0.0)
+
+        # replacing, deleting and batching all invalidate
+        root.delete_leaf(hot[0])
+        self.assertIsNone(root.find_leaf(hot[0]))
+        root.apply_batch([(hot[1], b'batched'), (hot[2], None)])
+        self.assertEqual(root.find_leaf(hot[1]), b'batched')
+        self.assertIsNone(root.find_leaf(hot[2]))
+        root.insert_leaf(Leaf(hot[2], b'back'))
+        self.assertEqual(root.find_leaf(hot[2]), b'back')
+        self.assertEqual(root.find_leaf(hot[2]), b'back')
+        root.update(hot[2], lambda value: value + b'!')
+        self.assertEqual(root.find_leaf(hot[2]), b'back!')
+
+        for key in keys:
+            if key not in hot:
+                self.assertEqual(root.find_leaf(key), key)
+        self.assertIsNone(root.find_leaf(b'not a key'))
+
+        root.clear_cache()
+        self.assertEqual(root.find_leaf(hot[3]), hot[3])
+
+        # a key looked up through a buffer is cached as a copy
+        scratch = bytearray(hot[1])
+        self.assertEqual(root.find_leaf(memoryview(scratch)), b'batched')
+        scratch[:] = hot[3]
+        self.assertIn(hot[1], root._cache_keys)
+        self.assertEqual(root.find_leaf(scratch), hot[3])
+        self.assertEqual(root.find_leaf(hot[1]), b'batched')
+
+        # detaching a subtree empties the cache
+        root.drop((root.hasher(hot[3]) & 7,))
+        self.assertIsNone(root.find_leaf(hot[3]))
+        parts = root.split(2)
+        self.assertIsNone(root.find_leaf(keys[-1]))
+        self.assertTrue(isinstance(parts[0], CachedRoot))
+
+
+if __name__ == '__main__':
+    unittest.main()
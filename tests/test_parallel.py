@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# hamt_py/test_parallel.py
+
+""" Test building a Root in parallel. """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, Root
+from hamt.parallel import build_parallel
+
+
+class TestParallel(unittest.TestCase):
+    """ Test building a Root in parallel. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def make_pairs(self, count):
+        """ Return a list of count random (key, value) pairs. """
+        return [(bytes(self.rng.some_bytes(8)),
+                 bytes(self.rng.some_bytes(4))) for _ in range(count)]
+
+    def do_test_build(self, wexp, texp, processes, **kwargs):
+        """ Check that a Root built in parallel matches apply_batch(). """
+        pairs = self.make_pairs(3000)
+        # later pairs replace earlier ones, and None leaves a key out
+        pairs += [(key, b'new') for key, _ in pairs[:200]]
+        pairs += [(key, None) for key, _ in pairs[200:300]]
+        expected = Root(wexp, texp, **kwargs)
+        expected.apply_batch(pairs)
+
+        root = build_parallel(pairs, wexp, texp, processes, **kwargs)
+        self.assertEqual(root.leaf_count, expected.leaf_count)
+        self.assertEqual(dict(root.items()), dict(expected.items()))
+        self.assertEqual(root.table_count, expected.table_count)
+        root.verify()
+        for key, _ in pairs[:200]:
+            self.assertEqual(root.find_leaf(key), b'new')
+        for key, _ in pairs[200:300]:
+            self.assertIsNone(root.find_leaf(key))
+
+    def test_build(self):
+        """ Build Roots of several shapes in one or more processes. """
+        self.do_test_build(3, 3, 1)
+        self.do_test_build(3, 3, 3)
+        self.do_test_build(5, 8, 2)
+        self.do_test_build(4, 2, 4, ordered=True)
+
+    def test_edge_cases(self):
+        """ Empty input, and a bad process count. """
+        root = build_parallel([], 5, 8)
+        self.assertEqual(root.leaf_count, 0)
+        root = build_parallel([(b'abc', b'def')], 5, 8, 2)
+        self.assertEqual(root.find_leaf(b'abc'), b'def')
+        with self.assertRaises(HamtError):
+            build_parallel([(b'abc', b'def')], 5, 8, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
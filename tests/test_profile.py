@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# hamt_py/test_profile.py
+
+""" Test the hamt_py lookup profiler. """
+
+import unittest
+
+from hamt import Leaf, Root
+from hamt.bench import make_keys
+from hamt.profile import LevelProfile, profile_lookups
+
+
+class TestProfile(unittest.TestCase):
+    """ Test the hamt_py lookup profiler. """
+
+    def test_profile_lookups(self):
+        """ Every lookup is charged to hash, root and compare. """
+        root = Root(2, 2)
+        keys = make_keys(300, 8)
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+
+        prof = profile_lookups(root, keys, overhead=0)
+        self.assertTrue(isinstance(prof, LevelProfile))
+        self.assertEqual(prof.lookups, len(keys))
+        names = [name for name, _, _ in prof.ordered_phases()]
+        self.assertEqual(names[:3], ['hash', 'root', 'level 1'])
+        self.assertEqual(names[-1], 'compare')
+        self.assertEqual(prof.phases['hash'][0], len(keys))
+        self.assertEqual(prof.phases['compare'][0], len(keys))
+
+        # deeper levels are reached by no more lookups than shallower ones
+        counts = [count for name, count, _ in prof.ordered_phases()
+                  if name.startswith('level')]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,11 +5,13 @@
 
 # import hashlib
 # import os
+import random
 import time
 import unittest
 
 from rnglib import SimpleRNG
-from hamt import HamtNotFound, Root, Leaf, uhash  # , countem
+from hamt import (HamtError, HamtIntegrityError, HamtNotFound, Root, Leaf,
+                  Table, log_misses, uhash)  # , countem
 
 
 class TestRoot(unittest.TestCase):
@@ -164,5 +166,328 @@ class TestRoot(unittest.TestCase):
             self.do_test_flat_root(wexp)
 
 
+    # ---------------------------------------------------------------
+
+    def do_test_ordered(self, wexp, texp):
+        """ Test prefix and range iteration over an ordered Root. """
+
+        root = Root(wexp, texp, ordered=True)
+        by_code = {}
+        for _ in range(1000):
+            key = bytes(self.rng.some_bytes(1 + self.rng.next_int16(8)))
+            # keys agreeing in all their code bits cannot both be stored
+            by_code.setdefault(root.hasher(key), key)
+        keys = sorted(by_code.values())
+        for key in keys:
+            root.insert_leaf(Leaf(key, key + b'!'))
+
+        found = list(root.items())
+        self.assertEqual([key for key, _ in found], keys)
+        for key, value in found:
+            self.assertEqual(value, key + b'!')
+            self.assertEqual(root.find_leaf(key), value)
+
+        for _ in range(16):
+            prefix = bytes(self.rng.some_bytes(self.rng.next_int16(3)))
+            self.assertEqual(
+                [key for key, _ in root.items(prefix=prefix)],
+                [key for key in keys if key.startswith(prefix)])
+
+            start, stop = sorted(
+                bytes(self.rng.some_bytes(1 + self.rng.next_int16(3)))
+                for _ in range(2))
+            self.assertEqual(
+                [key for key, _ in root.items(start=start, stop=stop)],
+                [key for key in keys if start <= key < stop])
+            self.assertEqual(
+                [key for key, _ in root.items(prefix=prefix, stop=stop)],
+                [key for key in keys if key.startswith(prefix) and
+                 key < stop])
+
+    def test_ordered(self):
+        """ Test ordered Roots across a range of parameters. """
+        for wexp in [2, 3, 4, 5, 6]:
+            for texp in [2, 5, 8]:
+                self.do_test_ordered(wexp, texp)
+
+        # keys agreeing in their first 8 bytes collide, whether found in
+        # a Root slot or in a Table, and are named in the error
+        for wexp, texp in ((3, 3), (4, 8), (6, 4)):
+            root = Root(wexp, texp, ordered=True)
+            root.insert_leaf(Leaf(b'prefix_a1', 1))
+            with self.assertRaises(HamtError) as context:
+                root.insert_leaf(Leaf(b'prefix_a2', 2))
+            self.assertIn("b'prefix_a1'", str(context.exception))
+            self.assertIn("b'prefix_a2'", str(context.exception))
+            root.insert_leaf(Leaf(b'prefix_b', 3))
+            with self.assertRaises(HamtError) as context:
+                root.insert_leaf(Leaf(b'prefix_a3', 4))
+            self.assertIn("b'prefix_a1'", str(context.exception))
+            with self.assertRaises(HamtError) as context:
+                root.apply_batch([(b'prefix_b', 5), (b'prefix_b\0', 6)])
+            self.assertIn("b'prefix_b\\x00'", str(context.exception))
+            self.assertEqual(list(root.items()),
+                             [(b'prefix_a1', 1), (b'prefix_b', 3)])
+            root.verify()
+
+        # hashed Roots can list their items but not a prefix or range
+        root = Root(4, 4)
+        root.insert_leaf(Leaf(b'abc', b'def'))
+        self.assertEqual(list(root.items()), [(b'abc', b'def')])
+        with self.assertRaises(HamtError):
+            list(root.items(prefix=b'a'))
+
+    def test_update(self):
+        """ Values are updated in place, and counters incremented. """
+        root = Root(3, 3)
+        keys = set()
+        while len(keys) < 400:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        keys = list(keys)
+        counts = {}
+        for _ in range(2000):
+            key = keys[self.rng.next_int16() % len(keys)]
+            counts[key] = counts.get(key, 0) + 1
+            self.assertEqual(root.increment(key), counts[key])
+        for key in keys[:50]:
+            self.assertEqual(root.increment(key, 10), counts.get(key, 0) + 10)
+            counts[key] = counts.get(key, 0) + 10
+        self.assertEqual(dict(root.items()), counts)
+
+        with self.assertRaises(HamtNotFound):
+            root.update(b'no such key', lambda value: value)
+        self.assertEqual(root.update(b'new key', str, 7), '7')
+        self.assertEqual(root.update(b'new key', lambda value: value * 2),
+                         '77')
+
+        # replacing a value through insert_leaf() also works in place
+        root.insert_leaf(Leaf(keys[0], -1))
+        self.assertEqual(root.find_leaf(keys[0]), -1)
+        self.assertEqual(root.leaf_count, len(counts) + 1)
+
+    def test_verify(self):
+        """ verify() passes a sound trie and pins down faults. """
+        # pylint: disable=protected-access
+        root = Root(2, 2)
+        keys = set()
+        while len(keys) < 300:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        keys = list(keys)
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+        for key in keys[:200]:
+            root.delete_leaf(key)
+        checked = root.verify()
+        self.assertTrue(checked > 100)
+        # a seeded rng, as all four Root slots may be drawn by chance
+        self.assertTrue(
+            root.verify(fraction=0.25, rng=random.Random(25)) < checked)
+        self.assertEqual(Root(2, 2).verify(), 0)
+
+        # find a Table with at least two Leafs and break it
+        stack = [(node, (ndx,)) for ndx, node in enumerate(root.slots)
+                 if isinstance(node, Table)]
+        while stack:
+            table, path = stack.pop()
+            leaves = [rank for rank, node in enumerate(table.slots)
+                      if isinstance(node, Leaf)]
+            if len(leaves) >= 2:
+                break
+            stack.extend((node, path + (ndx,))
+                         for ndx, node in table.indexed_slots()
+                         if isinstance(node, Table))
+        bitmap, slots = table._bitmap, list(table._slots)
+
+        table._bitmap = bitmap & (bitmap - 1)
+        with self.assertRaises(HamtIntegrityError) as ctx:
+            root.verify()
+        self.assertEqual(ctx.exception.path, path)
+
+        table._bitmap = bitmap
+        first, second = leaves[:2]
+        table._slots[first], table._slots[second] = \
+            slots[second], slots[first]
+        with self.assertRaises(HamtIntegrityError) as ctx:
+            root.verify()
+        self.assertEqual(len(ctx.exception.path), len(path) + 1)
+
+        table._slots[:] = slots
+        root.verify()
+
+    def test_miss_hook(self):
+        """ Misses go to the miss hook, if any, and nowhere else. """
+        missed = []
+        root = Root(2, 2, miss_hook=missed.append)
+        keys = set()
+        while len(keys) < 100:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+        for key in keys:
+            self.assertEqual(root.find_leaf(key), key)
+        self.assertEqual(missed, [])
+        self.assertIsNone(root.find_leaf(b'no such key'))
+        self.assertEqual(missed, [b'no such key'])
+
+        root.miss_hook = log_misses()
+        with self.assertLogs('hamt', 'DEBUG') as logs:
+            root.find_leaf(b'missing')
+        self.assertEqual(len(logs.records), 1)
+        root.miss_hook = None
+        self.assertIsNone(root.find_leaf(b'missing'))
+
+    def do_test_buffer_keys(self, root):
+        """ Look keys up through buffers; keys are stored as bytes. """
+        keys = set()
+        while len(keys) < 200:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        keys = list(keys)
+        message = b''.join(keys)
+        scratch = bytearray(message)
+        for ndx, key in enumerate(keys[:100]):
+            root.insert_leaf(Leaf(memoryview(scratch)[8 * ndx:8 * ndx + 8],
+                                   ndx))
+        root.apply_batch((bytearray(key), ndx)
+                         for ndx, key in enumerate(keys[100:], 100))
+        root.increment(bytearray(b'counted'))
+        scratch[:] = bytes(len(scratch))     # the stored keys are copies
+
+        view = memoryview(message)
+        for ndx, key in enumerate(keys):
+            self.assertEqual(uhash(view[8 * ndx:8 * ndx + 8]), uhash(key))
+            self.assertEqual(root.find_leaf(view[8 * ndx:8 * ndx + 8]), ndx)
+            self.assertEqual(root.find_leaf(bytearray(key)), ndx)
+            self.assertEqual(root.find_leaf(memoryview(bytearray(key))), ndx)
+        self.assertEqual(root.find_leaf(b'counted'), 1)
+        for key, _ in root.items():
+            self.assertIsInstance(key, bytes)
+        root.delete_leaf(view[:8])
+        self.assertIsNone(root.find_leaf(keys[0]))
+        root.verify()
+
+    def test_buffer_keys(self):
+        """ Lookups take bytearrays and memoryviews as keys. """
+        self.do_test_buffer_keys(Root(3, 3))
+        self.do_test_buffer_keys(Root(3, 3, ordered=True))
+        with self.assertRaises(TypeError):
+            uhash([1, 2])
+
+    def test_sample(self):
+        """ Keys are sampled uniformly and the size estimated cheaply. """
+        # pylint: disable=protected-access
+        for kwargs in ({}, {'dense_threshold': 4}, {'ordered': True}):
+            root = Root(3, 3, **kwargs)
+            keys = set()
+            while len(keys) < 2000:
+                keys.add(bytes(self.rng.some_bytes(8)))
+            for key in keys:
+                root.insert_leaf(Leaf(key, key))
+            for key in list(keys)[:500]:
+                root.delete_leaf(key)
+                keys.discard(key)
+            self.assertEqual(
+                {leaf.key for node in root.slots
+                 for leaf in root.leaves_under(node)}, keys)
+            self.assertEqual(root.leaf_count, 1500)
+            root.verify()
+
+            self.assertEqual(root.sample(0), [])
+            for count in (1, 50, 1000, 1500):
+                sample = root.sample(count)
+                self.assertEqual(len(sample), count)
+                self.assertEqual(len(set(sample)), count)
+                self.assertTrue(set(sample) <= keys)
+            with self.assertRaises(HamtError):
+                root.sample(1501)
+
+            self.assertEqual(root.estimate_len(8), 1500)
+            self.assertTrue(0 < root.estimate_len(4) < 3000)
+
+            # a Table whose count is wrong is caught
+            table = next(node for node in root.slots
+                         if isinstance(node, Table))
+            table._count += 1
+            with self.assertRaises(HamtIntegrityError):
+                root.verify()
+            table._count -= 1
+
+        # each of a few keys is drawn about equally often
+        root = Root(2, 2)
+        for ndx in range(8):
+            root.insert_leaf(Leaf(b'key %d' % ndx, ndx))
+        drawn = {}
+        for _ in range(4000):
+            key = root.sample(1)[0]
+            drawn[key] = drawn.get(key, 0) + 1
+        self.assertEqual(len(drawn), 8)
+        for count in drawn.values():
+            self.assertTrue(300 < count < 700)
+
+    def test_detach_split(self):
+        """ Whole hash ranges are detached, extracted and split off. """
+        root = Root(3, 3)
+        by_key = {}
+        while len(by_key) < 1000:
+            key = bytes(self.rng.some_bytes(8))
+            by_key[key] = key
+            root.insert_leaf(Leaf(key, key))
+
+        def slot_path(key, length):
+            """ Return the first length slot indices for key. """
+            hcode = uhash(key)
+            path = [hcode & 7]
+            hcode >>= 3
+            for _ in range(length - 1):
+                path.append(hcode & 7)
+                hcode >>= 3
+            return tuple(path)
+
+        def under(path):
+            """ Return the keys whose slot path begins with path. """
+            return set(key for key in by_key
+                       if slot_path(key, len(path)) == path)
+
+        with self.assertRaises(HamtError):
+            root.detach(())
+        with self.assertRaises(HamtError):
+            root.detach((8,))
+
+        # extract a whole Table from below a Root slot
+        path = slot_path(next(iter(by_key)), 2)
+        moved = under(path)
+        part = root.extract(path)
+        self.assertEqual(set(key for key, _ in part.items()), moved)
+        for key in moved:
+            self.assertIsNone(root.find_leaf(key))
+            self.assertEqual(part.find_leaf(key), key)
+            del by_key[key]
+        with self.assertRaises(HamtNotFound):
+            root.detach(path)
+        part.verify()
+        root.verify()
+
+        # drop a deeper prefix, which may end at a single Leaf
+        path = slot_path(next(iter(by_key)), 4)
+        dropped = under(path)
+        root.drop(path)
+        for key in dropped:
+            self.assertIsNone(root.find_leaf(key))
+            del by_key[key]
+        self.assertEqual(dict(root.items()), by_key)
+        root.verify()
+
+        with self.assertRaises(HamtError):
+            root.split(3)
+        parts = root.split(4)
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(root.leaf_count, 0)
+        self.assertEqual(sum(part.leaf_count for part in parts), len(by_key))
+        for key, value in by_key.items():
+            part = parts[root.split_index(key, 4)]
+            self.assertEqual(part.find_leaf(key), value)
+        for part in parts:
+            part.verify()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# hamt_py/test_store.py
+
+""" Test out-of-core values: ValueStore, LRUCache and LazyRoot. """
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, Leaf
+from hamt.store import LazyRoot, LRUCache, ValueStore
+
+
+class TestStore(unittest.TestCase):
+    """ Test out-of-core values: ValueStore, LRUCache and LazyRoot. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'values')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_value_store(self):
+        """ Values read back as written, also after reopening. """
+        values = [bytes(self.rng.some_bytes(self.rng.next_int16(100)))
+                  for _ in range(50)]
+        with ValueStore(self.path) as store:
+            handles = [store.put(value) for value in values]
+            for handle, value in zip(handles, values):
+                self.assertEqual(store.get(handle), value)
+            with self.assertRaises(HamtError):
+                store.put('not bytes')
+        with ValueStore(self.path) as store:
+            for handle, value in zip(handles, values):
+                self.assertEqual(store.get(handle), value)
+            self.assertEqual(store.put(b'more'), store.size - 4 - 4)
+
+    def test_lru_cache(self):
+        """ The cache evicts least recently used values to fit. """
+        cache = LRUCache(10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        self.assertEqual(cache.get('a'), b'1234')      # b is now oldest
+        cache.put('c', b'1234')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'1234')
+        self.assertEqual(cache.get('c'), b'1234')
+        self.assertEqual(cache.current_bytes, 8)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+        cache.put('big', b'x' * 11)                     # never cached
+        self.assertIsNone(cache.get('big'))
+        self.assertEqual(len(cache), 2)
+
+    def test_lazy_root(self):
+        """ A LazyRoot finds values through the store and cache. """
+        with ValueStore(self.path) as store:
+            root = LazyRoot(4, 4, store, cache_bytes=20 * 64)
+            by_key = {}
+            while len(by_key) < 500:
+                by_key[bytes(self.rng.some_bytes(8))] = \
+                    bytes(self.rng.some_bytes(64))
+            for key, value in by_key.items():
+                root.insert_leaf(Leaf(key, value))
+
+            for key, value in by_key.items():
+                self.assertEqual(root.find_leaf(key), value)
+                self.assertTrue(isinstance(root.handle_of(key), int))
+            self.assertTrue(root.cache.current_bytes <= 20 * 64)
+            self.assertTrue(root.cache.evictions > 0)
+            self.assertEqual(dict(root.items()), by_key)
+
+            key = next(iter(by_key))
+            handle = root.handle_of(key)
+            self.assertEqual(root.update(key, lambda value: value[:4]),
+                             by_key[key][:4])
+            self.assertEqual(root.find_leaf(key), by_key[key][:4])
+            self.assertNotEqual(root.handle_of(key), handle)
+            root.delete_leaf(key)
+            self.assertIsNone(root.find_leaf(key))
+
+    def test_lazy_batch(self):
+        """ apply_batch() writes its values to the store too. """
+        with ValueStore(self.path) as store:
+            root = LazyRoot(3, 3, store)
+            by_key = {}
+            while len(by_key) < 200:
+                by_key[bytes(self.rng.some_bytes(8))] = \
+                    bytes(self.rng.some_bytes(16))
+            root.apply_batch(by_key.items())
+            keys = list(by_key)
+            root.apply_batch([(keys[0], b'vvv'), (keys[1], None)])
+            by_key[keys[0]] = b'vvv'
+            del by_key[keys[1]]
+            for key, value in by_key.items():
+                self.assertTrue(isinstance(root.handle_of(key), int))
+                self.assertEqual(root.find_leaf(key), value)
+            self.assertIsNone(root.find_leaf(keys[1]))
+            self.assertEqual(dict(root.items()), by_key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,7 @@ import time
 import unittest
 
 from rnglib import SimpleRNG
-from hamt import HamtNotFound, Root, Leaf, uhash
+from hamt import DenseTable, HamtNotFound, Root, Leaf, Table, uhash
 
 
 class TestTable(unittest.TestCase):
@@ -200,7 +200,7 @@ class TestTable(unittest.TestCase):
 
     # ---------------------------------------------------------------
 
-    def do_test_with_many_keys(self, texp):
+    def do_test_with_many_keys(self, texp, full_width_depth=0):
         """
         Test behavior of tree where we insert many more Leafs than are
         necessary to fill the root.
@@ -208,7 +208,7 @@ class TestTable(unittest.TestCase):
 
         wexp = texp     # we aren't yet interested in wexp != texp
         slot_count = 1 << texp
-        root = Root(wexp, texp)
+        root = Root(wexp, texp, full_width_depth)
         self.assertEqual(root.leaf_count, 0)
         self.assertEqual(root.table_count, 1)     # root table is counted
 
@@ -227,9 +227,14 @@ class TestTable(unittest.TestCase):
 
         # we have successfully inserted that many leaf nodes into the tree
         self.assertEqual(root.leaf_count, inserted)
+        self.assertTrue(root.verify() >= inserted)
 
         # now delete each of the keys ---------------------
-        for leaf in leaves:
+        for count, leaf in enumerate(leaves):
+            if count == len(leaves) // 2:
+                # deletions leave no empty or single-Leaf Tables
+                root.verify()
+
             # the leaf is present
             value = root.find_leaf(leaf.key)
             self.assertEqual(value, leaf.value)
@@ -246,6 +251,7 @@ class TestTable(unittest.TestCase):
 
         # verify the count is zero
         self.assertEqual(root.leaf_count, 0)
+        self.assertEqual(root.table_count, 1)
 
     def test_with_many_keys(self):
         """
@@ -255,6 +261,95 @@ class TestTable(unittest.TestCase):
         for texp in [3, 4, 5, 6]:
             self.do_test_with_many_keys(texp)
 
+    def test_full_width(self):
+        """
+        Test behavior with DenseTables near the Root, and check that
+        only Tables at depths up to full_width_depth are dense.
+        """
+        for texp in [3, 4, 5, 6]:
+            for full_width_depth in [1, 2]:
+                self.do_test_with_many_keys(texp, full_width_depth)
+
+        root = Root(2, 2, full_width_depth=1)
+        for leaf in self.make_many_leaves(256):
+            root.insert_leaf(leaf)
+        stack = [(table, 1) for table in root.slots
+                 if isinstance(table, Table)]
+        self.assertTrue(stack)
+        while stack:
+            table, depth = stack.pop()
+            self.assertEqual(isinstance(table, DenseTable), depth <= 1)
+            if isinstance(table, DenseTable):
+                self.assertEqual(len(table.slots), table.max_slots)
+            stack.extend((node, depth + 1) for node in table.slots
+                         if isinstance(node, Table))
+
+    def test_dense_threshold(self):
+        """
+        Tables become DenseTables as they fill past the threshold and
+        revert to compact Tables as they empty.
+        """
+        threshold = 6
+
+        def check_kinds(root):
+            """
+            Check each Table's representation against its fill level;
+            return the number of DenseTables.
+            """
+            dense = 0
+            stack = list(root.slots)
+            while stack:
+                node = stack.pop()
+                if not isinstance(node, Table):
+                    continue
+                in_use = bin(node.bitmap).count('1')
+                if isinstance(node, DenseTable):
+                    dense += 1
+                    self.assertTrue(in_use >= threshold // 2)
+                else:
+                    self.assertTrue(in_use < threshold)
+                    self.assertEqual(len(node.slots), in_use)
+                stack.extend(node.slots)
+            return dense
+
+        root = Root(3, 2, dense_threshold=threshold)
+        leaves = self.make_many_leaves(512)
+        for leaf in leaves:
+            root.insert_leaf(leaf)
+        self.assertEqual(root.leaf_count, len(leaves))
+        for leaf in leaves:
+            self.assertEqual(root.find_leaf(leaf.key), leaf.value)
+        dense_when_full = check_kinds(root)
+        self.assertTrue(dense_when_full > 0)
+
+        for leaf in leaves[:448]:
+            root.delete_leaf(leaf.key)
+        self.assertEqual(root.leaf_count, 64)
+        for leaf in leaves[448:]:
+            self.assertEqual(root.find_leaf(leaf.key), leaf.value)
+        check_kinds(root)
+
+        # eight leaves sharing a Root slot but not a Table slot
+        root = Root(3, 2, dense_threshold=threshold)
+        by_digit = {}
+        while len(by_digit) < 8:
+            leaf = self.make_a_unique_leaf({})
+            hcode = uhash(leaf.key)
+            if hcode & root.mask == 0:
+                by_digit.setdefault((hcode >> 2) & 7, leaf)
+        for leaf in by_digit.values():
+            root.insert_leaf(leaf)
+        self.assertTrue(isinstance(root.slots[0], DenseTable))
+        for leaf in list(by_digit.values())[:5]:
+            root.delete_leaf(leaf.key)
+        self.assertTrue(isinstance(root.slots[0], DenseTable))
+        leaf = list(by_digit.values())[5]
+        root.delete_leaf(leaf.key)
+        self.assertFalse(isinstance(root.slots[0], DenseTable))
+        self.assertEqual(len(root.slots[0].slots), 2)
+        for leaf in list(by_digit.values())[6:]:
+            self.assertEqual(root.find_leaf(leaf.key), leaf.value)
+
     # ---------------------------------------------------------------
 
     def do_test_with_matching_keys(self, texp):
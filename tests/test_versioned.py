@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# hamt_py/test_versioned.py
+
+""" Test VersionedRoot's reads as of past versions. """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, HamtNotFound, Leaf
+from hamt.versioned import VersionedRoot
+
+
+class TestVersioned(unittest.TestCase):
+    """ Test VersionedRoot's reads as of past versions. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def make_keys(self, count):
+        """ Return a list of count distinct random keys. """
+        keys = set()
+        while len(keys) < count:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        return list(keys)
+
+    def do_test_versions(self, **kwargs):
+        """ Every version kept reads as it was written. """
+        keys = self.make_keys(300)
+        root = VersionedRoot(3, 3, history=1000, **kwargs)
+        states = [{}]
+        state = {}
+        for ndx in range(1500):
+            key = keys[self.rng.next_int16(len(keys))]
+            if key in state and self.rng.next_int16(3) == 0:
+                root.delete_leaf(key)
+                del state[key]
+            else:
+                root.insert_leaf(Leaf(key, b'%d' % ndx))
+                state[key] = b'%d' % ndx
+            states.append(dict(state))
+        root.apply_batch([(keys[0], b'batch'), (keys[1], None),
+                          (keys[2], b'batch')])
+        state[keys[0]] = state[keys[2]] = b'batch'
+        state.pop(keys[1], None)
+        states.append(dict(state))
+        self.assertEqual(root.version, 1501)
+        self.assertEqual(root.oldest_version, 502)
+        root.verify()
+
+        for version in range(root.oldest_version, root.version + 1, 37):
+            expected = states[version]
+            for key in keys:
+                self.assertEqual(root.find_leaf(key, version),
+                                 expected.get(key))
+            self.assertEqual(dict(root.items_at(version)), expected)
+        self.assertEqual(dict(root.items()), state)
+        with self.assertRaises(HamtError):
+            root.find_leaf(keys[0], 10)
+
+        # replaying the changes since a version catches a copy up
+        copy = dict(states[1200])
+        for _, key, value in root.changes_since(1200):
+            if value is None:
+                copy.pop(key, None)
+            else:
+                copy[key] = value
+        self.assertEqual(copy, state)
+
+    def test_versions(self):
+        """ Versions read back on compact, dense and ordered Roots. """
+        self.do_test_versions()
+        self.do_test_versions(full_width_depth=1)
+        self.do_test_versions(dense_threshold=4)
+        self.do_test_versions(ordered=True)
+
+    def test_snapshots(self):
+        """ Snapshots hold old versions until they are released. """
+        # pylint: disable=protected-access
+        with self.assertRaises(HamtError):
+            VersionedRoot(3, 3, history=0)
+        root = VersionedRoot(3, 3, history=2)
+        keys = self.make_keys(50)
+        for key in keys:
+            root.insert_leaf(Leaf(key, b'first'))
+        self.assertEqual(root.oldest_version, 49)
+        snap = root.snapshot()
+        self.assertEqual(snap.version, 50)
+        with root.snapshot(49) as older:
+            for key in keys:
+                root.increment(key + b'count')
+                root.update(key, lambda value: value + b'!')
+            self.assertEqual(root.oldest_version, 49)
+            self.assertIsNone(older.find_leaf(keys[-1]))
+            self.assertEqual(older.find_leaf(keys[0]), b'first')
+        self.assertEqual(root.oldest_version, 50)
+        for key in keys:
+            self.assertEqual(snap.find_leaf(key), b'first')
+            self.assertEqual(root.find_leaf(key), b'first!')
+            self.assertEqual(root.find_leaf(key + b'count'), 1)
+        self.assertEqual(len(list(snap.items())), 50)
+        self.assertEqual(len(root.changes_since(50)), 100)
+        snap.release()
+        snap.release()
+        self.assertEqual(root.oldest_version, root.version - 1)
+        with self.assertRaises(HamtError):
+            root.changes_since(50)
+        # only the nodes of the versions kept are still referenced
+        self.assertLessEqual(
+            sum(len(nodes) for nodes in root._slot_history.values()),
+            2 * root.slot_count)
+        self.assertLessEqual(len(root.changes_since(root.oldest_version)), 1)
+
+        with self.assertRaises(HamtNotFound):
+            root.delete_leaf(b'no such key')
+        with self.assertRaises(HamtError):
+            root.drop((0,))
+        with self.assertRaises(HamtError):
+            root.split(2)
+        root.verify()
+
+    def test_failed_batch(self):
+        """ A batch which fails makes no change and no version. """
+        misses = []
+        root = VersionedRoot(3, 3, ordered=True, miss_hook=misses.append)
+        root.insert_leaf(Leaf(b'prefix_a1', b'one'))
+        self.assertEqual(root.version, 1)
+        with self.assertRaises(HamtError):
+            # the second and third keys share their first 8 bytes
+            root.apply_batch([(b'zzz', b'new'), (b'prefix_a1', None),
+                              (b'prefix_b1', b'b'), (b'prefix_b2', b'b')])
+        self.assertEqual(root.version, 1)
+        self.assertIsNone(root.find_leaf(b'zzz'))
+        self.assertIsNone(root.find_leaf(b'zzz', 1))
+        self.assertEqual(root.find_leaf(b'prefix_a1'), b'one')
+        self.assertEqual(root.changes_since(1), [])
+        self.assertEqual(list(root.items()), [(b'prefix_a1', b'one')])
+        root.verify()
+
+        # the next write makes a version of its own change alone
+        root.insert_leaf(Leaf(b'other', b'x'))
+        self.assertEqual(root.changes_since(1), [(2, b'other', b'x')])
+        self.assertIsNone(root.find_leaf(b'zzz', 2))
+
+        # update() on an absent key is not a miss
+        del misses[:]
+        self.assertEqual(root.increment(b'count'), 1)
+        self.assertEqual(misses, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# hamt_py/test_visitor.py
+
+""" Test the hamt_py Visitor interface. """
+
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import Leaf, Root, Table
+from hamt.visitor import CountingVisitor, Visitor, walk, walk_parallel
+
+
+class OrderVisitor(Visitor):
+    """ Record the sequence of hook calls. """
+
+    def __init__(self, prune_depth=None):
+        self.calls = []
+        self.prune_depth = prune_depth
+
+    def pre_visit(self, node, depth):
+        self.calls.append(('pre', depth))
+        return depth != self.prune_depth
+
+    def visit_leaf(self, leaf, depth):
+        self.calls.append(('leaf', depth))
+
+    def post_visit(self, node, depth):
+        self.calls.append(('post', depth))
+
+
+class TestVisitor(unittest.TestCase):
+    """ Test the hamt_py Visitor interface. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+
+    def make_root(self, wexp, texp, count):
+        """ Return a Root holding count Leafs with random keys. """
+        root = Root(wexp, texp)
+        keys = set()
+        while len(keys) < count:
+            keys.add(bytes(self.rng.some_bytes(8)))
+        for key in keys:
+            root.insert_leaf(Leaf(key, key))
+        return root
+
+    def test_counts(self):
+        """ A CountingVisitor agrees with the Root's own counts. """
+        for wexp, texp in [(2, 2), (3, 4), (5, 5)]:
+            root = self.make_root(wexp, texp, 500)
+            visitor = root.accept(CountingVisitor())
+            self.assertEqual(visitor.leaf_count, root.leaf_count)
+            self.assertEqual(visitor.table_count + 1, root.table_count)
+
+            # Table.depth matches the depth the walk reports
+            for node in root.slots:
+                if isinstance(node, Table):
+                    self.assertEqual(node.depth, 1)
+                    sub = node.accept(CountingVisitor())
+                    self.assertEqual(sub.leaf_count, node.leaf_count)
+                    self.assertEqual(min(sub.tables_at), 1)
+
+    def test_hooks_and_pruning(self):
+        """ Hooks nest properly and pruning skips whole subtrees. """
+        root = self.make_root(2, 2, 64)
+        visitor = walk(root, OrderVisitor())
+        self.assertEqual(visitor.calls[0], ('pre', 0))
+        self.assertEqual(visitor.calls[-1], ('post', 0))
+        open_depths = []
+        for call, depth in visitor.calls:
+            if call == 'pre':
+                open_depths.append(depth)
+            elif call == 'post':
+                self.assertEqual(open_depths.pop(), depth)
+            else:
+                self.assertEqual(depth, open_depths[-1] + 1)
+        self.assertEqual(open_depths, [])
+
+        pruned = walk(root, OrderVisitor(prune_depth=1))
+        self.assertTrue(all(depth <= 1 for _, depth in pruned.calls))
+        self.assertFalse(('post', 1) in pruned.calls)
+
+        self.assertEqual(walk(root, OrderVisitor(prune_depth=0)).calls,
+                         [('pre', 0)])
+
+    def test_parallel(self):
+        """ A parallel walk gives the same results as a serial one. """
+        root = self.make_root(4, 6, 3000)
+        serial = root.accept(CountingVisitor())
+        parallel = walk_parallel(root, CountingVisitor(), processes=3)
+        self.assertEqual(parallel.leaves_at, serial.leaves_at)
+        self.assertEqual(parallel.tables_at, serial.tables_at)
+        self.assertEqual(
+            root.accept(CountingVisitor(), processes=2).leaves_at,
+            serial.leaves_at)
+
+
+if __name__ == '__main__':
+    unittest.main()
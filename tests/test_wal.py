@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# hamt_py/test_wal.py
+
+""" Test the write-ahead log, snapshots and crash recovery. """
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from rnglib import SimpleRNG
+from hamt import HamtError, HamtNotFound, Leaf, uhash
+from hamt.wal import (JournaledRoot, WriteAheadLog, read_log,
+                      read_snapshot, recover)
+
+
+class TestWal(unittest.TestCase):
+    """ Test the write-ahead log, snapshots and crash recovery. """
+
+    def setUp(self):
+        self.rng = SimpleRNG(time.time())
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.tmp_dir, 'wal')
+        self.snap_path = os.path.join(self.tmp_dir, 'snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def some_key(self):
+        """ Return a random 8-byte key. """
+        return bytes(self.rng.some_bytes(8))
+
+    def test_group_commit(self):
+        """ Records are written in groups, and only when committed. """
+        wal = WriteAheadLog(self.log_path, group_size=4, group_delay=60)
+        for ndx in range(10):
+            wal.log_insert(b'k%d' % ndx, b'v')
+        self.assertEqual(wal.commits, 2)
+        self.assertEqual(wal.pending, 2)
+        self.assertEqual(len(list(read_log(self.log_path))), 8)
+        wal.log_delete(b'k0')
+        wal.close()
+        records = list(read_log(self.log_path))
+        self.assertEqual(len(records), 11)
+        self.assertEqual(records[-1], (b'k0', None))
+
+    def test_idle_commit(self):
+        """ A lone record is committed group_delay after it is logged. """
+        wal = WriteAheadLog(self.log_path, group_size=64, group_delay=0.05)
+        wal.log_insert(b'lone', b'write')
+        self.assertEqual(wal.pending, 1)
+        deadline = time.monotonic() + 5.0
+        while wal.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(wal.pending, 0)
+        self.assertEqual(wal.commits, 1)
+        self.assertEqual(list(read_log(self.log_path)), [(b'lone', b'write')])
+
+        # a commit before the timer fires leaves it nothing to do
+        wal.log_insert(b'second', b'write')
+        wal.commit()
+        time.sleep(0.1)
+        self.assertEqual(wal.commits, 2)
+        wal.close()
+
+    def test_refused_change(self):
+        """ A change the trie refuses is not logged. """
+        wal = WriteAheadLog(self.log_path)
+        root = JournaledRoot(3, 3, wal, self.snap_path, ordered=True)
+        root.insert_leaf(Leaf(b'prefix_a1', b'one'))
+        # the keys share their first 8 bytes
+        with self.assertRaises(HamtError):
+            root.insert_leaf(Leaf(b'prefix_a2', b'two'))
+        with self.assertRaises(HamtError):
+            root.apply_batch([(b'other', b'x'), (b'prefix_a3', b'three')])
+        with self.assertRaises(HamtNotFound):
+            root.delete_leaf(b'absent')
+        root.close()
+        self.assertEqual(list(read_log(self.log_path)),
+                         [(b'prefix_a1', b'one')])
+
+        recovered = recover(self.snap_path, self.log_path, 3, 3,
+                            ordered=True)
+        self.assertEqual(list(recovered.items()), [(b'prefix_a1', b'one')])
+        recovered.close()
+
+    def test_torn_tail(self):
+        """ A damaged record at the end of the log is dropped. """
+        with WriteAheadLog(self.log_path) as wal:
+            wal.log_insert(b'abc', b'def')
+            wal.log_insert(b'ghi', b'jkl')
+        size = os.path.getsize(self.log_path)
+        with open(self.log_path, 'r+b') as file:
+            file.truncate(size - 3)
+        self.assertEqual(list(read_log(self.log_path)), [(b'abc', b'def')])
+
+        # reopening truncates the tail, so new records can be read back
+        with WriteAheadLog(self.log_path) as wal:
+            wal.log_insert(b'mno', b'pqr')
+        self.assertEqual(list(read_log(self.log_path)),
+                         [(b'abc', b'def'), (b'mno', b'pqr')])
+
+    def test_recover(self):
+        """ A map is rebuilt from its snapshot and log after a crash. """
+        wal = WriteAheadLog(self.log_path, group_size=16)
+        root = JournaledRoot(4, 4, wal, self.snap_path)
+        expected = {}
+        for _ in range(300):
+            key = self.some_key()
+            root.insert_leaf(Leaf(key, key))
+            expected[key] = key
+        root.checkpoint()
+        self.assertEqual(dict(read_snapshot(self.snap_path)), expected)
+        self.assertEqual(list(read_log(self.log_path)), [])
+
+        # changes after the checkpoint go only to the log
+        doomed = list(expected)[:100]
+        for key in doomed:
+            root.delete_leaf(key)
+            del expected[key]
+        for _ in range(200):
+            key = self.some_key()
+            root.insert_leaf(Leaf(key, b'new'))
+            expected[key] = b'new'
+        root.apply_batch([(doomed[0], b'back'), (doomed[1], b'gone'),
+                          (doomed[1], None)])
+        expected[doomed[0]] = b'back'
+        root.update(doomed[0], lambda value: value + b'!')
+        expected[doomed[0]] = b'back!'
+        # an update inserting an absent key is logged once
+        records = root.wal.records + root.wal.pending
+        root.update(b'fresh', lambda value: value + b'!', b'new')
+        self.assertEqual(root.wal.records + root.wal.pending, records + 1)
+        expected[b'fresh'] = b'new!'
+        slot = uhash(doomed[0]) & 15
+        for key in list(expected):
+            if uhash(key) & 15 == slot:
+                del expected[key]
+        root.drop((slot,))
+        root.commit()
+        # simulate a crash: the log and snapshot are simply left behind
+
+        recovered = recover(self.snap_path, self.log_path, 4, 4)
+        self.assertEqual(dict(recovered.items()), expected)
+        self.assertEqual(recovered.leaf_count, len(expected))
+        for key, value in expected.items():
+            self.assertEqual(recovered.find_leaf(key), value)
+
+        # and the recovered map keeps journaling
+        recovered.insert_leaf(Leaf(b'last', b'one'))
+        recovered.close()
+        again = recover(self.snap_path, self.log_path, 4, 4)
+        self.assertEqual(again.find_leaf(b'last'), b'one')
+        again.close()
+
+
+if __name__ == '__main__':
+    unittest.main()